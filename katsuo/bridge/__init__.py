@@ -1 +0,0 @@
-from . import _monkeypatch
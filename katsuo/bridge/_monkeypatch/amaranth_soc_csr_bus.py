@@ -114,8 +114,69 @@ def element_annotations(self, element, /):
     :exc:`ValueError`
         If ``element.signature`` is not equal to ``self``.
     """
+    if isinstance(element, wiring.FlippedInterface):
+        element = wiring.flipped(element)
     if not isinstance(element, Element):
         raise TypeError(f"Element must be a csr.Element object, not {element!r}")
     if element.signature != self:
         raise ValueError(f"Element signature is not equal to this signature")
-    return (ElementAnnotation(element.signature))
+    return (ElementAnnotation(element.signature),)
+
+Element.Signature.annotations = element_annotations
+
+class ElementAnnotation(meta.Annotation):
+    schema = {
+        "$schema": "https://json-schema.org/draft/2020-12/schema",
+        "$id": "https://amaranth-lang.org/schema/amaranth-soc/0.1/csr/element.json",
+        "type": "object",
+        "properties": {
+            "width": {
+                "type": "integer",
+                "minimum": 0,
+            },
+            "access": {
+                "enum": ["r", "w", "rw"],
+            },
+        },
+        "additionalProperties": False,
+        "required": [
+            "width",
+            "access",
+        ],
+    }
+
+    """CSR element signature annotation.
+
+    Parameters
+    ----------
+    origin : :class:`Element.Signature`
+        The signature described by this annotation instance.
+
+    Raises
+    ------
+    :exc:`TypeError`
+        If ``origin`` is not an :class:`Element.Signature`.
+    """
+    def __init__(self, origin):
+        if not isinstance(origin, Element.Signature):
+            raise TypeError(f"Origin must be a csr.Element.Signature object, not {origin!r}")
+        self._origin = origin
+
+    @property
+    def origin(self):
+        return self._origin
+
+    def as_json(self):
+        """Translate to JSON.
+
+        Returns
+        -------
+        :class:`dict`
+            A JSON representation of :attr:`~ElementAnnotation.origin`, describing its width and access mode.
+        """
+        instance = {
+            "width": self.origin.width,
+            "access": self.origin.access.value,
+        }
+        self.validate(instance)
+        return instance
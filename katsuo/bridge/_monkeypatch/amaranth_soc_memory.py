@@ -24,6 +24,13 @@ def add_annotation(self, annotation):
 
 MemoryMap.add_annotation = add_annotation
 
+def _resource_annotations(resource):
+    yield from resource.signature.annotations(resource)
+    # CSR registers describe their width and access mode through their element.
+    element = getattr(resource, 'element', None)
+    if element is not None:
+        yield from element.signature.annotations(element)
+
 class MemoryMapAnnotation(meta.Annotation):
     schema = {
         "$schema": "https://json-schema.org/draft/2020-12/schema",
@@ -188,7 +195,7 @@ class MemoryMapAnnotation(meta.Annotation):
                     "end": end,
                     "annotations": {
                         annotation.schema["$id"]: annotation.as_json()
-                        for annotation in resource.signature.annotations(resource)
+                        for annotation in _resource_annotations(resource)
                     },
                 } for resource, name, (start, end) in self.origin.resources()
             ],
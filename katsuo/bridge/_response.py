@@ -0,0 +1,71 @@
+from amaranth import *
+from amaranth.lib import wiring
+from amaranth.lib.fifo import SyncFIFO
+
+from . import _stream
+
+class ResponseQueue(wiring.Component):
+    """Queue of bridge responses, sent one stream beat per cycle.
+
+    Entries are a bus word and the index of its last byte, so that a whole bus word can be pushed per cycle. When the
+    queue is empty, the entry being pushed falls through to the output in the same cycle. Beats don't span entries,
+    so an entry longer than a beat is sent over several, and a shorter one in a partial beat.
+    """
+
+    def __init__(self, word_bytes, *, stream_width = 8, depth = 4):
+        self._word_bytes = word_bytes
+        self._beat_bytes = stream_width // 8
+        self.depth = depth
+
+        super().__init__({
+            'w_en': wiring.In(1),
+            'w_data': wiring.In(8 * word_bytes),
+            'w_last': wiring.In(range(word_bytes)),
+            'w_rdy': wiring.Out(1),
+            'level': wiring.Out(range(depth + 1)),
+            'output': wiring.Out(_stream.signature(stream_width)),
+        })
+
+    def elaborate(self, platform):
+        m = Module()
+
+        m.submodules.fifo = fifo = SyncFIFO(width = len(self.w_data) + len(self.w_last), depth = self.depth)
+
+        m.d.comb += [
+            fifo.w_data.eq(Cat(self.w_data, self.w_last)),
+            fifo.w_en.eq(self.w_en),
+            self.w_rdy.eq(fifo.w_rdy),
+            self.level.eq(fifo.level),
+        ]
+
+        head = Signal(len(fifo.r_data))
+        m.d.comb += head.eq(Mux(fifo.r_rdy, fifo.r_data, fifo.w_data))
+
+        out_byte = Signal(range(self._word_bytes))
+        m.d.comb += self.output.valid.eq(fifo.r_rdy | self.w_en)
+
+        if self._beat_bytes == 1:
+            m.d.comb += self.output.payload.eq(head.word_select(out_byte, 8) if self._word_bytes > 1 else head[:8])
+            last_beat = out_byte == head[len(self.w_data):]
+        else:
+            # Bytes left in the entry, including the one at `out_byte`.
+            remaining = Signal(range(self._word_bytes + 1))
+            m.d.comb += [
+                remaining.eq(head[len(self.w_data):] - out_byte + 1),
+                self.output.payload.data.eq(head[:len(self.w_data)] >> (out_byte * 8)),
+                self.output.payload.count.eq(Mux(remaining > self._beat_bytes, self._beat_bytes, remaining)),
+            ]
+            last_beat = remaining <= self._beat_bytes
+
+        with m.If(self.output.valid & self.output.ready):
+            with m.If(last_beat):
+                m.d.sync += out_byte.eq(0)
+                with m.If(fifo.r_rdy):
+                    m.d.comb += fifo.r_en.eq(1)
+                with m.Else():
+                    # Sent already, so it's not written to the FIFO.
+                    m.d.comb += fifo.w_en.eq(0)
+            with m.Else():
+                m.d.sync += out_byte.eq(out_byte + self._beat_bytes)
+
+        return m
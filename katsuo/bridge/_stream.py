@@ -0,0 +1,123 @@
+from amaranth import *
+from amaranth.lib import wiring, stream, data
+from amaranth.utils import exact_log2
+
+def signature(width):
+    """Signature of the bridge streams, carrying ``width // 8`` bytes per beat.
+
+    Byte streams have a plain payload. Wider beats carry `count` bytes from the low end of `data`, so a beat can be
+    partially filled.
+    """
+    assert width in (8, 16, 32, 64), f'Unsupported stream width: {width}'
+    if width == 8:
+        return stream.Signature(8)
+    return stream.Signature(data.StructLayout({
+        'data': width,
+        'count': range(width // 8 + 1),
+    }))
+
+class RequestWindow(wiring.Component):
+    """Bytes of the request stream, presented a beat at a time.
+
+    `data` holds the next bytes of the request, of which `level` are valid, and the bridge takes `take` of them per
+    cycle. Taking a byte while none are available takes nothing. A byte stream is passed straight through.
+    """
+
+    def __init__(self, width):
+        self._beat_bytes = width // 8
+
+        super().__init__({
+            'input': wiring.In(signature(width)),
+            'data': wiring.Out(width),
+            'level': wiring.Out(range(2 * self._beat_bytes + 1)),
+            'take': wiring.In(range(self._beat_bytes + 1)),
+        })
+
+    def elaborate(self, platform):
+        m = Module()
+
+        n = self._beat_bytes
+
+        if n == 1:
+            m.d.comb += [
+                self.data.eq(self.input.payload),
+                self.level.eq(self.input.valid),
+                self.input.ready.eq(self.take),
+            ]
+            return m
+
+        # Bytes received but not yet taken, oldest first.
+        buf = Signal(16 * n)
+        level = Signal(range(2 * n + 1))
+
+        taken = Signal(range(n + 1))
+        m.d.comb += taken.eq(Mux(level == 0, 0, self.take))
+
+        remaining = Signal(range(2 * n + 1))
+        shifted = Signal(16 * n)
+        m.d.comb += [
+            remaining.eq(level - taken),
+            shifted.eq(buf >> (taken * 8)),
+        ]
+
+        # There's room for another beat as long as no more than a beat is left after taking.
+        m.d.comb += [
+            self.input.ready.eq(remaining <= n),
+            self.data.eq(buf),
+            self.level.eq(level),
+        ]
+
+        with m.If(self.input.valid & self.input.ready):
+            appended = Signal(16 * n)
+            m.d.comb += appended.eq(self.input.payload.data << (remaining * 8))
+            m.d.sync += [
+                buf.eq(Cat(Mux(i < remaining, shifted.word_select(i, 8), appended.word_select(i, 8)) for i in range(2 * n))),
+                level.eq(remaining + self.input.payload.count),
+            ]
+        with m.Else():
+            m.d.sync += [
+                buf.eq(shifted),
+                level.eq(remaining),
+            ]
+
+        return m
+
+def take_bytes(m, window, buf, byte, last_byte, *, can_finish = 1):
+    """Take request bytes from `window` into `buf`, from index `byte` up to `last_byte`.
+
+    As many bytes are taken at once as are available, up to the next beat boundary within `buf`, so that aligned
+    beats are taken whole. The last byte is only taken when `can_finish`. Returns the number of bytes taken, `buf`
+    with them filled in, and whether that completes it.
+    """
+    beat_bytes = len(window.data) // 8
+    word_bytes = len(buf) // 8
+    step = min(beat_bytes, word_bytes)
+
+    # Bytes that can be taken without crossing a beat boundary or finishing early.
+    left = Signal(range(word_bytes + 1))
+    room = Signal(range(step + 1))
+    limit = Signal(range(step + 1))
+    m.d.comb += [
+        left.eq(last_byte + 1 - byte - Mux(can_finish, 0, 1)),
+        room.eq(step - byte[:exact_log2(step)] if step > 1 else 1),
+        limit.eq(Mux(left < room, left, room)),
+    ]
+
+    take = Signal(range(step + 1))
+    if beat_bytes > 1:
+        m.d.comb += take.eq(Mux(window.level < limit, window.level, limit))
+    else:
+        m.d.comb += take.eq(limit)
+    m.d.comb += window.take.eq(take)
+
+    taken = Signal(range(step + 1))
+    m.d.comb += taken.eq(Mux(window.level != 0, take, 0))
+
+    incoming = Signal.like(buf)
+    word = Signal.like(buf)
+    m.d.comb += [
+        incoming.eq(window.data << (byte * 8)),
+        word.eq(Cat(Mux((i >= byte) & (i < byte + taken), incoming.word_select(i, 8), buf.word_select(i, 8)) for i in range(word_bytes))),
+    ]
+
+    return taken, word, (taken != 0) & (byte + taken == last_byte + 1)
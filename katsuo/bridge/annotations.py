@@ -0,0 +1,11 @@
+"""Memory map and CSR element annotations read by :mod:`katsuo.bridge.client`.
+
+Importing this module adds the annotations proposed in amaranth-soc#58 to ``amaranth_soc`` memory maps and CSR
+interfaces. :mod:`katsuo.bridge.csr` and :mod:`katsuo.bridge.wishbone` import it, so a design built around either bridge
+has them; a design that produces metadata without importing either must import this module first. It is not imported
+with the package, to keep Amaranth out of the client and CLI import path.
+
+The patches are applied to the classes, so memory maps built before the import are annotated as well.
+"""
+
+from . import _monkeypatch
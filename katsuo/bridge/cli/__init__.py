@@ -1,8 +1,10 @@
 import click
 import functools
 import asyncio
+import time
 
 from . import options
+from ..client.server import Server
 
 def async_command(func):
     @functools.wraps(func)
@@ -18,9 +20,47 @@ def main():
 
 from . import csr
 
+@main.command()
+@options.sync_bus_client
+def capabilities(bus_client):
+    capabilities = bus_client.get_capabilities()
+    print(capabilities)
+
+@main.command()
+@options.transport
+@click.argument('url', type = str, required = True)
+@async_command
+async def serve(transport, url):
+    """Hold the transport open and share it with clients connecting to URL.
+
+    URL is tcp://HOST:PORT or unix:///PATH, and clients use it as their transport.
+    """
+
+    print(f'Serving on {url}')
+    await Server(transport).serve(url)
+
 @main.command()
 @options.bus_client
+@click.argument('address', type = str, required = True)
+@click.option('-n', '--length', type = int, default = 65536, help = 'Number of bytes to read.')
 @async_command
-async def capabilities(bus_client):
+async def throughput(bus_client, address, length):
+    """Measure read throughput with a nonincrementing burst from ADDRESS."""
+
+    # Use the narrowest supported access.
     capabilities = await bus_client.get_capabilities()
-    print(capabilities)
+    size = next(size for size in range(4) if capabilities.access_size(size))
+    read = getattr(bus_client, f'read_{8 << size}b')
+    length = length >> size << size
+
+    start = time.perf_counter()
+    await read(int(address, 0), length >> size, increment = False)
+    elapsed = time.perf_counter() - start
+
+    print(f'{length} bytes in {elapsed * 1e3:.1f} ms: {length / elapsed:.0f} bytes/s')
+
+    transport = bus_client.transport
+    if hasattr(transport, 'shift_time'):
+        print(f'{transport.shifts} shifts, {transport.shift_bytes} bytes at {transport.shift_bytes / transport.shift_time:.0f} bytes/s on the wire')
+    if hasattr(transport, 'cycles'):
+        print(f'{transport.cycles[-1]} cycles for {len(transport.command_cycles[-1])} commands: {length / transport.cycles[-1]:.2f} bytes/cycle')
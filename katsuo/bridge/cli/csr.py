@@ -1,8 +1,11 @@
-from . import main, options, async_command
+from . import main, options
 
 from ..client.csr import Register
 
 import click
+import csv
+import json
+import time
 
 def print_recursive(element, level = 0):
     print(f'{' ' * level}{element.path[-1] if element.path else '*'}: ', end = '')
@@ -26,33 +29,114 @@ def list(memory_map):
     print_recursive(memory_map)
 
 @csr.command()
-@options.csr_bridge
+@options.sync_csr_bridge
 @click.argument('register', type = str, required = True)
-@async_command
-async def read(csr_bridge, register):
+def read(csr_bridge, register):
     # Look up the register.
-    node = csr_bridge
-    for name in register.split('.'):
-        node = node[name]
+    node = csr_bridge[tuple(register.split('.'))]
     
     if not isinstance(node, Register):
         raise click.UsageError(f'Invalid register: {register}')
     
-    value = await node.read()
+    value = node.read()
     print(f'{register}: {value:#x}')
 
 @csr.command()
-@options.csr_bridge
+@options.sync_csr_bridge
 @click.argument('register', type = str, required = True)
 @click.argument('value', type = int, required = True)
-@async_command
-async def write(csr_bridge, register, value):
+def write(csr_bridge, register, value):
     # Look up the register.
-    node = csr_bridge
-    for name in register.split('.'):
-        node = node[name]
+    node = csr_bridge[tuple(register.split('.'))]
     
     if not isinstance(node, Register):
         raise click.UsageError(f'Invalid register: {register}')
     
-    await node.write(value)
+    node.write(value)
+
+def lookup_registers(csr_bridge, prefixes):
+    """Registers under each of `prefixes`, or all of them, in address order."""
+    if not prefixes:
+        return [*csr_bridge.registers()]
+
+    registers = {}
+    for prefix in prefixes:
+        node = csr_bridge[tuple(prefix.split('.'))]
+        if node is None:
+            raise click.UsageError(f'Invalid register or prefix: {prefix}')
+        for register in [node] if isinstance(node, Register) else node.registers():
+            registers.setdefault(register.offset, register)
+    return [registers[offset] for offset in sorted(registers)]
+
+def print_stats(bus_client, count, start, round_trips):
+    elapsed = time.perf_counter() - start
+    click.echo(f'{count} registers in {elapsed * 1e3:.1f} ms, {bus_client.round_trips - round_trips} round trips', err = True)
+
+@csr.command()
+@options.sync_bus_client
+@options.sync_csr_bridge
+@click.argument('prefixes', metavar = '[PREFIX]...', nargs = -1)
+@click.option('-f', '--format', type = click.Choice(['json', 'csv']), default = 'json', help = 'Output format.')
+@click.option('-o', '--output', type = click.File('w'), default = '-', help = 'Output file.')
+def dump(bus_client, csr_bridge, prefixes, format, output):
+    """Read all registers, or the ones under each PREFIX, in a single pass.
+
+    Write-only registers are left out, as they can't be read back.
+    """
+
+    registers = [register for register in lookup_registers(csr_bridge, prefixes) if register.access != 'w']
+    bus_client.get_capabilities()
+
+    start, round_trips = time.perf_counter(), bus_client.round_trips
+    values = csr_bridge.read_many(registers)
+    print_stats(bus_client, len(registers), start, round_trips)
+
+    rows = [
+        {'path': '.'.join(register.path), 'offset': register.offset, 'width': register.width, 'value': value}
+        for register, value in zip(registers, values)
+    ]
+
+    match format:
+        case 'json':
+            json.dump(rows, output, indent = 2)
+            output.write('\n')
+        case 'csv':
+            writer = csv.DictWriter(output, fieldnames = ['path', 'offset', 'width', 'value'])
+            writer.writeheader()
+            for row in rows:
+                writer.writerow({**row, 'offset': f'{row["offset"]:#x}', 'value': f'{row["value"]:#x}'})
+
+@csr.command()
+@options.sync_bus_client
+@options.sync_csr_bridge
+@click.argument('file', type = click.File('r'), required = True)
+def load(bus_client, csr_bridge, file):
+    """Write back the registers in FILE, as written by dump.
+
+    Registers are written in address order, with adjacent registers in a single burst. Read-only registers are
+    skipped.
+    """
+
+    text = file.read()
+    if text.lstrip().startswith('['):
+        rows = json.loads(text)
+    else:
+        rows = [*csv.DictReader(text.splitlines())]
+
+    values = {}
+    for row in rows:
+        register = csr_bridge[tuple(row['path'].split('.'))]
+        if not isinstance(register, Register):
+            raise click.UsageError(f'Invalid register: {row["path"]}')
+        if register.access == 'r':
+            continue
+        value = row['value'] if isinstance(row['value'], int) else int(row['value'], 0)
+        if not 0 <= value < 1 << register.width:
+            raise click.UsageError(f'Value out of range for {row["path"]}: {value:#x}')
+        values[register.offset] = (register, value)
+
+    bus_client.get_capabilities()
+
+    start, round_trips = time.perf_counter(), bus_client.round_trips
+    csr_bridge.write_many(values.values())
+    print_stats(bus_client, len(values), start, round_trips)
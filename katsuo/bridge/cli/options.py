@@ -1,10 +1,10 @@
 import click
 import functools
 import pathlib
-import json
 
 from ..client.transport import open_url
 from ..client import bridge, csr
+from ..client.metadata import load as load_metadata
 
 def add_common(func):
     @click.option('-t', '--transport', type = str)
@@ -18,28 +18,38 @@ def add_common(func):
                 if transport is None:
                     raise click.UsageError('No transport provided.')
 
-                return open_url(transport)
+                # Closed along with the context, which stops a simulation or hands the JTAG TAP back.
+                res = open_url(transport)
+                if hasattr(res, '__exit__'):
+                    ctx.with_resource(res)
+                return res
 
             @functools.cached_property
             def bus_client(self):
                 return bridge.Client(self.transport)
 
             @functools.cached_property
-            def annotations(self):
+            def sync_bus_client(self):
+                return ctx.with_resource(bridge.SyncClient(self.transport))
+
+            @functools.cached_property
+            def index(self):
                 if metadata is None:
                     raise click.UsageError('No metadata file provided.')
 
-                with metadata.open('r') as f:
-                    data = json.load(f)
-                return data['interface']['members']['bus']['annotations']
+                return load_metadata(metadata)
 
             @functools.cached_property
             def memory_map(self):
-                return csr.MemoryMap(self.annotations)
+                return csr.MemoryMap.from_index(self.index)
 
             @functools.cached_property
             def csr_bridge(self):
-                return csr.Client(self.annotations, bus_client = self.bus_client)
+                return csr.Client.from_index(self.index, bus_client = self.bus_client)
+
+            @functools.cached_property
+            def sync_csr_bridge(self):
+                return csr.SyncClient.from_index(self.index, bus_client = self.sync_bus_client)
 
         ctx.obj = Common()
 
@@ -47,6 +57,14 @@ def add_common(func):
 
     return wrapper
 
+def transport(func):
+    @click.pass_context
+    @functools.wraps(func)
+    def wrapper(ctx, **kwargs):
+        return ctx.invoke(func, transport = ctx.obj.transport, **kwargs)
+
+    return wrapper
+
 def bus_client(func):
     @click.pass_context
     @functools.wraps(func)
@@ -70,3 +88,19 @@ def csr_bridge(func):
         return ctx.invoke(func, csr_bridge = ctx.obj.csr_bridge, **kwargs)
 
     return wrapper
+
+def sync_bus_client(func):
+    @click.pass_context
+    @functools.wraps(func)
+    def wrapper(ctx, **kwargs):
+        return ctx.invoke(func, bus_client = ctx.obj.sync_bus_client, **kwargs)
+
+    return wrapper
+
+def sync_csr_bridge(func):
+    @click.pass_context
+    @functools.wraps(func)
+    def wrapper(ctx, **kwargs):
+        return ctx.invoke(func, csr_bridge = ctx.obj.sync_csr_bridge, **kwargs)
+
+    return wrapper
@@ -1,6 +1,11 @@
+import asyncio
+import contextlib
+import copy
+import itertools
+import threading
 from dataclasses import dataclass
 
-__all__ = ['Client']
+__all__ = ['Client', 'SyncClient']
 
 @dataclass
 class Capabilities:
@@ -14,52 +19,45 @@ class Capabilities:
     burst_width: int = 0
     addr_width: int = 0
     data_width: int = 0
+    poll: bool = False
+    rmw: bool = False
+    poll_timeout_width: int = 0
 
-class Client:
-    def __init__(self, transport):
-        self.transport = transport
-        self.capabilities = None
+    def access_size(self, size: int) -> bool:
+        """Whether accesses of ``8 << size`` bits are supported."""
+        return (self.access_8b, self.access_16b, self.access_32b, self.access_64b)[size]
 
-    async def read_8b(self, addr: int, length: int = 1):
-        if self.capabilities is None:
-            await self.get_capabilities()
+    def access_words(self, size: int) -> int:
+        """Number of bus addresses spanned by an access of ``8 << size`` bits."""
+        word_bytes = (self.data_width + 7) // 8
+        return max((1 << size) // word_bytes, 1)
 
-        assert self.capabilities.access_8b
-        assert length == 1 # TODO: Relax this
+    def encode(self) -> bytes:
+        """Capability data as sent by the bridge."""
+        flags = [self.access_8b, self.access_16b, self.access_32b, self.access_64b, self.burst_nonincr, self.burst_incr, self.no_addr]
+        data = [
+            sum(flag << i for i, flag in enumerate(flags)),
+            self.burst_width,
+            self.addr_width,
+            self.data_width,
+        ]
 
-        addr_bytes = (self.capabilities.addr_width + 7) // 8
+        # Extended capabilities are only sent when there are any.
+        extended_flags = [self.poll, self.rmw]
+        if any(extended_flags):
+            data += [
+                sum(flag << i for i, flag in enumerate(extended_flags)),
+                self.poll_timeout_width,
+            ]
 
-        await self.transport.send(bytes([0x40]) + addr.to_bytes(addr_bytes, 'little'))
-        assert await self.transport.recv(1) == bytes([0x01])
-        return list(await self.transport.recv(length))
+        return bytes([0x80 | b for b in data[:-1]] + data[-1:])
 
-    async def write_8b(self, addr: int, data: bytes | list, *, increment = True):
-        if self.capabilities is None:
-            await self.get_capabilities()
-
-        assert self.capabilities.access_8b
-
-        addr_bytes = (self.capabilities.addr_width + 7) // 8
-
-        for b in data:
-            await self.transport.send(bytes([0x80]) + addr.to_bytes(addr_bytes, 'little') + bytes([b]))
-            assert await self.transport.recv(1) == bytes([0x01])
-            if increment:
-                addr += 1
+    @classmethod
+    def decode(cls, data: bytes):
+        """Parse capability data sent by the bridge."""
+        capabilities = cls()
 
-    async def get_capabilities(self):
-        await self.transport.send(bytes([0xc0]))
-        assert await self.transport.recv(1) == bytes([0x01])
-        buf = bytearray()
-        while True:
-            byte = await self.transport.recv(1)
-            buf.extend(byte)
-            if not byte[0] & 0x80:
-                break
-
-        capabilities = Capabilities()
-
-        for i, b in enumerate(buf):
+        for i, b in enumerate(data):
             match i:
                 case 0:
                     capabilities.access_8b = bool(b & 0x01)
@@ -75,6 +73,756 @@ class Client:
                     capabilities.addr_width = b & 0x7f
                 case 3:
                     capabilities.data_width = b & 0x7f
+                case 4:
+                    capabilities.poll = bool(b & 0x01)
+                    capabilities.rmw = bool(b & 0x02)
+                case 5:
+                    capabilities.poll_timeout_width = b & 0x7f
 
-        self.capabilities = capabilities
         return capabilities
+
+# Read-modify-write operations (OO field).
+_RMW_WRITE = 0
+_RMW_SET = 1
+_RMW_CLEAR = 2
+_RMW_TOGGLE = 3
+
+def _modify(op: int, value: int, mask: int, data: int = 0):
+    """Value written back by a read-modify-write of `value`."""
+    if op == _RMW_WRITE:
+        return (value & ~mask) | (data & mask)
+    if op == _RMW_SET:
+        return value | mask
+    if op == _RMW_CLEAR:
+        return value & ~mask
+    return value ^ mask
+
+def _decode(size: int, data: bytes):
+    if size == 0:
+        return list(data)
+    return [int.from_bytes(data[i:i + (1 << size)], 'little') for i in range(0, len(data), 1 << size)]
+
+class Future:
+    """Result of a command queued in a :class:`Batch`, available once the batch is flushed."""
+
+    def __init__(self):
+        self._done = False
+        self._result = None
+        self._exception = None
+
+    def done(self):
+        return self._done
+
+    def result(self):
+        assert self._done, 'Batch not flushed yet'
+        if self._exception is not None:
+            raise self._exception
+        return self._result
+
+    def set_result(self, result):
+        self._result = result
+        self._done = True
+
+    def set_exception(self, exception):
+        self._exception = exception
+        self._done = True
+
+    def _resolve(self, func, *args):
+        """Set the result to ``func(*args)``, or the exception it raises, which is raised again."""
+        try:
+            result = func(*args)
+        except Exception as exc:
+            self.set_exception(exc)
+            raise
+        self.set_result(result)
+
+    def __await__(self):
+        return self.result()
+        yield
+
+class Batch:
+    """Queue of commands sent to the bridge together.
+
+    Commands are queued as they are called and sent when the batch is flushed, possibly in the same transport round
+    trip as the batches of concurrent callers, after which the responses are parsed in order and the returned futures
+    are resolved.
+    """
+
+    def __init__(self, client):
+        self._client = client
+
+        # Functions encoding the queued commands once the round trip they're sent in is assembled.
+        self._ops = []
+
+        # Key and future of the last read queued, used to coalesce batches of a single read.
+        self._last_read = None
+
+    async def __aenter__(self):
+        if self._client.capabilities is None:
+            await self._client.get_capabilities()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            await self.flush()
+
+    def _commands(self, is_read: bool, size: int, addr: int, length: int, increment: bool, payload: bytes = b''):
+        capabilities = self._client.capabilities
+        assert capabilities.access_size(size)
+
+        future = Future()
+        if not length:
+            future.set_result([] if is_read else None)
+            return future
+
+        burst = capabilities.burst_incr if increment else capabilities.burst_nonincr
+        max_length = (1 << capabilities.burst_width) - 1 if burst else 1
+        access_words = capabilities.access_words(size) if increment else 0
+
+        parts = []
+        def callback(data, last):
+            parts.append(data)
+            if last:
+                future._resolve(lambda: _decode(size, b''.join(parts)) if is_read else None)
+
+        def encode(command):
+            start_addr = addr
+            for start in range(0, length, max_length):
+                n = min(length - start, max_length)
+                last = start + n == length
+                next_addr = start_addr + n * access_words
+
+                cmd = (0x40 if is_read else 0x80) | size
+                if n > 1:
+                    cmd |= 0x08 if increment else 0x04
+                    request = self._client._encode_addr(cmd, start_addr, next_addr, length = n)
+                else:
+                    request = self._client._encode_addr(cmd, start_addr, start_addr)
+
+                if not is_read:
+                    request += payload[start << size:(start + n) << size]
+
+                command(request, n << size if is_read else 0, lambda data, last = last: callback(data, last))
+
+                start_addr = next_addr
+
+        self._ops.append(encode)
+        self._last_read = ((size, addr, length, increment), future) if is_read else None
+        return future
+
+    def _read(self, size: int, addr: int, length: int = 1, *, increment = True):
+        return self._commands(True, size, addr, length, increment)
+
+    def _write(self, size: int, addr: int, data: bytes | memoryview | list, *, increment = True):
+        if size == 0 and not isinstance(data, list):
+            payload = bytes(data)
+        else:
+            payload = b''.join(value.to_bytes(1 << size, 'little') for value in data)
+        return self._commands(False, size, addr, len(payload) >> size, increment, payload)
+
+    def _poll(self, size: int, addr: int, mask: int, match: int, *, timeout: int | None = None):
+        capabilities = self._client.capabilities
+        assert capabilities.poll and capabilities.access_size(size)
+
+        max_timeout = (1 << capabilities.poll_timeout_width) - 1
+        timeout = max_timeout if timeout is None else min(timeout, max_timeout)
+
+        fields = mask.to_bytes(1 << size, 'little')
+        fields += match.to_bytes(1 << size, 'little')
+        fields += timeout.to_bytes((capabilities.poll_timeout_width + 7) // 8, 'little')
+
+        future = Future()
+        def callback(result):
+            data, timed_out = result
+            future._resolve(lambda: (_decode(size, data)[0], timed_out))
+
+        def encode(command):
+            command(self._client._encode_addr(0x20 | size, addr, addr) + fields, 1 << size, callback, poll = True)
+
+        self._ops.append(encode)
+        self._last_read = None
+        return future
+
+    def _rmw(self, op: int, size: int, addr: int, mask: int, data: int = 0):
+        capabilities = self._client.capabilities
+        assert capabilities.rmw and capabilities.access_size(size)
+
+        fields = mask.to_bytes(1 << size, 'little')
+        if op == _RMW_WRITE:
+            fields += data.to_bytes(1 << size, 'little')
+
+        future = Future()
+        def encode(command):
+            command(self._client._encode_addr(0x60 | op << 2 | size, addr, addr) + fields, 0, lambda data: future.set_result(None))
+
+        self._ops.append(encode)
+        self._last_read = None
+        return future
+
+    def read_8b(self, addr: int, length: int = 1, *, increment = True):
+        return self._read(0, addr, length, increment = increment)
+
+    def read_16b(self, addr: int, length: int = 1, *, increment = True):
+        return self._read(1, addr, length, increment = increment)
+
+    def read_32b(self, addr: int, length: int = 1, *, increment = True):
+        return self._read(2, addr, length, increment = increment)
+
+    def read_64b(self, addr: int, length: int = 1, *, increment = True):
+        return self._read(3, addr, length, increment = increment)
+
+    def write_8b(self, addr: int, data: bytes | memoryview | list, *, increment = True):
+        return self._write(0, addr, data, increment = increment)
+
+    def write_16b(self, addr: int, data: list, *, increment = True):
+        return self._write(1, addr, data, increment = increment)
+
+    def write_32b(self, addr: int, data: list, *, increment = True):
+        return self._write(2, addr, data, increment = increment)
+
+    def write_64b(self, addr: int, data: list, *, increment = True):
+        return self._write(3, addr, data, increment = increment)
+
+    def poll_8b(self, addr: int, mask: int, match: int, *, timeout: int | None = None):
+        return self._poll(0, addr, mask, match, timeout = timeout)
+
+    def poll_16b(self, addr: int, mask: int, match: int, *, timeout: int | None = None):
+        return self._poll(1, addr, mask, match, timeout = timeout)
+
+    def poll_32b(self, addr: int, mask: int, match: int, *, timeout: int | None = None):
+        return self._poll(2, addr, mask, match, timeout = timeout)
+
+    def poll_64b(self, addr: int, mask: int, match: int, *, timeout: int | None = None):
+        return self._poll(3, addr, mask, match, timeout = timeout)
+
+    async def flush(self):
+        ops, self._ops = self._ops, []
+        last_read, self._last_read = self._last_read, None
+
+        if ops:
+            await self._client._link.submit(ops, self._client.priority, read = last_read if len(ops) == 1 else None)
+
+class SyncBatch(Batch):
+    """:class:`Batch` of a :class:`SyncClient`, flushed at the end of a plain ``with`` block."""
+
+    def __enter__(self):
+        if self._client.capabilities is None:
+            self._client.get_capabilities()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.flush()
+
+    def flush(self):
+        ops, self._ops = self._ops, []
+        self._last_read = None
+
+        if ops:
+            self._client._link.submit(ops)
+
+class _Request:
+    __slots__ = ('ops', 'priority', 'seq', 'key', 'future', 'done', 'error')
+
+    def __init__(self, ops, priority = 0, seq = 0, key = None, future = None):
+        self.ops = ops
+        self.priority = priority
+        self.seq = seq
+        self.key = key
+        self.future = future
+        self.done = False
+        self.error = None
+
+class _Link:
+    """Protocol state of a transport, shared by the clients using it.
+
+    Round trips are generators yielding the bytes to send and the number of bytes to receive next, so the same
+    encoding and decoding is used with async and blocking transports.
+    """
+
+    def __init__(self, transport):
+        self.transport = transport
+        self.capabilities = None
+
+        # Address the bridge will continue from, if known.
+        self.addr = None
+
+        # Statistics.
+        self.round_trips = 0
+
+    def encode_addr(self, cmd: int, addr: int, next_addr: int, *, length: int | None = None):
+        addr_bytes = (self.capabilities.addr_width + 7) // 8
+        length_bytes = (self.capabilities.burst_width + 7) // 8
+
+        no_addr = self.capabilities.no_addr and addr == self.addr
+
+        buf = bytes([cmd | 0x10 if no_addr else cmd])
+        if length is not None:
+            buf += length.to_bytes(length_bytes, 'little')
+        if not no_addr:
+            buf += addr.to_bytes(addr_bytes, 'little')
+
+        self.addr = next_addr
+        return buf
+
+    def _query_capabilities(self):
+        self.round_trips += 1
+        yield bytes([0xc0])
+        assert (yield 1) == bytes([0x01])
+        buf = bytearray()
+        while True:
+            byte = yield 1
+            buf.extend(byte)
+            if not byte[0] & 0x80:
+                break
+
+        self.capabilities = Capabilities.decode(buf)
+        return self.capabilities
+
+    def _exchange(self, requests):
+        buf = bytearray()
+        pending = []
+        for request in requests:
+            def command(data, response_length = 0, callback = None, *, poll = False, request = request):
+                buf.extend(data)
+                pending.append((request, response_length, callback, poll))
+            for op in request.ops:
+                op(command)
+
+        try:
+            if buf:
+                self.round_trips += 1
+                yield bytes(buf)
+
+            error = None
+            for request, response_length, callback, poll in pending:
+                # No-op statuses are ignored.
+                while (status := (yield 1)) == bytes([0x00]):
+                    pass
+
+                # A timed out poll still returns the last value read; an error status has no data.
+                ok = status == bytes([0x01]) or poll and status == bytes([0x02])
+                data = (yield response_length) if ok and response_length else b''
+
+                if error is None and not ok:
+                    # The bridge state is unknown after a failed command, so everything after it fails too.
+                    error = AssertionError(f'Command error: {status.hex()}')
+                    self.addr = None
+                if error is not None:
+                    request.error = error
+                elif callback is not None:
+                    try:
+                        callback((data, status == bytes([0x02])) if poll else data)
+                    except Exception as exc:
+                        # Only this request fails; the rest of the responses are still read, to stay in sync.
+                        request.error = request.error or exc
+        except BaseException as exc:
+            self.addr = None
+            for request in requests:
+                request.error = exc
+            raise
+        finally:
+            for request in requests:
+                request.done = True
+
+class _Multiplexer(_Link):
+    """Link shared by a client and its views, sending the batches of all callers in turn.
+
+    Queued batches are sent together in the next round trip, highest priority first. Only one round trip is in flight
+    at a time, so the address the bridge continues from is always known. The event loop is only involved when callers
+    actually have to wait for each other, which keeps a single caller in a simulation testbench working.
+
+    A round trip whose caller is cancelled is finished by the next caller to get the transport, before anything else is
+    sent, so the other batches in it still get their responses. This relies on a cancelled `send` or `recv` of the
+    transport having no effect.
+    """
+
+    def __init__(self, transport, *, max_batches, coalesce):
+        super().__init__(transport)
+        self.max_batches = max_batches
+        self.coalesce = coalesce
+
+        self._busy = False
+        self._idle = asyncio.Event()
+        self._queue = []
+        self._seq = itertools.count()
+
+        # Batches of a single read that are queued or in flight, by what they read.
+        self._reads = {}
+
+        # Round trip left unfinished by a cancelled caller, and the transport operation it was waiting on.
+        self._interrupted = None
+
+        # Statistics.
+        self.coalesced = 0
+
+    async def drive(self, steps, op = None):
+        """Run the round trip `steps` on the transport, from the operation `op` if it's already started."""
+        try:
+            if op is None:
+                op = next(steps)
+            while True:
+                try:
+                    value = await (self.transport.recv(op) if isinstance(op, int) else self.transport.send(op))
+                except asyncio.CancelledError:
+                    self._interrupted = steps, op
+                    raise
+                except BaseException as exc:
+                    op = steps.throw(exc)
+                else:
+                    op = steps.send(value)
+        except StopIteration as stop:
+            return stop.value
+
+    @contextlib.asynccontextmanager
+    async def exclusive(self):
+        """Hold the transport for a round trip, once an interrupted one is finished."""
+        while self._busy:
+            await self._idle.wait()
+        self._busy = True
+        self._idle.clear()
+        try:
+            if self._interrupted is not None:
+                steps, op = self._interrupted
+                self._interrupted = None
+                await self.drive(steps, op)
+            yield
+        finally:
+            self._busy = False
+            self._idle.set()
+
+    async def submit(self, ops, priority, *, read = None):
+        key, future = read if read is not None else (None, None)
+
+        request = self._reads.get(key) if key is not None and self.coalesce else None
+        if request is not None:
+            # Share the bus access of an identical read, moving it up if we're in more of a hurry.
+            self.coalesced += 1
+            request.priority = max(request.priority, priority)
+            await self._wait(request)
+            future.set_result(list(request.future.result()))
+            return
+
+        request = _Request(ops, priority, next(self._seq), key, future)
+        self._queue.append(request)
+        if key is not None:
+            self._reads[key] = request
+        await self._wait(request)
+
+    async def _wait(self, request):
+        # Whoever gets the transport sends what's queued, until our request has been sent.
+        while not request.done:
+            if self._busy:
+                await self._idle.wait()
+                continue
+            async with self.exclusive():
+                if not request.done:
+                    await self._round_trip()
+
+        if request.error is not None:
+            raise request.error
+
+    async def _round_trip(self):
+        self._queue.sort(key = lambda request: (-request.priority, request.seq))
+        requests, self._queue = self._queue[:self.max_batches], self._queue[self.max_batches:]
+
+        try:
+            await self.drive(self._exchange(requests))
+        finally:
+            for request in requests:
+                if request.key is not None and self._reads.get(request.key) is request:
+                    del self._reads[request.key]
+
+    async def query_capabilities(self):
+        async with self.exclusive():
+            return await self.drive(self._query_capabilities())
+
+class _AsyncTransportAdapter:
+    """Blocking `write` and `read` for a transport that only has async `send` and `recv`, on a private event loop."""
+
+    def __init__(self, transport):
+        self._transport = transport
+        self._loop = asyncio.new_event_loop()
+
+    def _run(self, coro):
+        task = self._loop.create_task(coro)
+        try:
+            return self._loop.run_until_complete(task)
+        finally:
+            # Interrupted, e.g. by KeyboardInterrupt; a `recv` left pending would take bytes meant for the next one.
+            if not task.done():
+                task.cancel()
+                with contextlib.suppress(asyncio.CancelledError):
+                    self._loop.run_until_complete(task)
+
+    def write(self, data: bytes):
+        self._run(self._transport.send(data))
+
+    def read(self, length = 1):
+        return self._run(self._transport.recv(length))
+
+    def close(self):
+        """Cancel what the transport left running on the loop, like queued transfers, and close it."""
+        if self._loop.is_closed():
+            return
+        tasks = asyncio.all_tasks(self._loop)
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            self._loop.run_until_complete(asyncio.wait(tasks))
+        self._loop.run_until_complete(self._loop.shutdown_asyncgens())
+        self._loop.close()
+
+class _SyncLink(_Link):
+    """Link for blocking clients, on the native blocking `write` and `read` of the transport if it has them."""
+
+    def __init__(self, transport):
+        super().__init__(transport)
+        self._io = transport if hasattr(transport, 'write') and hasattr(transport, 'read') else _AsyncTransportAdapter(transport)
+        self._lock = threading.Lock()
+
+        # Round trip left unfinished by a failed or interrupted read, and the read it was waiting on.
+        self._interrupted = None
+
+    def drive(self, steps, op = None):
+        """Run the round trip `steps` on the transport, from the operation `op` if it's already started."""
+        read, write = self._io.read, self._io.write
+        try:
+            if op is None:
+                op = next(steps)
+            while True:
+                if isinstance(op, int):
+                    try:
+                        value = read(op)
+                    except BaseException:
+                        # The responses still on the link are read before the next round trip, to stay in sync.
+                        self._interrupted = steps, op
+                        raise
+                else:
+                    try:
+                        value = write(op)
+                    except BaseException as exc:
+                        op = steps.throw(exc)
+                        continue
+                op = steps.send(value)
+        except StopIteration as stop:
+            return stop.value
+
+    def _resume(self):
+        if self._interrupted is not None:
+            steps, op = self._interrupted
+            self._interrupted = None
+            self.drive(steps, op)
+
+    def submit(self, ops):
+        request = _Request(ops)
+        with self._lock:
+            self._resume()
+            self.drive(self._exchange([request]))
+
+        if request.error is not None:
+            raise request.error
+
+    def query_capabilities(self):
+        with self._lock:
+            self._resume()
+            return self.drive(self._query_capabilities())
+
+    def close(self):
+        if isinstance(self._io, _AsyncTransportAdapter):
+            self._io.close()
+
+class _BaseClient:
+    """Accesses shared by :class:`Client` and :class:`SyncClient`.
+
+    Each access is a generator yielding the batches to flush, run by :meth:`_run` of the client.
+    """
+
+    @property
+    def capabilities(self):
+        return self._link.capabilities
+
+    @capabilities.setter
+    def capabilities(self, capabilities):
+        self._link.capabilities = capabilities
+
+    @property
+    def round_trips(self):
+        """Number of transport round trips made so far."""
+        return self._link.round_trips
+
+    def _encode_addr(self, cmd: int, addr: int, next_addr: int, *, length: int | None = None):
+        return self._link.encode_addr(cmd, addr, next_addr, length = length)
+
+    def _read_steps(self, size: int, addr: int, length: int, increment: bool):
+        batch = self.batch()
+        result = batch._read(size, addr, length, increment = increment)
+        yield batch
+        return result.result()
+
+    def _write_steps(self, size: int, addr: int, data: bytes | memoryview | list, increment: bool):
+        batch = self.batch()
+        batch._write(size, addr, data, increment = increment)
+        yield batch
+
+    def _poll_steps(self, size: int, addr: int, mask: int, match: int, timeout: int | None):
+        if self.capabilities.poll:
+            batch = self.batch()
+            result = batch._poll(size, addr, mask, match, timeout = timeout)
+            yield batch
+            return result.result()
+
+        reads = 0
+        while True:
+            value, = yield from self._read_steps(size, addr, 1, True)
+            if value & mask == match:
+                return value, False
+            if timeout is not None and reads >= timeout:
+                return value, True
+            reads += 1
+
+    def _rmw_steps(self, op: int, size: int, addr: int, mask: int, data: int):
+        if self.capabilities.rmw:
+            batch = self.batch()
+            batch._rmw(op, size, addr, mask, data)
+            yield batch
+            return
+
+        full = (1 << (8 << size)) - 1
+        if op in (_RMW_WRITE, _RMW_SET, _RMW_CLEAR) and mask & full == full:
+            # Nothing to keep from the old value.
+            value = 0
+        else:
+            value, = yield from self._read_steps(size, addr, 1, True)
+        yield from self._write_steps(size, addr, [_modify(op, value, mask, data) & full], True)
+
+    def _read(self, size: int, addr: int, length: int = 1, *, increment = True):
+        return self._run(self._read_steps(size, addr, length, increment))
+
+    def _write(self, size: int, addr: int, data: bytes | memoryview | list, *, increment = True):
+        return self._run(self._write_steps(size, addr, data, increment))
+
+    def _poll(self, size: int, addr: int, mask: int, match: int, *, timeout: int | None = None):
+        """Read until ``value & mask == match``, returning the last value read and whether it timed out.
+
+        `timeout` is in bus clock cycles, defaulting to the longest the bridge supports. Without bridge support, the
+        address is read from the host instead, with `timeout` counting extra reads and defaulting to no limit.
+        """
+        return self._run(self._poll_steps(size, addr, mask, match, timeout))
+
+    def _rmw(self, op: int, size: int, addr: int, mask: int, data: int = 0):
+        """Read-modify-write in the bridge, or with a read and a write from the host without bridge support."""
+        return self._run(self._rmw_steps(op, size, addr, mask, data))
+
+    def read_8b(self, addr: int, length: int = 1, *, increment = True):
+        return self._read(0, addr, length, increment = increment)
+
+    def read_16b(self, addr: int, length: int = 1, *, increment = True):
+        return self._read(1, addr, length, increment = increment)
+
+    def read_32b(self, addr: int, length: int = 1, *, increment = True):
+        return self._read(2, addr, length, increment = increment)
+
+    def read_64b(self, addr: int, length: int = 1, *, increment = True):
+        return self._read(3, addr, length, increment = increment)
+
+    def write_8b(self, addr: int, data: bytes | memoryview | list, *, increment = True):
+        return self._write(0, addr, data, increment = increment)
+
+    def write_16b(self, addr: int, data: list, *, increment = True):
+        return self._write(1, addr, data, increment = increment)
+
+    def write_32b(self, addr: int, data: list, *, increment = True):
+        return self._write(2, addr, data, increment = increment)
+
+    def write_64b(self, addr: int, data: list, *, increment = True):
+        return self._write(3, addr, data, increment = increment)
+
+    def poll_8b(self, addr: int, mask: int, match: int, *, timeout: int | None = None):
+        return self._poll(0, addr, mask, match, timeout = timeout)
+
+    def poll_16b(self, addr: int, mask: int, match: int, *, timeout: int | None = None):
+        return self._poll(1, addr, mask, match, timeout = timeout)
+
+    def poll_32b(self, addr: int, mask: int, match: int, *, timeout: int | None = None):
+        return self._poll(2, addr, mask, match, timeout = timeout)
+
+    def poll_64b(self, addr: int, mask: int, match: int, *, timeout: int | None = None):
+        return self._poll(3, addr, mask, match, timeout = timeout)
+
+class Client(_BaseClient):
+    """Client for the bridge on `transport`.
+
+    The client can be shared by concurrent tasks. Their batches are queued and sent together in the next round trip,
+    up to `max_batches` at a time, highest `priority` first; :meth:`with_priority` gives a caller its own priority.
+    With `coalesce`, identical single reads that are queued or in flight share one bus access.
+    """
+
+    def __init__(self, transport, *, priority = 0, max_batches = 64, coalesce = True):
+        self.transport = transport
+        self.priority = priority
+        self._link = _Multiplexer(transport, max_batches = max_batches, coalesce = coalesce)
+
+    def with_priority(self, priority: int):
+        """View of this client, sharing its transport and queue, whose requests have the given priority."""
+        client = copy.copy(self)
+        client.priority = priority
+        return client
+
+    def batch(self):
+        return Batch(self)
+
+    async def _run(self, steps):
+        if self.capabilities is None:
+            await self.get_capabilities()
+
+        try:
+            batch = next(steps)
+            while True:
+                await batch.flush()
+                batch = steps.send(None)
+        except StopIteration as stop:
+            return stop.value
+
+    async def get_capabilities(self):
+        return await self._link.query_capabilities()
+
+class SyncClient(_BaseClient):
+    """Blocking client for the bridge on `transport`, with the same methods as :class:`Client` returning their results.
+
+    No event loop is involved when the transport has blocking `write` and `read` methods; otherwise the client runs
+    the transport on a private event loop, which :meth:`close` closes. The client can be shared between threads, one
+    round trip at a time.
+    """
+
+    def __init__(self, transport):
+        self.transport = transport
+        self._link = _SyncLink(transport)
+
+    def close(self):
+        """Close the private event loop, if any. The transport itself is left open."""
+        self._link.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def batch(self):
+        return SyncBatch(self)
+
+    def _run(self, steps):
+        if self.capabilities is None:
+            self.get_capabilities()
+
+        try:
+            batch = next(steps)
+            while True:
+                batch.flush()
+                batch = steps.send(None)
+        except StopIteration as stop:
+            return stop.value
+
+    def get_capabilities(self):
+        return self._link.query_capabilities()
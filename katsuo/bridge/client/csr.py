@@ -1,119 +1,598 @@
+import collections
+
+from . import bridge
+
 class Register:
-    def __init__(self, offset, *, client = None, path, size):
+    """Register in a CSR memory map.
+
+    Accesses are run by the client, returning a coroutine, or the result directly for a :class:`SyncClient`.
+    """
+
+    def __init__(self, offset, *, client = None, path, size, data_width = 8, access = None):
         self._offset = offset
         self._client = client
-        self.width = 8 * size
+        self.width = data_width * size
         self.path = path
         self._size = size
+        # Access mode from the CSR element annotation, 'r', 'w' or 'rw', if known.
+        self.access = access
+
+    @property
+    def offset(self):
+        """Address of the register on the CSR bus, in bus words."""
+        return self._offset
     
-    async def read(self):
-        value = 0
-        for i in range(self._size):
-            value |= await self._client.read(self._offset + i) << (8 * i)
-        return value
-    
-    async def write(self, value):
-        for i in range(self._size):
-            await self._client.write(self._offset + i, (value >> (8 * i)) & 0xff)
+    def read(self):
+        return self._client.read_register(self)
+
+    def write(self, value):
+        return self._client.write_register(self, value)
+
+    def modify(self, mask, value):
+        """Write the bits in `mask` from `value`, keeping the others."""
+        return self._client.modify_register(self, bridge._RMW_WRITE, mask, value)
+
+    def set_bits(self, mask):
+        return self._client.modify_register(self, bridge._RMW_SET, mask)
+
+    def clear_bits(self, mask):
+        return self._client.modify_register(self, bridge._RMW_CLEAR, mask)
+
+    def toggle_bits(self, mask):
+        return self._client.modify_register(self, bridge._RMW_TOGGLE, mask)
+
+    def invalidate(self):
+        """Drop the shadow copy of this register, if any."""
+        self._client.invalidate(self)
+
+    def wait_for(self, match, *, mask = None, timeout = None):
+        """Wait until the bits in `mask` read as `match`, returning the register value.
+
+        `timeout` is in bus clock cycles when the bridge polls the register, and in reads otherwise; without one,
+        waits indefinitely.
+        """
+        return self._client.wait_for_register(self, match, mask = mask, timeout = timeout)
+
+class _Node:
+    """Node in the name trie of a memory map."""
+
+    PARTIAL = 0
+    RESOURCE = 1
+    WINDOW = 2
+
+    __slots__ = ('kind', 'children', 'start', 'size', 'data_width', 'access', 'annotations', 'ratio', 'path', 'base', 'first', 'last')
+
+    def __init__(self, kind = PARTIAL, *, start = 0, size = None, data_width = None, access = None, annotations = None, ratio = 1):
+        self.kind = kind
+        self.children = {}
+        # Offset relative to the enclosing window.
+        self.start = start
+        self.size = size
+        self.data_width = data_width
+        self.access = access
+        self.annotations = annotations
+        self.ratio = ratio
+
+        # Filled in when flattening: path and offset relative to the root, and range in the register table.
+        self.path = ()
+        self.base = 0
+        self.first = 0
+        self.last = 0
+
+class _Index:
+    """Name trie and flat register table of a memory map, built once and shared by every view into it."""
+
+    __schema = 'https://amaranth-lang.org/schema/amaranth-soc/0.1/memory/memory-map.json'
+    __element_schema = 'https://amaranth-lang.org/schema/amaranth-soc/0.1/csr/element.json'
+
+    def __init__(self, annotations):
+        self.addr_width = annotations[self.__schema]['addr_width']
+        self.data_width = annotations[self.__schema]['data_width']
+
+        self.root = _Node(_Node.WINDOW, annotations = annotations)
+        self._insert(self.root, annotations, 0)
+
+        # Registers as (path, offset, size, data_width, access) tuples relative to the root, in trie order.
+        self.registers = []
+        self._flatten(self.root, (), 0)
+
+    def _attach(self, node, name, child):
+        for part in name[:-1]:
+            node = node.children.setdefault(part, _Node())
+        node.children.setdefault(name[-1], child)
+
+    def _insert(self, node, annotations, offset):
+        memory_map = annotations[self.__schema]
+
+        for window in memory_map['windows']:
+            name = tuple(window.get('name') or ())
+            if not name:
+                # Anonymous windows share the namespace of the enclosing memory map.
+                self._insert(node, window['annotations'], offset + window['start'])
+                continue
+
+            child = _Node(_Node.WINDOW, start = offset + window['start'], annotations = window['annotations'], ratio = window['ratio'])
+            self._insert(child, window['annotations'], 0)
+            self._attach(node, name, child)
+
+        for resource in memory_map['resources']:
+            child = _Node(
+                _Node.RESOURCE,
+                start = offset + resource['start'],
+                size = resource['end'] - resource['start'],
+                data_width = memory_map['data_width'],
+                access = resource['annotations'].get(self.__element_schema, {}).get('access'),
+            )
+            self._attach(node, tuple(resource['name']), child)
+
+    def _flatten(self, node, path, base):
+        node.path = path
+        node.base = base
+        node.first = len(self.registers)
+        for name, child in node.children.items():
+            if child.kind == _Node.RESOURCE:
+                self.registers.append((path + (name,), base + child.start, child.size, child.data_width, child.access))
+            elif child.kind == _Node.WINDOW:
+                self._flatten(child, path + (name,), base + child.start)
+            else:
+                self._flatten(child, path + (name,), base)
+        node.last = len(self.registers)
+
+def _normalize_name(name):
+    if isinstance(name, int):
+        name = str(name)
+    if not isinstance(name, tuple):
+        name = (name,)
+    return name
 
 class _PartialName:
-    def __init__(self, parent, name, path):
+    def __init__(self, parent, node, path):
         self._parent = parent
-        self._name = name
+        self._node = node
         self.path = path
 
+    def _child(self, name):
+        node = self._node.children.get(name)
+        if node is not None:
+            return self._parent._wrap(node, self.path + (name,))
+
     def __iter__(self):
-        return self._parent._iter_prefix(self._name)
+        for name, node in self._node.children.items():
+            yield self._parent._wrap(node, self.path + (name,))
 
     def __getitem__(self, name):
-        if isinstance(name, int):
-            name = str(name)
-        if not isinstance(name, tuple):
-            name = (name,)
-        
-        return self._parent[*self._name, *name]
+        element = self
+        for part in _normalize_name(name):
+            element = element._child(part)
+            if element is None:
+                return None
+        return element
 
     def __getattr__(self, name):
         return self[name]
 
+    def registers(self):
+        return self._parent._registers(self._node)
+
 class MemoryMap:
     __schema = 'https://amaranth-lang.org/schema/amaranth-soc/0.1/memory/memory-map.json'
 
-    def __init__(self, annotations, *, offset = 0, client = None, path = ()):
-        assert self.__schema in annotations
+    def __init__(self, annotations, *, offset = 0, client = None, path = (), _index = None, _node = None):
+        assert _index is not None or self.__schema in annotations
 
         self.annotations = annotations
         self._offset = offset
         self._client = client
         self.path = path
 
-    def _iter_prefix(self, prefix = ()):
-        emitted = set()
-        for window in self.annotations[self.__schema]['windows']:
-            window_name = tuple(window['name'])
-            if not window_name[:len(prefix)] == prefix:
-                continue
-            name = window_name[len(prefix)]
-            if name not in emitted:
-                emitted.add(name)
-                yield self[name]
-        for resource in self.annotations[self.__schema]['resources']:
-            resource_name = tuple(resource['name'])
-            if not resource_name[:len(prefix)] == prefix:
-                continue
-            name = resource_name[len(prefix)]
-            if name not in emitted:
-                emitted.add(name)
-                yield self[name]
+        if _index is None:
+            _index = _Index(annotations)
+            _node = _index.root
+        self._index = _index
+        self._node = _node
+
+    @classmethod
+    def from_index(cls, index):
+        """Create a memory map from a prebuilt index, e.g. one loaded by :mod:`.metadata`."""
+        return cls(None, _index = index, _node = index.root)
+
+    def _wrap(self, node, path):
+        if node.kind == _Node.RESOURCE:
+            return Register(offset = self._offset + node.start, client = self._client, path = path, size = node.size, data_width = node.data_width, access = node.access)
+        elif node.kind == _Node.WINDOW:
+            assert node.ratio == 1
+            return MemoryMap(node.annotations, offset = self._offset + node.start, client = self._client, path = path, _index = self._index, _node = node)
+        else:
+            return _PartialName(self, node, path)
+
+    def _child(self, name):
+        node = self._node.children.get(name)
+        if node is not None:
+            return self._wrap(node, self.path + (name,))
+
+    def _registers(self, node):
+        # The register table is relative to the root of the index.
+        root_offset = self._offset - self._node.base
+        root_path = self.path[:len(self.path) - len(self._node.path)]
+        for path, offset, size, data_width, access in sorted(self._index.registers[node.first:node.last], key = lambda r: r[1]):
+            yield Register(offset = root_offset + offset, client = self._client, path = root_path + path, size = size, data_width = data_width, access = access)
+
+    def registers(self):
+        """Iterate over all registers in this memory map, in address order."""
+        return self._registers(self._node)
 
     def __iter__(self):
-        return self._iter_prefix()
+        for name, node in self._node.children.items():
+            yield self._wrap(node, self.path + (name,))
 
     def __getitem__(self, name):
-        if isinstance(name, int):
-            name = str(name)
-        if not isinstance(name, tuple):
-            name = (name,)
-        
-        for window in self.annotations[self.__schema]['windows']:
-            window_name = tuple(window['name'])
-            if name == window_name:
-                assert window['ratio'] == 1
-                offset = self._offset + window['start']
-                return MemoryMap(window['annotations'], offset = offset, client = self._client, path = self.path + name)
-            elif name == window_name[:len(name)]:
-                return _PartialName(self, name, path = self.path + name)
-
-        for resource in self.annotations[self.__schema]['resources']:
-            resource_name = tuple(resource['name'])
-            if name == resource_name:
-                offset = self._offset + resource['start']
-                size = resource['end'] - resource['start']
-                return Register(offset = offset, client = self._client, path = self.path + name, size = size)
-            elif name == resource_name[:len(name)]:
-                return _PartialName(self, name, path = self.path + name)
+        element = self
+        for part in _normalize_name(name):
+            element = element._child(part)
+            if element is None:
+                return None
+        return element
 
     def __getattr__(self, name):
         return self[name]
 
 class Client(MemoryMap):
+    """Client for the registers of a CSR memory map, accessed through `bus_client`.
+
+    With `cache`, shadow copies are kept of registers only the host changes, so reading them doesn't go to the
+    hardware. Write-only registers are always host-owned. Read/write registers often have bits the hardware updates,
+    like status or self-clearing bits, so they're only cached under one of the `host_owned` path prefixes. Registers
+    under a `volatile` prefix are never cached.
+    """
+
     __schema = 'https://amaranth-lang.org/schema/amaranth-soc/0.1/csr/bus.json'
 
-    def __init__(self, annotations, *, bus_client):
-        assert self.__schema in annotations
+    def __init__(self, annotations, *, bus_client, cache = False, cache_size = 4096, host_owned = (), volatile = (), _index = None):
+        if _index is None:
+            assert self.__schema in annotations
+
+            self._addr_width = annotations[self.__schema]['addr_width']
+            self._data_width = annotations[self.__schema]['data_width']
+        else:
+            self._addr_width = _index.addr_width
+            self._data_width = _index.data_width
 
-        self._addr_width = annotations[self.__schema]['addr_width']
-        self._data_width = annotations[self.__schema]['data_width']
+        assert self._data_width in (8, 16, 32, 64)
 
-        assert self._data_width == 8
+        # Access size (AA field) of a single bus word.
+        self._word_size = (self._data_width // 8).bit_length() - 1
 
         self._bus_client = bus_client
 
-        super().__init__(annotations, client = self)
+        # Shadow copies of host-owned registers, as offset -> (size, access, value), least recently used first.
+        self._cache = collections.OrderedDict() if cache else None
+        self._cache_size = cache_size
+        self._host_owned = [tuple(_normalize_name(prefix)) for prefix in host_owned]
+        self._volatile = [tuple(_normalize_name(prefix)) for prefix in volatile]
+
+        # Statistics.
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+        super().__init__(annotations, client = self, _index = _index, _node = _index.root if _index is not None else None)
+
+    @classmethod
+    def from_index(cls, index, *, bus_client, **kwargs):
+        """Create a client from a prebuilt index, e.g. one loaded by :mod:`.metadata`."""
+        return cls(None, bus_client = bus_client, _index = index, **kwargs)
+
+    def _cacheable(self, register):
+        """Whether `register` is only changed by the host, so a shadow copy of it stays valid."""
+        under = lambda prefixes: any(register.path[:len(prefix)] == prefix for prefix in prefixes)
+        if self._cache is None or under(self._volatile):
+            return False
+        return register.access == 'w' or (register.access == 'rw' and under(self._host_owned))
+
+    def _check_readable(self, register):
+        # The hardware can't tell what was last written to a write-only register.
+        if register.access == 'w' and self._cacheable(register):
+            raise LookupError(f'No shadow copy of write-only register {".".join(register.path)}')
+
+    def _cache_get(self, register):
+        entry = self._cache.get(register._offset) if self._cacheable(register) else None
+        if entry is None:
+            return None
+        self._cache.move_to_end(register._offset)
+        return entry[2]
+
+    def _cache_put(self, register, value):
+        if not self._cacheable(register):
+            return
+        self._cache[register._offset] = (register._size, register.access, value)
+        self._cache.move_to_end(register._offset)
+        while len(self._cache) > self._cache_size:
+            self._cache.popitem(last = False)
+
+    def _cache_drop(self, addr, size):
+        """Drop the shadow copies overlapping `size` bus words from `addr`."""
+        if not self._cache:
+            return
+        for offset in [offset for offset, (entry_size, _, _) in self._cache.items() if offset < addr + size and addr < offset + entry_size]:
+            del self._cache[offset]
+
+    def _access_size(self, size):
+        """Access size covering `size` bus words in a single access, if supported by the bridge."""
+        access = self._word_size + (size.bit_length() - 1)
+        if size & (size - 1) or access > 3:
+            return None
+
+        if not self._bus_client.capabilities.access_size(access):
+            return None
+
+        return access
+
+    def _queue_read(self, batch, addr, size):
+        """Queue a read of `size` bus words, returning a function that assembles the value once the batch is flushed."""
+        access = self._access_size(size)
+        if access is not None:
+            # Read the whole register in a single access.
+            result = getattr(batch, f'read_{8 << access}b')(addr)
+            return lambda: result.result()[0]
+
+        # Read the register in ascending address order, so the first chunk latches the whole register.
+        result = getattr(batch, f'read_{self._data_width}b')(addr, size)
+        return lambda: sum(word << (self._data_width * i) for i, word in enumerate(result.result()))
+
+    def _queue_write(self, batch, addr, size, value):
+        access = self._access_size(size)
+        if access is not None:
+            # Write the whole register in a single access.
+            return getattr(batch, f'write_{8 << access}b')(addr, [value])
+
+        # Write the register in ascending address order, so the last chunk commits the whole register.
+        mask = (1 << self._data_width) - 1
+        words = [(value >> (self._data_width * i)) & mask for i in range(size)]
+        return getattr(batch, f'write_{self._data_width}b')(addr, words)
     
-    async def read(self, addr):
-        buf = await self._bus_client.read_8b(addr)
-        return buf[0]
+    def _runs(self, registers):
+        """Group `registers` into runs of adjacent registers, in address order."""
+        runs = []
+        for register in sorted(registers, key = lambda register: register._offset):
+            if runs and runs[-1][-1]._offset + runs[-1][-1]._size == register._offset:
+                runs[-1].append(register)
+            else:
+                runs.append([register])
+        return runs
+
+    def _queue_read_run(self, batch, run):
+        """Queue a read of adjacent registers, returning a function per register that assembles its value."""
+        if len(run) == 1:
+            return [self._queue_read(batch, run[0]._offset, run[0]._size)]
+
+        # A single burst reads each register in ascending address order, like a read of the register alone.
+        result = getattr(batch, f'read_{self._data_width}b')(run[0]._offset, sum(register._size for register in run))
+        def value(start, size):
+            return sum(word << (self._data_width * i) for i, word in enumerate(result.result()[start:start + size]))
+
+        values = []
+        start = 0
+        for register in run:
+            values.append(lambda start = start, size = register._size: value(start, size))
+            start += register._size
+        return values
+
+    def _queue_write_run(self, batch, run, values):
+        if len(run) == 1:
+            return self._queue_write(batch, run[0]._offset, run[0]._size, values[0])
+
+        mask = (1 << self._data_width) - 1
+        words = [(value >> (self._data_width * i)) & mask for register, value in zip(run, values) for i in range(register._size)]
+        return getattr(batch, f'write_{self._data_width}b')(run[0]._offset, words)
+
+    def _read_value_steps(self, addr, size):
+        batch = self._bus_client.batch()
+        result = self._queue_read(batch, addr, size)
+        yield batch
+        return result()
+
+    def _write_value_steps(self, addr, size, value):
+        self._cache_drop(addr, size)
+        batch = self._bus_client.batch()
+        self._queue_write(batch, addr, size, value)
+        yield batch
+
+    def _modify_value_steps(self, addr, size, op, mask, data):
+        self._cache_drop(addr, size)
+
+        access = self._access_size(size)
+        if access is not None:
+            # Modify the whole register in a single access.
+            yield from self._bus_client._rmw_steps(op, access, addr, mask, data)
+            return
+
+        value = yield from self._read_value_steps(addr, size)
+        yield from self._write_value_steps(addr, size, bridge._modify(op, value, mask, data) & ((1 << (self._data_width * size)) - 1))
+
+    def _poll_value_steps(self, addr, size, mask, match, timeout):
+        access = self._access_size(size)
+        if access is not None:
+            # Poll the whole register in a single access.
+            return (yield from self._bus_client._poll_steps(access, addr, mask, match, timeout))
+
+        reads = 0
+        while True:
+            value = yield from self._read_value_steps(addr, size)
+            if value & mask == match:
+                return value, False
+            if timeout is not None and reads >= timeout:
+                return value, True
+            reads += 1
+
+    def _read_register_steps(self, register):
+        value = self._cache_get(register)
+        if value is not None:
+            self.cache_hits += 1
+            return value
+
+        self._check_readable(register)
+        if self._cacheable(register):
+            self.cache_misses += 1
+        value = yield from self._read_value_steps(register._offset, register._size)
+        if register.access == 'rw':
+            self._cache_put(register, value)
+        return value
+
+    def _write_register_steps(self, register, value):
+        # Write through, keeping the shadow copy of what was written.
+        yield from self._write_value_steps(register._offset, register._size, value)
+        self._cache_put(register, value)
+
+    def _modify_register_steps(self, register, op, mask, data):
+        value = self._cache_get(register)
+        yield from self._modify_value_steps(register._offset, register._size, op, mask, data)
+        if value is not None:
+            self._cache_put(register, bridge._modify(op, value, mask, data) & ((1 << register.width) - 1))
+
+    def _wait_for_steps(self, register, match, mask, timeout):
+        if mask is None:
+            mask = (1 << register.width) - 1
+
+        while True:
+            value, timed_out = yield from self._poll_value_steps(register._offset, register._size, mask, match, timeout)
+            if not timed_out:
+                return value
+            if timeout is not None:
+                raise TimeoutError(f'Timed out waiting for {".".join(register.path)}, last read {value:#x}')
+
+    def _read_many_steps(self, registers):
+        registers = list(registers)
+        values = [self._cache_get(register) for register in registers]
+        misses = [(i, register) for i, register in enumerate(registers) if values[i] is None]
+        for _, register in misses:
+            self._check_readable(register)
+        self.cache_hits += len(registers) - len(misses)
+        self.cache_misses += sum(self._cacheable(register) for _, register in misses)
+
+        if misses:
+            # Adjacent registers are read in a single burst.
+            batch = self._bus_client.batch()
+            results = {}
+            for run in self._runs(register for _, register in misses):
+                results.update(zip(map(id, run), self._queue_read_run(batch, run)))
+            yield batch
+            for i, register in misses:
+                values[i] = results[id(register)]()
+                if register.access == 'rw':
+                    self._cache_put(register, values[i])
+        return values
+
+    def _write_many_steps(self, values):
+        values = list(values.items() if isinstance(values, dict) else values)
+        for register, _ in values:
+            self._cache_drop(register._offset, register._size)
+
+        # Registers are written in address order, with adjacent registers in a single burst.
+        value_of = {id(register): value for register, value in values}
+        batch = self._bus_client.batch()
+        for run in self._runs(register for register, _ in values):
+            self._queue_write_run(batch, run, [value_of[id(register)] for register in run])
+        yield batch
+
+        for register, value in values:
+            self._cache_put(register, value)
+
+    def _sync_steps(self):
+        if not self._cache:
+            return
+        entries = [(offset, size) for offset, (size, access, _) in self._cache.items() if access == 'rw']
+        batch = self._bus_client.batch()
+        results = [(offset, size, self._queue_read(batch, offset, size)) for offset, size in entries]
+        yield batch
+        for offset, size, result in results:
+            if offset in self._cache:
+                self._cache[offset] = (size, 'rw', result())
+
+    def read(self, addr):
+        return self._run(self._read_value_steps(addr, 1))
+
+    def write(self, addr, value):
+        return self._run(self._write_value_steps(addr, 1, value))
+
+    def read_value(self, addr, size):
+        return self._run(self._read_value_steps(addr, size))
+
+    def write_value(self, addr, size, value):
+        return self._run(self._write_value_steps(addr, size, value))
+
+    def modify_value(self, addr, size, op, mask, data = 0):
+        """Read-modify-write a register, in the bridge if it supports it."""
+        return self._run(self._modify_value_steps(addr, size, op, mask, data))
+
+    def poll_value(self, addr, size, mask, match, *, timeout = None):
+        """Read until ``value & mask == match``, returning the last value read and whether it timed out."""
+        return self._run(self._poll_value_steps(addr, size, mask, match, timeout))
+
+    def read_register(self, register):
+        return self._run(self._read_register_steps(register))
+
+    def write_register(self, register, value):
+        return self._run(self._write_register_steps(register, value))
+
+    def modify_register(self, register, op, mask, data = 0):
+        return self._run(self._modify_register_steps(register, op, mask, data))
+
+    def wait_for_register(self, register, match, *, mask = None, timeout = None):
+        return self._run(self._wait_for_steps(register, match, mask, timeout))
+
+    def read_many(self, registers):
+        """Read several registers in a single transaction, serving the ones with shadow copies from the cache."""
+        return self._run(self._read_many_steps(registers))
+
+    def write_many(self, values):
+        """Write several registers in a single transaction, given a dict or (register, value) pairs."""
+        return self._run(self._write_many_steps(values))
+
+    def invalidate(self, *elements):
+        """Drop the shadow copies of the given registers and memory maps, or of everything when none are given."""
+        if self._cache is None:
+            return
+        if not elements:
+            self._cache.clear()
+            return
+        for element in elements:
+            registers = [element] if isinstance(element, Register) else element.registers()
+            for register in registers:
+                self._cache.pop(register._offset, None)
+
+    def sync(self):
+        """Refresh the shadow copies of readable registers from the hardware, in a single transaction.
+
+        Shadow copies of write-only registers can't be read back and are kept.
+        """
+        return self._run(self._sync_steps())
+
+    async def _run(self, steps):
+        if self._bus_client.capabilities is None:
+            await self._bus_client.get_capabilities()
+
+        try:
+            batch = next(steps)
+            while True:
+                await batch.flush()
+                batch = steps.send(None)
+        except StopIteration as stop:
+            return stop.value
+
+class SyncClient(Client):
+    """:class:`Client` on a :class:`bridge.SyncClient`, whose registers are read and written without ``await``."""
+
+    def __init__(self, annotations, *, bus_client, **kwargs):
+        assert isinstance(bus_client, bridge.SyncClient)
+        super().__init__(annotations, bus_client = bus_client, **kwargs)
+
+    def _run(self, steps):
+        if self._bus_client.capabilities is None:
+            self._bus_client.get_capabilities()
 
-    async def write(self, addr, value):
-        await self._bus_client.write_8b(addr, [value])
+        try:
+            batch = next(steps)
+            while True:
+                batch.flush()
+                batch = steps.send(None)
+        except StopIteration as stop:
+            return stop.value
@@ -0,0 +1,267 @@
+"""Design metadata loading, with a compiled cache next to the metadata file.
+
+Parsing a large metadata file and building the name index for it dominates the startup time of the CLI.
+The cache holds the flattened name trie and register table in a compact binary format that is memory
+mapped and decoded lazily, so only the nodes that are actually visited are ever unpacked.
+
+The cache is keyed on the path, modification time and size of the metadata file, and falls back to its
+SHA-256 digest when the modification time changed, e.g. after a fresh checkout.
+"""
+
+import hashlib
+import mmap
+import os
+import pathlib
+import struct
+
+from .csr import _Index, _Node
+
+__all__ = ['load']
+
+CACHE_SUFFIX = '.katsuo-cache'
+
+_MAGIC = b'KBCSRIDX'
+_VERSION = 2
+
+# magic, version, mtime_ns, size, digest, addr_width, data_width, node_count, register_count,
+# path offset, path length, nodes offset, sorted children offset, registers offset, strings offset
+_HEADER = struct.Struct('<8sIqq32sIIIIIIIIII')
+
+# name offset, name length, parent, depth, kind, ratio, data_width, access, start, size, base,
+# first register, last register, first child, child count, first sorted child
+_NODE = struct.Struct('<IIIIIIIIqqqIIIII')
+
+# Access modes of CSR elements, by their index in the node record.
+_ACCESS = (None, 'r', 'w', 'rw')
+
+# node, offset
+_REGISTER = struct.Struct('<Iq')
+
+_SORTED = struct.Struct('<I')
+
+def _metadata_annotations(path):
+    import json
+
+    with path.open('r') as f:
+        data = json.load(f)
+    return data['interface']['members']['bus']['annotations']
+
+def _compile(index, *, path, stat, digest):
+    strings = bytearray()
+    string_offsets = {}
+
+    def intern(s):
+        if s not in string_offsets:
+            string_offsets[s] = len(strings)
+            strings.extend(s.encode())
+        return string_offsets[s], len(s.encode())
+
+    # Number nodes breadth first, so that the children of each node are contiguous.
+    nodes = [(index.root, (), 0xffffffff)]
+    node_ids = {}
+    children = []
+    for nid, (node, node_path, parent) in enumerate(nodes):
+        node_ids[node_path] = nid
+        children.append((len(nodes), len(node.children)))
+        for child_name, child in node.children.items():
+            nodes.append((child, node_path + (child_name,), nid))
+
+    sorted_children = []
+    node_records = bytearray()
+    for nid, (node, node_path, parent) in enumerate(nodes):
+        child_first, child_count = children[nid]
+        sorted_first = len(sorted_children)
+        sorted_children.extend(sorted(range(child_first, child_first + child_count), key = lambda i: nodes[i][1][-1].encode()))
+
+        name_offset, name_length = intern(node_path[-1] if node_path else '')
+        node_records += _NODE.pack(
+            name_offset, name_length, parent, len(node_path), node.kind, node.ratio, node.data_width or 0,
+            _ACCESS.index(node.access), node.start, node.size or 0, node.base, node.first, node.last,
+            child_first, child_count, sorted_first,
+        )
+
+    register_records = bytearray()
+    for register_path, offset, size, data_width, access in index.registers:
+        register_records += _REGISTER.pack(node_ids[register_path], offset)
+
+    path_offset, path_length = intern(str(path))
+
+    nodes_offset = _HEADER.size
+    sorted_offset = nodes_offset + len(node_records)
+    registers_offset = sorted_offset + len(sorted_children) * _SORTED.size
+    strings_offset = registers_offset + len(register_records)
+
+    header = _HEADER.pack(
+        _MAGIC, _VERSION, stat.st_mtime_ns, stat.st_size, digest,
+        index.addr_width, index.data_width, len(nodes), len(index.registers),
+        path_offset, path_length,
+        nodes_offset, sorted_offset, registers_offset, strings_offset,
+    )
+
+    return b''.join([
+        header,
+        node_records,
+        b''.join(_SORTED.pack(i) for i in sorted_children),
+        register_records,
+        strings,
+    ])
+
+class _CompiledChildren:
+    def __init__(self, index, node):
+        self._index = index
+        self._node = node
+
+    def get(self, name, default = None):
+        # Binary search over the children sorted by name.
+        key = name.encode()
+        lo, hi = 0, self._node._child_count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            child = self._index._sorted_child(self._node._sorted_first + mid)
+            child_name = self._index._name_bytes(child)
+            if child_name < key:
+                lo = mid + 1
+            elif child_name > key:
+                hi = mid
+            else:
+                return self._index.node(child)
+        return default
+
+    def items(self):
+        for i in range(self._node._child_first, self._node._child_first + self._node._child_count):
+            child = self._index.node(i)
+            yield child.name, child
+
+    def __len__(self):
+        return self._node._child_count
+
+class _CompiledNode:
+    annotations = None
+
+    def __init__(self, index, nid):
+        self._index = index
+        (
+            self._name_offset, self._name_length, self._parent, self._depth, self.kind, self.ratio, data_width,
+            access, self.start, size, self.base, self.first, self.last,
+            self._child_first, self._child_count, self._sorted_first,
+        ) = _NODE.unpack_from(index._buf, index._nodes_offset + nid * _NODE.size)
+
+        self.size = size if self.kind == _Node.RESOURCE else None
+        self.data_width = data_width if self.kind == _Node.RESOURCE else None
+        self.access = _ACCESS[access]
+        self.children = _CompiledChildren(index, self)
+
+    @property
+    def name(self):
+        return self._index._string(self._name_offset, self._name_length).decode()
+
+    @property
+    def path(self):
+        path = []
+        node = self
+        while node._depth:
+            path.append(node.name)
+            node = self._index.node(node._parent)
+        return tuple(reversed(path))
+
+class _CompiledRegisters:
+    def __init__(self, index):
+        self._index = index
+
+    def __len__(self):
+        return self._index._register_count
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return [self[i] for i in range(*key.indices(len(self)))]
+
+        nid, offset = _REGISTER.unpack_from(self._index._buf, self._index._registers_offset + key * _REGISTER.size)
+        node = self._index.node(nid)
+        return node.path, offset, node.size, node.data_width, node.access
+
+class _CompiledIndex:
+    """Memory mapped index with the same interface as :class:`csr._Index`."""
+
+    def __init__(self, buf):
+        (
+            magic, version, self.mtime_ns, self.size, self.digest,
+            self.addr_width, self.data_width, self._node_count, self._register_count,
+            path_offset, path_length, self._nodes_offset, self._sorted_offset, self._registers_offset, self._strings_offset,
+        ) = _HEADER.unpack_from(buf, 0)
+
+        if magic != _MAGIC or version != _VERSION:
+            raise ValueError('Not a compatible metadata cache')
+
+        self._buf = buf
+        self.source_path = self._string(path_offset, path_length).decode()
+        self._decoded = {}
+
+        self.root = self.node(0)
+        self.registers = _CompiledRegisters(self)
+
+    def node(self, nid):
+        node = self._decoded.get(nid)
+        if node is None:
+            node = self._decoded[nid] = _CompiledNode(self, nid)
+        return node
+
+    def _string(self, offset, length):
+        offset += self._strings_offset
+        return bytes(self._buf[offset:offset + length])
+
+    def _sorted_child(self, i):
+        return _SORTED.unpack_from(self._buf, self._sorted_offset + i * _SORTED.size)[0]
+
+    def _name_bytes(self, nid):
+        name_offset, name_length = struct.unpack_from('<II', self._buf, self._nodes_offset + nid * _NODE.size)
+        return self._string(name_offset, name_length)
+
+def _open_cache(cache_path):
+    with open(cache_path, 'rb') as f:
+        buf = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+    return _CompiledIndex(buf)
+
+def _write_cache(cache_path, data):
+    tmp_path = cache_path.with_name(f'{cache_path.name}.{os.getpid()}.tmp')
+    try:
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        # Caching is best effort, e.g. the metadata may live in a read-only directory.
+        tmp_path.unlink(missing_ok = True)
+
+def load(path, *, cache = True):
+    """Load the CSR bus index from a metadata file.
+
+    Returns an index that can be passed to :meth:`csr.MemoryMap.from_index` and :meth:`csr.Client.from_index`.
+    """
+    path = pathlib.Path(path).resolve()
+
+    if not cache:
+        return _Index(_metadata_annotations(path))
+
+    stat = path.stat()
+    cache_path = path.with_name(path.name + CACHE_SUFFIX)
+
+    index = None
+    try:
+        index = _open_cache(cache_path)
+    except (OSError, ValueError, struct.error):
+        pass
+
+    if index is not None and index.source_path == str(path):
+        if (index.mtime_ns, index.size) == (stat.st_mtime_ns, stat.st_size):
+            return index
+
+    digest = hashlib.sha256(path.read_bytes()).digest()
+
+    if index is not None and index.source_path == str(path) and index.digest == digest:
+        # Same contents with a new timestamp; refresh the key without recompiling.
+        data = bytearray(index._buf)
+        struct.pack_into('<qq', data, 12, stat.st_mtime_ns, stat.st_size)
+        _write_cache(cache_path, data)
+        return index
+
+    data = _compile(_Index(_metadata_annotations(path)), path = path, stat = stat, digest = digest)
+    _write_cache(cache_path, data)
+    return _CompiledIndex(data)
@@ -0,0 +1,169 @@
+"""Bridge daemon, sharing one open transport between many clients.
+
+Clients connect over a TCP or Unix domain socket and speak the bridge protocol as if connected to the bridge directly.
+Their byte streams are split at command boundaries, and the scheduler forwards up to `quantum` commands from every
+client with pending commands per round trip, so a client with a long batch can't starve the others.
+
+The address register of the bridge is shared between clients, so the daemon keeps track of the address for each client
+itself: commands without an address phase get the client's address filled in, and `no_addr` is not advertised.
+"""
+
+import asyncio
+import collections
+import dataclasses
+import urllib.parse
+
+from .bridge import Client
+
+__all__ = ['Server']
+
+class _Session:
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+        # Queued (request, response length, local response) tuples, in order.
+        self.commands = collections.deque()
+
+        # Address the bridge would continue from for this client.
+        self.addr = 0
+
+class Server:
+    def __init__(self, transport, *, quantum = 64):
+        self.transport = transport
+        self.quantum = quantum
+        self.capabilities = None
+
+        self._sessions = []
+        self._ready = asyncio.Event()
+
+    async def _recv_response(self, length):
+        # No-op statuses are dropped; an error status has no data, a poll timeout does.
+        while (status := await self.transport.recv(1)) == bytes([0x00]):
+            pass
+        if status in (bytes([0x01]), bytes([0x02])) and length:
+            return status + await self.transport.recv(length)
+        return status
+
+    async def _read_commands(self, session):
+        capabilities = self.capabilities
+        addr_bytes = (capabilities.addr_width + 7) // 8
+        length_bytes = (capabilities.burst_width + 7) // 8
+        addr_mask = (1 << capabilities.addr_width) - 1
+        timeout_bytes = (capabilities.poll_timeout_width + 7) // 8
+
+        reader = session.reader
+        while True:
+            cmd, = await reader.readexactly(1)
+
+            if cmd == 0x00:
+                continue
+
+            if cmd == 0xc0:
+                session.commands.append((None, 0, self._capabilities_response))
+                self._ready.set()
+                continue
+
+            kind, no_addr, burst, size = cmd >> 6, (cmd >> 4) & 1, (cmd >> 2) & 3, cmd & 3
+            is_read = cmd & 0xe0 == 0x40
+            is_poll = cmd & 0xec == 0x20
+            is_rmw = cmd & 0xe0 == 0x60
+            supported = {0: True, 1: capabilities.burst_nonincr, 2: capabilities.burst_incr}.get(burst, False)
+            if is_poll:
+                supported = capabilities.poll
+            elif is_rmw:
+                supported = capabilities.rmw
+            elif kind not in (1, 2) or cmd & 0x20:
+                supported = False
+            if not supported or not capabilities.access_size(size):
+                session.commands.append((None, 0, bytes([0xff])))
+                self._ready.set()
+                continue
+
+            length = b''
+            count = 1
+            if burst and not is_rmw:
+                length = await reader.readexactly(length_bytes)
+                count = int.from_bytes(length, 'little') & ((1 << capabilities.burst_width) - 1)
+
+            addr = session.addr
+            if not no_addr:
+                addr = int.from_bytes(await reader.readexactly(addr_bytes), 'little') & addr_mask
+
+            if is_poll:
+                # Mask, match and timeout.
+                payload = await reader.readexactly((2 << size) + timeout_bytes)
+            elif is_rmw:
+                # Mask, and data for a masked write.
+                payload = await reader.readexactly((2 << size) if burst == 0 else (1 << size))
+            elif is_read:
+                payload = b''
+            else:
+                payload = await reader.readexactly(count << size)
+
+            if burst == 2 and not is_rmw:
+                session.addr = (addr + count * capabilities.access_words(size)) & addr_mask
+            else:
+                session.addr = addr
+
+            request = bytes([cmd & ~0x10]) + length + addr.to_bytes(addr_bytes, 'little') + payload
+            session.commands.append((request, count << size if is_read or is_poll else 0, None))
+            self._ready.set()
+
+    async def _handle_client(self, reader, writer):
+        session = _Session(reader, writer)
+        self._sessions.append(session)
+        try:
+            await self._read_commands(session)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self._sessions.remove(session)
+            writer.close()
+
+    async def _schedule(self):
+        while True:
+            await self._ready.wait()
+            self._ready.clear()
+
+            while True:
+                # Up to `quantum` commands from each client per round trip.
+                request = bytearray()
+                pending = []
+                for session in list(self._sessions):
+                    for _ in range(min(self.quantum, len(session.commands))):
+                        command, response_length, response = session.commands.popleft()
+                        if command is not None:
+                            request += command
+                        pending.append((session, response_length, response))
+
+                if not pending:
+                    break
+
+                if request:
+                    await self.transport.send(bytes(request))
+
+                for session, response_length, response in pending:
+                    if response is None:
+                        response = await self._recv_response(response_length)
+                    if not session.writer.is_closing():
+                        session.writer.write(response)
+
+    async def start(self, url):
+        """Start listening on a ``tcp://host:port`` or ``unix:///path`` URL."""
+        self.capabilities = await Client(self.transport).get_capabilities()
+        self._capabilities_response = bytes([0x01]) + dataclasses.replace(self.capabilities, no_addr = False).encode()
+
+        u = urllib.parse.urlparse(url)
+        match u.scheme:
+            case 'tcp':
+                return await asyncio.start_server(self._handle_client, u.hostname, u.port)
+            case 'unix':
+                return await asyncio.start_unix_server(self._handle_client, u.path)
+            case _:
+                raise ValueError(f'Unsupported URL scheme: {u.scheme}')
+
+    async def serve(self, url):
+        server = await self.start(url)
+        async with server:
+            await self._schedule()
@@ -1,16 +1,45 @@
+"""Transports carrying the byte streams of a bridge.
+
+Each transport has async `send` and `recv` methods. Transports on blocking I/O also have blocking `write` and `read`
+methods, which :class:`..bridge.SyncClient` uses directly.
+"""
+
 import urllib
 import urllib.parse
 
 def open_url(url):
     u = urllib.parse.urlparse(url)
+    query = urllib.parse.parse_qs(u.query)
     match u.scheme:
         case 'jtag+ftdi':
             from .jtag import FtdiJtagTransport
-            return FtdiJtagTransport(url[5:])
+            kwargs = {}
+            if 'freq' in query:
+                kwargs['frequency'] = float(query['freq'][-1])
+            if 'readahead' in query:
+                kwargs['readahead'] = int(query['readahead'][-1])
+            return FtdiJtagTransport(u._replace(scheme = 'ftdi', query = '').geturl(), **kwargs)
 
         case 'usb': # TODO: specify control/bulk?
             from .usb import UsbTransport
-            return UsbTransport(url)
+            kwargs = {}
+            if 'transfer_size' in query:
+                kwargs['transfer_size'] = int(query['transfer_size'][-1])
+            if 'queue_depth' in query:
+                kwargs['queue_depth'] = int(query['queue_depth'][-1])
+            return UsbTransport(**kwargs)
+
+        case 'tcp':
+            from . import socket
+            return socket.Transport(host = u.hostname, port = u.port)
+
+        case 'unix':
+            from . import socket
+            return socket.Transport(path = u.path)
+
+        case 'sim':
+            from .sim import SimTransport, load_factory
+            return SimTransport(load_factory(u.netloc + u.path))
 
         case 'serial':
             from . import serial
@@ -0,0 +1,110 @@
+"""Framing of the byte stream on the JTAG data register.
+
+Each byte is shifted as a start bit followed by its 8 data bits, LSB first, and frames may be separated by any number
+of idle zero bits. Bit ``i`` of a shifted sequence is bit ``i % 8`` of byte ``i // 8``, which is also the bit order of
+LSB first MPSSE shifts.
+
+Frames are packed and unpacked in blocks with a handful of mask and shift operations on integers, instead of one bit at
+a time.
+"""
+
+__all__ = ['encode_frames', 'FrameDecoder']
+
+# Frames per block; a power of two.
+_BLOCK = 512
+_LEVELS = _BLOCK.bit_length() - 1
+
+def _repeat(pattern, period, count):
+    value = 0
+    for i in range(count):
+        value |= pattern << (period * i)
+    return value
+
+_START = _repeat(1, 9, _BLOCK)
+_DATA = _repeat(0xff, 9, _BLOCK)
+
+# Unpacking level j moves every odd group of 2**j contiguous data bytes down by 2**j bits, to join its even neighbour.
+_MASKS = [
+    _repeat(((1 << (8 << j)) - 1) << (9 << j), 18 << j, _BLOCK >> (j + 1))
+    for j in range(_LEVELS)
+]
+
+def _pack(data):
+    x = int.from_bytes(data, 'little')
+    for j in reversed(range(_LEVELS)):
+        mask = _MASKS[j] >> (1 << j)
+        x = (x & ~mask) | ((x & mask) << (1 << j))
+    return (x << 1) | (_START & ((1 << (9 * len(data))) - 1))
+
+def _unpack(x, count):
+    x = (x >> 1) & _DATA
+    for j, mask in enumerate(_MASKS):
+        x = (x & ~mask) | ((x & mask) >> (1 << j))
+    return x.to_bytes(count, 'little')
+
+def encode_frames(data):
+    """Frame a sequence of bytes, padding the last frame to a whole byte with idle bits."""
+    res = bytearray()
+    for offset in range(0, len(data), _BLOCK):
+        block = data[offset:offset + _BLOCK]
+        res += _pack(block).to_bytes((9 * len(block) + 7) // 8, 'little')
+    return bytes(res)
+
+class FrameDecoder:
+    """Incremental decoder for frames shifted out of the data register."""
+
+    # Enough bytes for a full block at any bit offset.
+    _WINDOW = (9 * _BLOCK + 7) // 8 + 2
+
+    def __init__(self):
+        self._buf = bytearray()
+        self._pos = 0
+
+    @property
+    def pending_bits(self):
+        return len(self._buf) * 8 - self._pos
+
+    def feed(self, data):
+        self._buf += data
+
+    def decode(self, limit):
+        """Decode up to `limit` complete frames, leaving any partial frame buffered."""
+        res = bytearray()
+
+        while len(res) < limit:
+            start = self._pos // 8
+            window = self._buf[start:start + self._WINDOW]
+            end = start + len(window) == len(self._buf)
+            x = int.from_bytes(window, 'little') >> (self._pos % 8)
+            bits = len(window) * 8 - self._pos % 8
+
+            # Skip idle bits.
+            if not x:
+                self._pos += bits
+                if end:
+                    break
+                continue
+            skip = (x & -x).bit_length() - 1
+            x >>= skip
+            self._pos += skip
+            bits -= skip
+
+            count = min(bits // 9, limit - len(res), _BLOCK)
+            if not count:
+                # A frame starting at the end of the window continues in the next one, which starts from its start bit.
+                if end:
+                    break
+                continue
+
+            # Take the run of back-to-back frames up to the first missing start bit.
+            gaps = ~x & _START & ((1 << (9 * count)) - 1)
+            if gaps:
+                count = ((gaps & -gaps).bit_length() - 1) // 9
+
+            res += _unpack(x & ((1 << (9 * count)) - 1), count)
+            self._pos += 9 * count
+
+        del self._buf[:self._pos // 8]
+        self._pos %= 8
+
+        return bytes(res)
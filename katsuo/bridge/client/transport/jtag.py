@@ -1,6 +1,11 @@
-from pyftdi.jtag import JtagEngine
+import time
+
+from pyftdi.jtag import JtagEngine, JtagError
+from pyftdi.ftdi import Ftdi
 from pyftdi.bits import BitSequence
 
+from ._framing import encode_frames, FrameDecoder
+
 ER1 = BitSequence(0x32, length = 8)
 ER2 = BitSequence(0x38, length = 8)
 
@@ -23,8 +28,14 @@ _supported_idcodes = [
 ]
 
 class FtdiJtagTransport:
-    def __init__(self, url):
-        self._jtag = JtagEngine(frequency = 1e6)
+    """Transport over the ER1 data register of a Lattice FPGA.
+
+    Sent frames are buffered until a response is needed, and then shifted together with idle bits for the response
+    and `readahead` further bytes in as few shifts as possible.
+    """
+
+    def __init__(self, url, *, frequency = 1e6, readahead = 64):
+        self._jtag = JtagEngine(frequency = frequency)
         self._jtag.configure(url)
         self._jtag.reset()
 
@@ -34,52 +45,67 @@ class FtdiJtagTransport:
         self._jtag.write_ir(ER1)
         self._jtag.change_state('shift_dr')
 
-        self._read_buf = BitSequence()
+        self._decoder = FrameDecoder()
+        self._tx_buffer = bytearray()
+        self._readahead = readahead
+
+        # Statistics.
+        self.shifts = 0
+        self.shift_bytes = 0
+        self.shift_time = 0
 
     def __enter__(self):
         return self
     
     def __exit__(self, exc_type, exc_value, traceback):
+        if self._tx_buffer:
+            self._flush(3)
         self._jtag.go_idle()
         self._jtag.sync()
 
-    def read(self, length):
-        buf = bytearray()
-        while length:
-            # Remove leading zeros.
-            for i, b in enumerate(self._read_buf):
-                if b:
-                    before = len(self._read_buf)
-                    self._read_buf = self._read_buf[i:]
-                    assert len(self._read_buf) == before - i
-                    break
-            else:
-                self._read_buf = BitSequence()
-
-            # Take a byte from the buffer.
-            if len(self._read_buf) >= 9:
-                assert self._read_buf[0] == 1
-                buf.append(int(self._read_buf[1:9]))
-                self._read_buf = self._read_buf[9:]
-                length -= 1
-                continue
-
-            # Read more if required.
-            if len(self._read_buf) < length * 9:
-                self._read_buf.append(self._jtag.shift_register(BitSequence(0, length = length * 9 - len(self._read_buf))))
-                continue
+    def _shift(self, data):
+        # Shift whole bytes through the data register with raw MPSSE commands, in chunks that fit the FTDI FIFOs.
+        ctrl = self._jtag.controller
+        ctrl.sync()
+        ftdi = ctrl.ftdi
+        chunk_size = min(ftdi.fifo_sizes)
+        start = time.perf_counter()
+
+        res = bytearray()
+        for offset in range(0, len(data), chunk_size):
+            chunk = data[offset:offset + chunk_size]
+            n = len(chunk) - 1
+            ftdi.write_data(bytes([Ftdi.RW_BYTES_PVE_NVE_LSB, n & 0xff, n >> 8]) + chunk + bytes([Ftdi.SEND_IMMEDIATE]))
+
+            remaining = len(chunk)
+            while remaining:
+                buf = ftdi.read_data_bytes(remaining, 4)
+                if not buf:
+                    raise JtagError('Unable to read data from FTDI')
+                res += buf
+                remaining -= len(buf)
+
+        self.shifts += 1
+        self.shift_bytes += len(data)
+        self.shift_time += time.perf_counter() - start
+
+        return bytes(res)
+
+    def _flush(self, idle):
+        # Shift out buffered frames followed by `idle` bytes of idle bits, capturing any responses.
+        data, self._tx_buffer = self._tx_buffer + bytes(idle), bytearray()
+        self._decoder.feed(self._shift(data))
 
+    def read(self, length):
+        buf = bytearray(self._decoder.decode(length))
+        while len(buf) < length:
+            # Read more if required, with some margin for the response to frames that haven't been shifted yet.
+            self._flush(((length - len(buf) + self._readahead) * 9 + 7) // 8 + 3)
+            buf += self._decoder.decode(length - len(buf))
         return buf
 
     def write(self, data):
-        buf = BitSequence()
-        for b in data:
-            buf.append(BitSequence(1, length = 1))
-            buf.append(BitSequence(b, length = 8))
-
-        buf.append(BitSequence(0, length = 20))
-
-        self._read_buf.append(self._jtag.shift_register(buf))
+        self._tx_buffer += encode_frames(data)
 
     async def send(self, data: bytes):
         self.write(data)
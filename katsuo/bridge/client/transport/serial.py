@@ -5,6 +5,9 @@ class Transport:
         self.port = port
         self.reader, self.writer = None, None
 
+        # Blocking port, for `write` and `read`.
+        self._serial = None
+
     async def open(self):
         self.reader, self.writer = await open_serial_connection(url = self.port)
 
@@ -19,3 +22,19 @@ class Transport:
             await self.open()
 
         return await self.reader.readexactly(length)
+
+    def open_blocking(self):
+        import serial
+        self._serial = serial.serial_for_url(self.port)
+
+    def write(self, data: bytes):
+        if self._serial is None:
+            self.open_blocking()
+
+        self._serial.write(data)
+
+    def read(self, length = 1):
+        if self._serial is None:
+            self.open_blocking()
+
+        return self._serial.read(length)
@@ -0,0 +1,259 @@
+import asyncio
+import collections
+import importlib
+import importlib.util
+import queue
+import threading
+
+from amaranth.sim import Simulator, SimulatorContext
+
+from ...sim import _beat_bytes, _beats, _beat_data, stream_put_bytes, stream_get_bytes
+from ..bridge import Capabilities
+
+def load_factory(spec: str):
+    """Load a factory from ``module:function`` or ``path/to/file.py:function``."""
+    module_name, _, attr = spec.rpartition(':')
+    assert module_name and attr, f'Expected module:function, got {spec!r}'
+
+    if module_name.endswith('.py'):
+        module_spec = importlib.util.spec_from_file_location('_katsuo_sim_factory', module_name)
+        module = importlib.util.module_from_spec(module_spec)
+        module_spec.loader.exec_module(module)
+    else:
+        module = importlib.import_module(module_name)
+
+    return getattr(module, attr)
+
+def _frame_requests(capabilities: Capabilities, commands, pending):
+    """Split ``(byte, cycle)`` request pairs sent to it into commands, following the protocol like the bridge does.
+
+    Each command is appended to `commands` and to `pending` as ``[start, length, input_end, output_end]``, with the
+    cycles its first and last byte were taken. `length` is set to the number of data bytes in an OK response once the
+    command is complete; ``-1`` stands for the capability data, which ends on a byte without the continuation bit.
+    """
+    addr_bytes = (capabilities.addr_width + 7) // 8
+    burst_bytes = (capabilities.burst_width + 7) // 8
+    timeout_bytes = (capabilities.poll_timeout_width + 7) // 8
+
+    while True:
+        cmd, cycle = yield
+        if cmd == 0x00:
+            continue
+
+        command = [cycle, None, cycle, None]
+        commands.append(command)
+        pending.append(command)
+
+        if cmd == 0xc0:
+            command[1] = -1
+            continue
+
+        no_addr, burst, size = (cmd >> 4) & 1, (cmd >> 2) & 3, cmd & 3
+        fields = 0 if no_addr else addr_bytes
+        if not capabilities.access_size(size) or (no_addr and not capabilities.no_addr):
+            fields, length = 0, 0
+        elif cmd & 0xec == 0x20 and capabilities.poll:
+            fields += (2 << size) + timeout_bytes
+            length = 1 << size
+        elif cmd & 0xe0 == 0x60 and capabilities.rmw:
+            fields += (2 << size) if burst == 0 else (1 << size)
+            length = 0
+        elif cmd & 0xc0 in (0x40, 0x80) and not cmd & 0x20 and burst != 3 and (capabilities.burst_width or not burst):
+            count = 1
+            if burst:
+                count = 0
+                for i in range(burst_bytes):
+                    b, command[2] = yield
+                    count |= b << (8 * i)
+                count &= (1 << capabilities.burst_width) - 1
+            if cmd & 0x80:
+                fields += count << size
+            length = 0 if cmd & 0x80 else count << size
+        else:
+            fields, length = 0, 0
+
+        for _ in range(fields):
+            _, command[2] = yield
+        command[1] = length
+
+def _frame_responses(pending):
+    """Split ``(byte, cycle)`` response pairs sent to it into the responses to the `pending` commands, in order."""
+    b, cycle = yield
+    while True:
+        # No-op statuses are ignored.
+        if b == 0x00:
+            b, cycle = yield
+            continue
+
+        # The bridge may send the status before taking the rest of the command, but not before its command byte, so the
+        # length of the response is known by the next response byte.
+        command = pending.popleft()
+        command[3] = cycle
+        status, (b, cycle) = b, (yield)
+        if status not in (0x01, 0x02):
+            continue
+
+        if command[1] is not None and command[1] < 0:
+            while True:
+                command[3], last = cycle, b
+                b, cycle = yield
+                if not last & 0x80:
+                    break
+        else:
+            for _ in range(command[1] or 0):
+                command[3] = cycle
+                b, cycle = yield
+
+class SimTransport:
+    """Transport driving the byte streams of a bridge in an Amaranth simulation, running in a worker thread.
+
+    `factory` returns either the bridge itself, or a tuple of the top level elaboratable and the bridge in it.
+    Input bytes are offered every cycle, filling each beat of a wide stream, and output is always accepted. Once the
+    input is exhausted and the bridge has been `idle` for `idle` cycles in a row, the simulation waits for more input;
+    a bridge that isn't idle is still busy with a command, like a poll.
+
+    `cycles` holds the number of cycles from the first input byte to the last input or output byte of each exchange.
+    `command_cycles` holds, for each exchange, the number of cycles from each command byte being taken to the last byte
+    of its response. Commands are told apart by following the protocol with the capabilities of the bridge, which are
+    queried once as the simulation starts. As the commands of an exchange are pipelined, their cycles overlap.
+    """
+
+    def __init__(self, factory, *, idle = 16):
+        res = factory()
+        top, dut = res if isinstance(res, tuple) else (res, res)
+        self._dut = dut
+        self._idle_cycles = idle
+
+        self._sim = Simulator(top)
+        self._sim.add_clock(1e-6)
+        self._sim.add_testbench(self._testbench)
+
+        self._requests = queue.Queue()
+        self._thread = None
+        self._loop = None
+
+        self._rx_buffer = bytearray()
+        self._rx_event = asyncio.Event()
+
+        # Requests sent, and requests the simulation is done with.
+        self._sent = 0
+        self._done = 0
+
+        self.cycles = []
+        self.command_cycles = []
+
+    def _start(self):
+        if self._thread is None:
+            self._loop = asyncio.get_running_loop()
+            self._thread = threading.Thread(target = self._sim.run, daemon = True)
+            self._thread.start()
+
+    def close(self):
+        if self._thread is not None:
+            self._requests.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _receive(self, data, done = None):
+        # Called on the event loop thread.
+        self._rx_buffer += data
+        if done is not None:
+            self._done = done
+        self._rx_event.set()
+
+    async def _testbench(self, ctx: SimulatorContext):
+        dut = self._dut
+        beat_bytes = _beat_bytes(dut.input)
+        done = 0
+
+        await stream_put_bytes(ctx, dut.input, bytes([0xc0]))
+        response = bytearray()
+        while len(response) < 2 or response[-1] & 0x80:
+            response += await stream_get_bytes(ctx, dut.output, 1)
+        capabilities = Capabilities.decode(response[1:])
+
+        ctx.set(dut.output.ready, 1)
+
+        while True:
+            # Nothing to do until there's input.
+            request = self._requests.get()
+            if request is None:
+                return
+            pending = bytearray(request)
+            done += 1
+
+            cycle = 0
+            last_busy = 0
+            quiet = 0
+            output = bytearray()
+
+            commands = []
+            awaiting = collections.deque()
+            requests = _frame_requests(capabilities, commands, awaiting)
+            responses = _frame_responses(awaiting)
+            next(requests)
+            next(responses)
+
+            while pending or quiet < self._idle_cycles:
+                # Pick up requests sent while we were busy.
+                while not self._requests.empty():
+                    request = self._requests.get()
+                    if request is None:
+                        return
+                    pending += request
+                    done += 1
+
+                ctx.set(dut.input.valid, bool(pending))
+                if pending:
+                    ctx.set(dut.input.payload, _beats(dut.input, pending[:beat_bytes])[0])
+
+                _, _, input_ready, output_valid, output_payload, idle = await ctx.tick().sample(
+                    dut.input.ready, dut.output.valid, dut.output.payload, dut.idle)
+                cycle += 1
+
+                quiet = quiet + 1 if idle else 0
+
+                if pending and input_ready:
+                    for b in pending[:beat_bytes]:
+                        requests.send((b, cycle))
+                    del pending[:beat_bytes]
+                    last_busy = cycle
+                    quiet = 0
+
+                if output_valid:
+                    data = _beat_data(dut.output, output_payload)
+                    for b in data:
+                        responses.send((b, cycle))
+                    output += data
+                    last_busy = cycle
+                    quiet = 0
+
+                if len(output) >= 64:
+                    self._loop.call_soon_threadsafe(self._receive, bytes(output))
+                    output.clear()
+
+            ctx.set(dut.input.valid, 0)
+            self.cycles.append(last_busy)
+            self.command_cycles.append([max(input_end, output_end or 0) - start + 1 for start, _, input_end, output_end in commands])
+            self._loop.call_soon_threadsafe(self._receive, bytes(output), done)
+
+    async def send(self, data: bytes):
+        self._start()
+        self._sent += 1
+        self._requests.put(bytes(data))
+
+    async def recv(self, length = 1):
+        while len(self._rx_buffer) < length:
+            assert self._done < self._sent, 'Waiting for a response that will never arrive'
+            self._rx_event.clear()
+            await self._rx_event.wait()
+
+        res = bytes(self._rx_buffer[:length])
+        del self._rx_buffer[:length]
+        return res
@@ -0,0 +1,54 @@
+import asyncio
+import socket
+
+class Transport:
+    """Transport over a TCP or Unix domain socket, e.g. to a bridge daemon."""
+
+    def __init__(self, *, host = None, port = None, path = None):
+        self.host, self.port, self.path = host, port, path
+        self.reader, self.writer = None, None
+
+        # Blocking socket and its buffered reader, for `write` and `read`.
+        self._socket, self._file = None, None
+
+    async def open(self):
+        if self.path is not None:
+            self.reader, self.writer = await asyncio.open_unix_connection(self.path)
+        else:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+
+    async def send(self, data: bytes):
+        if self.writer is None:
+            await self.open()
+
+        self.writer.write(data)
+
+    async def recv(self, length = 1):
+        if self.reader is None:
+            await self.open()
+
+        return await self.reader.readexactly(length)
+
+    def connect(self):
+        if self.path is not None:
+            self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self._socket.connect(self.path)
+        else:
+            self._socket = socket.create_connection((self.host, self.port))
+            self._socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._file = self._socket.makefile('rb')
+
+    def write(self, data: bytes):
+        if self._socket is None:
+            self.connect()
+
+        self._socket.sendall(data)
+
+    def read(self, length = 1):
+        if self._socket is None:
+            self.connect()
+
+        data = self._file.read(length)
+        if len(data) < length:
+            raise ConnectionError('Connection closed')
+        return data
@@ -1,7 +1,92 @@
+import asyncio
+import collections
+
 import nusb
 
-class UsbTransport:
+_GET_DESCRIPTOR = 0x06
+_CONFIGURATION_DESCRIPTOR = 0x02
+_INTERFACE_DESCRIPTOR = 0x04
+_ENDPOINT_DESCRIPTOR = 0x05
+
+def _bulk_endpoints(descriptors, interface_number):
+    """Find the bulk IN and OUT endpoints of an interface in a configuration descriptor.
+
+    Returns the IN endpoint address, the OUT endpoint address and the maximum packet size of the IN endpoint.
+    """
+    in_ep, out_ep = None, None
+
+    interface = None
+    offset = 0
+    while offset + 2 <= len(descriptors):
+        length, kind = descriptors[offset], descriptors[offset + 1]
+        if length < 2:
+            break
+
+        if kind == _INTERFACE_DESCRIPTOR:
+            # Only the default alternate setting.
+            interface = descriptors[offset + 2] if descriptors[offset + 3] == 0 else None
+
+        elif kind == _ENDPOINT_DESCRIPTOR and interface == interface_number:
+            address, attributes = descriptors[offset + 2], descriptors[offset + 3]
+            max_packet_size = int.from_bytes(descriptors[offset + 4:offset + 6], 'little') & 0x7ff
+            if attributes & 0x3 == 0x2:
+                if address & 0x80:
+                    in_ep = in_ep or (address, max_packet_size)
+                else:
+                    out_ep = out_ep or address
+
+        offset += length
+
+    assert in_ep is not None and out_ep is not None, f'No bulk endpoints on interface {interface_number}'
+    return in_ep[0], out_ep, in_ep[1]
+
+class _ReceiveBuffer:
+    """Queue of received transfers, consumed in place without copying what's left behind."""
+
     def __init__(self):
+        self._chunks = collections.deque()
+        self._offset = 0
+        self._length = 0
+
+    def __len__(self):
+        return self._length
+
+    def append(self, data):
+        if data:
+            self._chunks.append(memoryview(data))
+            self._length += len(data)
+
+    def read(self, length):
+        assert length <= self._length
+        self._length -= length
+
+        res = bytearray()
+        while length:
+            chunk = self._chunks[0]
+            n = min(length, len(chunk) - self._offset)
+            part = chunk[self._offset:self._offset + n]
+            self._offset += n
+            length -= n
+
+            if self._offset == len(chunk):
+                self._chunks.popleft()
+                self._offset = 0
+
+            if not res and not length:
+                return bytes(part)
+            res += part
+
+        return bytes(res)
+
+class UsbTransport:
+    """Transport over a pair of bulk endpoints.
+
+    Up to `queue_depth` IN transfers of `transfer_size` bytes are kept in flight, so the pipe isn't left idle
+    between reads. The transfers belong to the event loop they're queued on; when another loop uses the transport,
+    what the finished ones received is kept, and the rest are cancelled and queued again on the new loop.
+    """
+
+    def __init__(self, *, transfer_size = 16384, queue_depth = 4):
         devices = [info for info in nusb.list_devices() if info.vendor_id == 0x1209 and info.product_id == 0x3443]
         assert len(devices) == 1
         info, = devices
@@ -11,19 +96,45 @@ class UsbTransport:
         interface_info, = interfaces
 
         device = info.open()
+        descriptors = device.control_in_blocking(
+            nusb.ControlType.Standard, nusb.Recipient.Device,
+            _GET_DESCRIPTOR, _CONFIGURATION_DESCRIPTOR << 8, 0, 0xffff, 1.0,
+        )
+        self._in_ep, self._out_ep, max_packet_size = _bulk_endpoints(descriptors, interface_info.interface_number)
         self._interface = device.claim_interface(interface_info.interface_number)
-        self._in_ep = 0x81 # FIXME
-        self._out_ep = 0x01 # FIXME
-        self._rx_buffer = bytearray()
+
+        # IN transfers must be a multiple of the maximum packet size.
+        self._transfer_size = -(-transfer_size // max_packet_size) * max_packet_size
+        self._queue_depth = queue_depth
+        self._transfers = collections.deque()
+        self._loop = None
+        self._rx_buffer = _ReceiveBuffer()
+
+    def _submit(self):
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            # Transfers are completed in order, so everything after the first unfinished one is unfinished too.
+            while self._transfers and self._transfers[0].done() and not self._transfers[0].cancelled():
+                self._rx_buffer.append(self._transfers.popleft().result())
+            for transfer in self._transfers:
+                if not transfer.done():
+                    transfer.cancel()
+            self._transfers.clear()
+            self._loop = loop
+
+        while len(self._transfers) < self._queue_depth:
+            self._transfers.append(asyncio.ensure_future(self._interface.bulk_in(self._in_ep, self._transfer_size)))
 
     async def send(self, data: bytes):
+        self._submit()
         await self._interface.bulk_out(self._out_ep, data)
 
     async def recv(self, length = 1):
-        #return b'\0' * length
+        self._submit()
         while len(self._rx_buffer) < length:
-            data = await self._interface.bulk_in(self._in_ep, 512)
-            self._rx_buffer.extend(data)
+            # Waiting leaves the transfer queued, so what it receives isn't lost if we're cancelled.
+            await asyncio.wait([self._transfers[0]])
+            self._rx_buffer.append(self._transfers.popleft().result())
+            self._submit()
 
-        res, self._rx_buffer = self._rx_buffer[:length], self._rx_buffer[length:]
-        return res
+        return self._rx_buffer.read(length)
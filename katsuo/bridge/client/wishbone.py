@@ -0,0 +1,51 @@
+class Client:
+    """Byte addressed memory behind a :class:`katsuo.bridge.wishbone.Bridge`.
+
+    Ranges are sent in a single batch, as an incrementing burst of the widest supported access size, with narrower
+    naturally aligned accesses for the unaligned head and tail.
+    """
+
+    def __init__(self, *, bus_client):
+        self._bus_client = bus_client
+
+    def _runs(self, addr, length):
+        """(size, addr, count) of the accesses covering `length` bytes from `addr`."""
+        capabilities = self._bus_client.capabilities
+        widest = max(size for size in range(4) if capabilities.access_size(size))
+        end = addr + length
+
+        while addr < end:
+            size = widest
+            while addr & ((1 << size) - 1) or end - addr < (1 << size) or not capabilities.access_size(size):
+                size -= 1
+                assert size >= 0, f'No access size supported at {addr:#x}'
+
+            # Narrower accesses only cover the unaligned head and tail, running until a wider one lines up.
+            count = (end - addr) >> size if size == widest else 1
+            yield size, addr, count
+            addr += count << size
+
+    def queue_read(self, batch, addr, length):
+        """Queue a read of `length` bytes, returning a function that assembles them once the batch is flushed."""
+        results = [(size, getattr(batch, f'read_{8 << size}b')(addr, count)) for size, addr, count in self._runs(addr, length)]
+        return lambda: b''.join(b''.join(value.to_bytes(1 << size, 'little') for value in result.result()) for size, result in results)
+
+    def queue_write(self, batch, addr, data):
+        data = memoryview(bytes(data))
+        for size, run_addr, count in self._runs(addr, len(data)):
+            start = run_addr - addr
+            payload = data[start:start + (count << size)]
+            if size == 0:
+                batch.write_8b(run_addr, payload)
+            else:
+                values = [int.from_bytes(payload[i:i + (1 << size)], 'little') for i in range(0, len(payload), 1 << size)]
+                getattr(batch, f'write_{8 << size}b')(run_addr, values)
+
+    async def read(self, addr, length):
+        async with self._bus_client.batch() as batch:
+            result = self.queue_read(batch, addr, length)
+        return result()
+
+    async def write(self, addr, data):
+        async with self._bus_client.batch() as batch:
+            self.queue_write(batch, addr, data)
@@ -1,141 +1,476 @@
 from amaranth import *
-from amaranth.lib import wiring, stream
+from amaranth.lib import wiring
 
 from amaranth_soc import csr
 
+from . import _stream
+from ._response import ResponseQueue
+
+from . import annotations as _annotations
+
 #from ..stream import
 
 class Bridge(wiring.Component):
-    input: wiring.In(stream.Signature(8))
-    output: wiring.Out(stream.Signature(8))
-
-    def __init__(self, bus: csr.Interface):
-        super().__init__()
+    def __init__(self, bus: csr.Interface, *, burst_width = 8, poll_timeout_width = 24, rmw = True, stream_width = 8):
+        super().__init__({
+            'input': wiring.In(_stream.signature(stream_width)),
+            'output': wiring.Out(_stream.signature(stream_width)),
+            'idle': wiring.Out(1),
+        })
 
         assert isinstance(wiring.flipped(bus), csr.Interface)
+        assert 0 <= burst_width < 0x80
+        assert 0 <= poll_timeout_width < 0x80
 
         self._bus = bus
+        self._burst_width = burst_width
+        self._poll_timeout_width = poll_timeout_width
+        self._rmw = rmw
+        self._stream_width = stream_width
 
-        assert bus.signature.data_width <= 8, 'Bus width > 8 bits not yet supported'
+        data_width = bus.signature.data_width
+        assert data_width <= 8 or data_width in (16, 32, 64), f'Unsupported bus width: {data_width}'
 
-    def _send_status(self, m, next, status = 0x01):
-        m.d.comb += [
-            self.output.valid.eq(1),
-            self.output.payload.eq(status),
-        ]
-        with m.If(self.output.ready):
+        # Number of bytes per bus word; narrow buses are padded to a byte.
+        self._word_bytes = (data_width + 7) // 8
+
+        # Supported access sizes (AA field); each access spans a whole number of bus words.
+        self._access_sizes = [aa for aa in range(4) if (1 << aa) >= self._word_bytes]
+
+    def _start_access(self, m, count, is_read):
+        with m.If(count == 0):
+            m.next = 'CMD'
+        with m.Elif(is_read):
+            m.next = 'READ'
+        with m.Else():
+            m.next = 'WRITE'
+
+    def _next_access(self, m, count, increment, addr, chunk, last_chunk, next):
+        with m.If(chunk == last_chunk):
+            m.d.sync += [
+                chunk.eq(0),
+                count.eq(count - 1),
+            ]
+            with m.If(increment):
+                m.d.sync += addr.eq(addr + last_chunk + 1)
+            with m.If(count == 1):
+                m.next = 'CMD'
+            with m.Else():
+                m.next = next
+        with m.Else():
+            m.d.sync += chunk.eq(chunk + 1)
             m.next = next
 
     def elaborate(self, platform):
         m = Module()
 
-        cmd = Signal(8)
-
         is_read = Signal()
+        is_poll = Signal()
+        is_rmw = Signal()
+        rmw_op = Signal(2)
+        increment = Signal()
+        no_addr = Signal()
+        size = Signal(2)
+
+        # Remaining number of accesses in the current command.
+        count = Signal(max(self._burst_width, 1))
+
+        # Address of the current access, kept between commands for no-address mode.
+        addr = Signal(self._bus.signature.addr_width)
+
+        # Bus word within the current access.
+        chunk = Signal(range(8))
+        last_chunk = Signal(range(8))
+        last_byte = Signal(range(8))
+
+        # Byte within the current bus word.
+        byte = Signal(range(self._word_bytes))
+
+        buf = Signal(8 * self._word_bytes)
+
+        # Poll and read-modify-write state: value read, mask and match or data fields, and byte within the fields.
+        value = Signal(64)
+        mask = Signal(64)
+        operand = Signal(64)
+        field_byte = Signal(range(8))
+
+        # Remaining cycles and result of a poll.
+        poll_timer = Signal(self._poll_timeout_width)
+        poll_status = Signal(8)
+
+        # Value written back by a read-modify-write.
+        modified = Signal(64)
+        with m.Switch(rmw_op):
+            with m.Case(0):
+                m.d.comb += modified.eq((value & ~mask) | (operand & mask))
+            with m.Case(1):
+                m.d.comb += modified.eq(value | mask)
+            with m.Case(2):
+                m.d.comb += modified.eq(value & ~mask)
+            with m.Case(3):
+                m.d.comb += modified.eq(value ^ mask)
+
+        m.d.comb += self._bus.addr.eq(addr + chunk)
+
+        with m.Switch(size):
+            for aa in self._access_sizes:
+                with m.Case(aa):
+                    m.d.comb += [
+                        last_chunk.eq((1 << aa) // self._word_bytes - 1),
+                        last_byte.eq((1 << aa) - 1),
+                    ]
 
-        buf = Signal(self._bus.signature.data_width)
+        # Request bytes, taken one per cycle, or a beat at a time by writes.
+        m.submodules.requests = requests = _stream.RequestWindow(self._stream_width)
+        wiring.connect(m, wiring.flipped(self.input), requests.input)
+
+        rx_valid = Signal()
+        rx_payload = Signal(8)
+        rx_ready = Signal()
+        m.d.comb += [
+            rx_valid.eq(requests.level != 0),
+            rx_payload.eq(requests.data[:8]),
+            requests.take.eq(rx_ready),
+        ]
+
+        m.submodules.responses = responses = ResponseQueue(self._word_bytes, stream_width = self._stream_width)
+        wiring.connect(m, responses.output, wiring.flipped(self.output))
+
+        # Status byte held back by read data being pushed in the same cycle as the command byte.
+        status = Signal(8)
+        status_valid = Signal()
+
+        # Read data arrives in the cycle after the strobe.
+        r_stb = Signal()
+        r_pending = Signal()
+        m.d.sync += r_pending.eq(r_stb)
+
+        # Other responses, pushed by the FSM when `push_ready`.
+        push = Signal()
+        push_data = Signal(8 * self._word_bytes)
+        push_last = Signal(range(self._word_bytes))
+        push_ready = Signal()
+
+        with m.If(r_pending):
+            m.d.comb += [
+                responses.w_en.eq(1),
+                responses.w_data.eq(self._bus.r_data),
+                responses.w_last.eq(self._word_bytes - 1),
+            ]
+        with m.Elif(status_valid):
+            m.d.comb += [
+                responses.w_en.eq(1),
+                responses.w_data.eq(status),
+            ]
+            with m.If(responses.w_rdy):
+                m.d.sync += status_valid.eq(0)
+        with m.Else():
+            m.d.comb += [
+                responses.w_en.eq(push),
+                responses.w_data.eq(push_data),
+                responses.w_last.eq(push_last),
+                push_ready.eq(responses.w_rdy),
+            ]
+
+        def send_status(next, value = 0x01):
+            with m.If(push_ready):
+                m.d.comb += [
+                    push.eq(1),
+                    push_data.eq(value),
+                ]
+            with m.Else():
+                m.d.sync += [
+                    status.eq(value),
+                    status_valid.eq(1),
+                ]
+            m.next = next
 
         with m.FSM() as fsm:
             with m.State('CMD'):
-                m.d.comb += self.input.ready.eq(1)
-
-                with m.If(self.input.valid):
-                    m.d.sync += cmd.eq(self.input.payload)
-                    m.next = 'DECODE'
-            
-            with m.State('DECODE'):
-                with m.Switch(cmd):
-                    # No-op
-                    with m.Case(0):
-                        m.next = 'CMD'
+                m.d.comb += rx_ready.eq(~status_valid)
 
-                    # Read
-                    with m.Case(0x40):
-                        m.d.sync += is_read.eq(1)
-                        self._send_status(m, 'ADDR_0')
+                cmd = rx_payload
 
-                    # Write
-                    with m.Case(0x80):
-                        m.d.sync += is_read.eq(0)
-                        self._send_status(m, 'ADDR_0')
+                with m.If(rx_valid & rx_ready):
+                    m.d.sync += [
+                        size.eq(cmd[0:2]),
+                        chunk.eq(0),
+                        byte.eq(0),
+                        is_poll.eq(0),
+                        is_rmw.eq(0),
+                        value.eq(0),
+                        mask.eq(0),
+                        operand.eq(0),
+                        field_byte.eq(0),
+                    ]
+
+                    with m.Switch(cmd):
+                        # No-op
+                        with m.Case(0):
+                            pass
 
-                    # Query capabilities
-                    with m.Case(0xc0):
-                        self._send_status(m, 'CAPABILITIES_0')
-                    
-                    # Reserved
-                    with m.Default():
-                        self._send_status(m, 'CMD', 0xff)
+                        # Read
+                        with m.Case(*(f'010-00{aa:02b}' for aa in self._access_sizes)):
+                            m.d.sync += [
+                                is_read.eq(1),
+                                increment.eq(0),
+                                count.eq(1),
+                            ]
+                            with m.If(cmd[4]):
+                                send_status('READ')
+                            with m.Else():
+                                send_status('ADDR_0')
+
+                        # Write
+                        with m.Case(*(f'100-00{aa:02b}' for aa in self._access_sizes)):
+                            m.d.sync += [
+                                is_read.eq(0),
+                                increment.eq(0),
+                                count.eq(1),
+                            ]
+                            with m.If(cmd[4]):
+                                send_status('WRITE')
+                            with m.Else():
+                                send_status('ADDR_0')
+
+                        if self._burst_width:
+                            # Nonincrementing/incrementing burst read
+                            with m.Case(*(f'010-{bb:02b}{aa:02b}' for bb in (1, 2) for aa in self._access_sizes)):
+                                m.d.sync += [
+                                    is_read.eq(1),
+                                    increment.eq(cmd[3]),
+                                    no_addr.eq(cmd[4]),
+                                ]
+                                send_status('LEN_0')
+
+                            # Nonincrementing/incrementing burst write
+                            with m.Case(*(f'100-{bb:02b}{aa:02b}' for bb in (1, 2) for aa in self._access_sizes)):
+                                m.d.sync += [
+                                    is_read.eq(0),
+                                    increment.eq(cmd[3]),
+                                    no_addr.eq(cmd[4]),
+                                ]
+                                send_status('LEN_0')
+
+                        if self._poll_timeout_width:
+                            # Poll; the status is only known once it's done
+                            with m.Case(*(f'001-00{aa:02b}' for aa in self._access_sizes)):
+                                m.d.sync += is_poll.eq(1)
+                                with m.If(cmd[4]):
+                                    m.next = 'MASK'
+                                with m.Else():
+                                    m.next = 'ADDR_0'
+
+                        if self._rmw:
+                            # Read-modify-write
+                            with m.Case(*(f'011-{oo:02b}{aa:02b}' for oo in range(4) for aa in self._access_sizes)):
+                                m.d.sync += [
+                                    is_rmw.eq(1),
+                                    rmw_op.eq(cmd[2:4]),
+                                ]
+                                with m.If(cmd[4]):
+                                    send_status('MASK')
+                                with m.Else():
+                                    send_status('ADDR_0')
+
+                        # Query capabilities
+                        with m.Case(0xc0):
+                            send_status('CAPABILITIES_0')
+
+                        # Reserved
+                        with m.Default():
+                            send_status('CMD', 0xff)
+
+            for i in range(0, self._burst_width, 8):
+                with m.State(f'LEN_{i}'):
+                    m.d.comb += rx_ready.eq(1)
+                    with m.If(rx_valid):
+                        m.d.sync += count[i:i+8].eq(rx_payload)
+                        if i < self._burst_width - 8:
+                            m.next = f'LEN_{i+8}'
+                        else:
+                            with m.If(no_addr):
+                                self._start_access(m, Cat(count[:i], rx_payload)[:len(count)], is_read)
+                            with m.Else():
+                                m.next = 'ADDR_0'
 
             for i in range(0, self._bus.signature.addr_width, 8):
                 with m.State(f'ADDR_{i}'):
-                    m.d.comb += self.input.ready.eq(1)
-                    with m.If(self.input.valid):
-                        m.d.sync += self._bus.addr[i:i+8].eq(self.input.payload)
-                        if i < len(self._bus.addr) - 8:
+                    m.d.comb += rx_ready.eq(1)
+                    with m.If(rx_valid):
+                        m.d.sync += addr[i:i+8].eq(rx_payload)
+                        if i < len(addr) - 8:
                             m.next = f'ADDR_{i+8}'
                         else:
-                            with m.If(is_read):
-                                m.next = 'READ'
-                            with m.Else():
-                                m.next = 'WRITE'
+                            if self._poll_timeout_width or self._rmw:
+                                with m.If(is_poll | is_rmw):
+                                    m.next = 'MASK'
+                                with m.Else():
+                                    self._start_access(m, count, is_read)
+                            else:
+                                self._start_access(m, count, is_read)
+
+            next_access = lambda next: self._next_access(m, count, increment, addr, chunk, last_chunk, next)
 
             with m.State('READ'):
-                m.d.comb += self._bus.r_stb.eq(1)
-                m.next = 'READ_CAPTURE'
+                # Strobe a bus word every cycle, as long as there's room for it and whatever is already queued.
+                with m.If(responses.level + r_pending + status_valid < responses.depth):
+                    m.d.comb += [
+                        r_stb.eq(1),
+                        self._bus.r_stb.eq(1),
+                    ]
+                    next_access('READ')
 
-            with m.State('READ_CAPTURE'):
-                m.d.sync += buf.eq(self._bus.r_data)
-                m.d.comb += [
-                    self.output.valid.eq(1),
-                    self.output.payload.eq(self._bus.r_data),
-                ]
-                with m.If(self.output.ready):
-                    m.next = 'CMD'
-                with m.Else():
-                    m.next = 'READ_WAIT'
+            with m.State('WRITE'):
+                taken, word, done = _stream.take_bytes(m, requests, buf, byte, self._word_bytes - 1)
+                with m.If(done):
+                    m.d.comb += [
+                        self._bus.w_data.eq(word),
+                        self._bus.w_stb.eq(1),
+                    ]
+                    m.d.sync += byte.eq(0)
+                    next_access('WRITE')
+                with m.Elif(taken != 0):
+                    m.d.sync += [
+                        buf.eq(word),
+                        byte.eq(byte + taken),
+                    ]
 
-            with m.State('READ_WAIT'):
-                m.d.comb += [
-                    self.output.valid.eq(1),
-                    self.output.payload.eq(buf),
-                ]
-                with m.If(self.output.ready):
-                    m.next = 'CMD'
+            if self._poll_timeout_width or self._rmw:
+                with m.State('MASK'):
+                    m.d.comb += rx_ready.eq(1)
+                    with m.If(rx_valid):
+                        m.d.sync += mask.word_select(field_byte, 8).eq(rx_payload)
+                        with m.If(field_byte == last_byte):
+                            m.d.sync += field_byte.eq(0)
+                            # Only masked writes have data.
+                            with m.If(is_rmw & (rmw_op != 0)):
+                                m.next = 'READ_VALUE'
+                            with m.Else():
+                                m.next = 'OPERAND'
+                        with m.Else():
+                            m.d.sync += field_byte.eq(field_byte + 1)
 
-            with m.State('WRITE'):
-                m.d.comb += self.input.ready.eq(1)
-                with m.If(self.input.valid):
+                with m.State('OPERAND'):
+                    m.d.comb += rx_ready.eq(1)
+                    with m.If(rx_valid):
+                        m.d.sync += operand.word_select(field_byte, 8).eq(rx_payload)
+                        with m.If(field_byte == last_byte):
+                            m.d.sync += field_byte.eq(0)
+                            if self._poll_timeout_width:
+                                with m.If(is_poll):
+                                    m.next = 'POLL_TIMEOUT_0'
+                                with m.Else():
+                                    m.next = 'READ_VALUE'
+                            else:
+                                m.next = 'READ_VALUE'
+                        with m.Else():
+                            m.d.sync += field_byte.eq(field_byte + 1)
+
+                for i in range(0, self._poll_timeout_width, 8):
+                    with m.State(f'POLL_TIMEOUT_{i}'):
+                        m.d.comb += rx_ready.eq(1)
+                        with m.If(rx_valid):
+                            m.d.sync += poll_timer[i:i+8].eq(rx_payload)
+                            m.next = f'POLL_TIMEOUT_{i+8}' if i < self._poll_timeout_width - 8 else 'READ_VALUE'
+
+                # Read the whole access in ascending order, counting down the poll timeout.
+                def count_down():
+                    if self._poll_timeout_width:
+                        with m.If(poll_timer != 0):
+                            m.d.sync += poll_timer.eq(poll_timer - 1)
+
+                with m.State('READ_VALUE'):
+                    count_down()
+                    m.d.comb += self._bus.r_stb.eq(1)
+                    m.next = 'CAPTURE_VALUE'
+
+                with m.State('CAPTURE_VALUE'):
+                    count_down()
+                    m.d.sync += value.word_select(chunk, 8 * self._word_bytes).eq(self._bus.r_data)
+                    with m.If(chunk == last_chunk):
+                        m.d.sync += chunk.eq(0)
+                        if self._poll_timeout_width and self._rmw:
+                            with m.If(is_rmw):
+                                m.next = 'RMW_WRITE'
+                            with m.Else():
+                                m.next = 'POLL_CHECK'
+                        else:
+                            m.next = 'RMW_WRITE' if self._rmw else 'POLL_CHECK'
+                    with m.Else():
+                        m.d.sync += chunk.eq(chunk + 1)
+                        m.next = 'READ_VALUE'
+
+            if self._poll_timeout_width:
+                with m.State('POLL_CHECK'):
+                    count_down()
+                    with m.If((value & mask) == operand):
+                        m.d.sync += poll_status.eq(0x01)
+                        m.next = 'POLL_STATUS'
+                    with m.Elif(poll_timer == 0):
+                        m.d.sync += poll_status.eq(0x02)
+                        m.next = 'POLL_STATUS'
+                    with m.Else():
+                        m.next = 'READ_VALUE'
+
+                with m.State('POLL_STATUS'):
                     m.d.comb += [
-                        self._bus.w_data.eq(self.input.payload),
+                        push.eq(1),
+                        push_data.eq(poll_status),
+                    ]
+                    with m.If(push_ready):
+                        m.next = 'POLL_DATA'
+
+                with m.State('POLL_DATA'):
+                    m.d.comb += [
+                        push.eq(1),
+                        push_data.eq(value.word_select(chunk, 8 * self._word_bytes)),
+                        push_last.eq(self._word_bytes - 1),
+                    ]
+                    with m.If(push_ready):
+                        with m.If(chunk == last_chunk):
+                            m.d.sync += chunk.eq(0)
+                            m.next = 'CMD'
+                        with m.Else():
+                            m.d.sync += chunk.eq(chunk + 1)
+
+            if self._rmw:
+                # Write the modified value back in ascending order, so the last chunk commits the whole register.
+                with m.State('RMW_WRITE'):
+                    m.d.comb += [
+                        self._bus.w_data.eq(modified.word_select(chunk, 8 * self._word_bytes)),
                         self._bus.w_stb.eq(1),
                     ]
-                    m.next = 'CMD'
+                    with m.If(chunk == last_chunk):
+                        m.d.sync += chunk.eq(0)
+                        m.next = 'CMD'
+                    with m.Else():
+                        m.d.sync += chunk.eq(chunk + 1)
 
             capabilities = [
-                0x80 | 1, # 8b mode
-                0x80 | 0,
+                0x80 | sum(1 << aa for aa in self._access_sizes) | 0x40 | (0x30 if self._burst_width else 0), # Access sizes, no-address mode, bursts
+                0x80 | self._burst_width,
                 0x80 | self._bus.signature.addr_width,
-                0x00 | self._bus.signature.data_width,
+                self._bus.signature.data_width,
             ]
+            if self._poll_timeout_width or self._rmw:
+                capabilities[-1] |= 0x80
+                capabilities += [
+                    0x80 | (0x01 if self._poll_timeout_width else 0) | (0x02 if self._rmw else 0), # Poll, read-modify-write
+                    self._poll_timeout_width,
+                ]
 
             for i, b in enumerate(capabilities):
                 with m.State(f'CAPABILITIES_{i}'):
                     m.d.comb += [
-                        self.output.valid.eq(1),
-                        self.output.payload.eq(b),
+                        push.eq(1),
+                        push_data.eq(b),
                     ]
 
-                    with m.If(self.output.ready):
+                    with m.If(push_ready):
                         m.next = f'CAPABILITIES_{i+1}' if i < len(capabilities) - 1 else 'CMD'
 
-            with m.State('ERROR'):
-                m.d.comb += [
-                    self.output.valid.eq(1),
-                    self.output.payload.eq(0xff),
-                ]
-
-                with m.If(self.output.ready):
-                    m.next = 'CMD'
+        # Done with every command it was given, and waiting for the next one.
+        m.d.comb += self.idle.eq(fsm.ongoing('CMD') & (requests.level == 0) & ~status_valid & ~r_pending & (responses.level == 0))
 
         return m
@@ -1,3 +1,7 @@
+import collections
+
+from amaranth import Signal
+from amaranth.lib import data
 from amaranth.sim import Simulator, SimulatorContext
 
 from katsuo.stream.sim import stream_put, stream_get
@@ -24,20 +28,153 @@ async def csr_bus_read(ctx: SimulatorContext, bus, addr):
 
     return data
 
-class SimBusClient:
+class _SimBatch(bridge.Batch):
+    def _commands(self, is_read: bool, size: int, addr: int, length: int, increment: bool, payload: bytes = b''):
+        assert self._client.capabilities.access_size(size)
+
+        future = bridge.Future()
+        self._ops.append((is_read, size, addr, length, increment, payload, future))
+        return future
+
+    async def flush(self):
+        pending, self._ops = self._ops, []
+
+        for is_read, size, addr, length, increment, payload, future in pending:
+            result = await self._client._access(is_read, size, addr, length, increment, payload)
+            future.set_result(result)
+
+class SimBusClient(bridge.Client):
+    """:class:`bridge.Client` accessing a CSR bus directly from a testbench, without going through a bridge.
+
+    Consecutive bus words are accessed with back-to-back strobes, one per cycle.
+    """
+
     def __init__(self, ctx: SimulatorContext, bus):
+        super().__init__(None)
         self._ctx = ctx
         self._bus = bus
-    
-    async def read_8b(self, addr: int, length: int = 1):
-        assert length == 1 # TODO: Relax this
-
-        return [await csr_bus_read(self._ctx, self._bus, addr)]
 
-    async def write_8b(self, addr: int, data: bytes | list, *, increment = True):
-        assert len(data) == 1
-
-        await csr_bus_write(self._ctx, self._bus, addr, data[0])
+        data_width = bus.signature.data_width
+        self._word_bytes = (data_width + 7) // 8
+        access_sizes = [(1 << aa) >= self._word_bytes for aa in range(4)]
+
+        self.capabilities = bridge.Capabilities(
+            *access_sizes,
+            burst_nonincr = True,
+            burst_incr = True,
+            # There's no length field, so bursts are not limited.
+            burst_width = 0x7f,
+            addr_width = bus.signature.addr_width,
+            data_width = data_width,
+        )
+
+    async def get_capabilities(self):
+        return self.capabilities
+
+    def batch(self):
+        return _SimBatch(self)
+
+    async def _access(self, is_read: bool, size: int, addr: int, length: int, increment: bool, payload: bytes):
+        ctx, bus = self._ctx, self._bus
+        access_words = self.capabilities.access_words(size)
+        mask = (1 << self.capabilities.addr_width) - 1
+
+        addrs = []
+        for i in range(length):
+            start = addr + i * access_words if increment else addr
+            addrs.extend((start + j) & mask for j in range(access_words))
+
+        tick = ctx.tick()
+
+        if is_read:
+            data = bytearray()
+            ctx.set(bus.r_stb, 1)
+            for word_addr in addrs:
+                ctx.set(bus.addr, word_addr)
+                await tick
+                data += ctx.get(bus.r_data).to_bytes(self._word_bytes, 'little')
+            ctx.set(bus.r_stb, 0)
+            return bridge._decode(size, bytes(data))
+
+        ctx.set(bus.w_stb, 1)
+        for i, word_addr in enumerate(addrs):
+            ctx.set(bus.addr, word_addr)
+            ctx.set(bus.w_data, int.from_bytes(payload[i * self._word_bytes:(i + 1) * self._word_bytes], 'little'))
+            await tick
+        ctx.set(bus.w_stb, 0)
+
+def _beat_bytes(stream):
+    """Number of bytes carried by each beat of a bridge stream."""
+    return len(stream.payload.data) // 8 if isinstance(stream.payload, data.View) else 1
+
+def _beats(stream, buf: bytes):
+    """Payloads carrying `buf` over a bridge stream, filling each beat."""
+    n = _beat_bytes(stream)
+    if n == 1:
+        return buf
+    return [{'data': int.from_bytes(buf[i:i + n], 'little'), 'count': len(buf[i:i + n])} for i in range(0, len(buf), n)]
+
+def _beat_data(stream, payload):
+    """Bytes carried by a payload received from a bridge stream."""
+    n = _beat_bytes(stream)
+    if n == 1:
+        return bytes([payload])
+    return payload.data.to_bytes(n, 'little')[:payload.count]
+
+async def stream_put_bytes(ctx: SimulatorContext, stream, data: bytes, *, gap = 0):
+    """Put a sequence of payloads, like calling `stream_put` for each with `gap` idle cycles before it.
+
+    On a wide stream, each beat is filled with as many bytes as it holds, with `gap` idle cycles before each beat.
+    """
+    data = _beats(stream, data)
+
+    if gap:
+        for payload in data:
+            await ctx.tick().repeat(gap)
+            await stream_put(ctx, stream, payload)
+        return
+
+    if not data:
+        return
+
+    # Keep valid asserted, and advance the payload on each transfer. The trigger is built once, as that's a
+    # significant part of the cost of each cycle.
+    ctx.set(stream.valid, 1)
+    ctx.set(stream.payload, data[0])
+    i = 0
+    tick = ctx.tick().sample(stream.ready)
+    while True:
+        _, _, ready = await tick
+        if ready:
+            i += 1
+            if i == len(data):
+                break
+            ctx.set(stream.payload, data[i])
+    ctx.set(stream.valid, 0)
+
+async def stream_get_bytes(ctx: SimulatorContext, stream, length: int, *, gap = 0):
+    """Get a sequence of payloads, like calling `stream_get` `length` times with `gap` idle cycles before each.
+
+    On a wide stream, beats are received with `gap` idle cycles before each until there are at least `length` bytes,
+    and all bytes of the last beat are returned.
+    """
+    buf = bytearray()
+
+    if gap:
+        while len(buf) < length:
+            await ctx.tick().repeat(gap)
+            buf += _beat_data(stream, await stream_get(ctx, stream))
+        return buf
+
+    # Keep ready asserted, and collect each transfer.
+    ctx.set(stream.ready, 1)
+    tick = ctx.tick().sample(stream.valid, stream.payload)
+    while len(buf) < length:
+        _, _, valid, payload = await tick
+        if valid:
+            buf += _beat_data(stream, payload)
+    ctx.set(stream.ready, 0)
+    return buf
 
 def tb_with_bridge_client(sim: Simulator, dut, *, input_stream_fc = 0, output_stream_fc = 0):
     def wrapper(f):
@@ -45,28 +182,35 @@ def tb_with_bridge_client(sim: Simulator, dut, *, input_stream_fc = 0, output_st
             def __init__(self):
                 sim.add_testbench(self._input_testbench, background = True)
                 sim.add_testbench(self._output_testbench)
-                self.input_queue = []
+                self.input_queue = collections.deque()
+
+                # Bytes received past the end of the last `recv`, from the end of a wide beat.
+                self._rx_buffer = bytearray()
+
+                # Toggled to wake up the input testbench.
+                self._doorbell = Signal()
             
             async def send(self, data: bytes):
                 self.input_queue.extend(data)
+                self.ctx.set(self._doorbell, 1 - self.ctx.get(self._doorbell))
 
             async def recv(self, n = 1):
-                buf = bytearray()
-                for _ in range(n):
-                    if output_stream_fc:
-                        await self.ctx.tick().repeat(output_stream_fc)
-                    buf.append(await stream_get(self.ctx, dut.output))
-                return buf
+                if len(self._rx_buffer) < n:
+                    self._rx_buffer += await stream_get_bytes(self.ctx, dut.output, n - len(self._rx_buffer), gap = output_stream_fc)
+                res = bytes(self._rx_buffer[:n])
+                del self._rx_buffer[:n]
+                return res
             
             async def _input_testbench(self, ctx: SimulatorContext):
                 while True:
+                    if not self.input_queue:
+                        await ctx.changed(self._doorbell)
                     await ctx.tick()
-                    if self.input_queue:
-                        with ctx.critical():
-                            while self.input_queue:
-                                if input_stream_fc:
-                                    await ctx.tick().repeat(input_stream_fc)
-                                await stream_put(ctx, dut.input, self.input_queue.pop(0))
+                    with ctx.critical():
+                        while self.input_queue:
+                            data = bytes(self.input_queue)
+                            self.input_queue.clear()
+                            await stream_put_bytes(ctx, dut.input, data, gap = input_stream_fc)
 
             async def _output_testbench(self, ctx: SimulatorContext):
                 self.ctx = ctx
@@ -0,0 +1,393 @@
+from amaranth import *
+from amaranth.lib import wiring
+
+from amaranth_soc import wishbone
+
+from . import _stream
+from ._response import ResponseQueue
+
+from . import annotations as _annotations
+
+class Bridge(wiring.Component):
+    """Bridge to a Wishbone bus, speaking the same protocol as :class:`.csr.Bridge`.
+
+    The bus is presented as byte addressed with 8-bit data, and accesses of every size are supported. Accesses are
+    naturally aligned; accesses narrower than the bus select their byte lanes with `sel`, and wider ones span
+    consecutive bus words. Each bus word is held until it's acked, and the next one is issued in the same cycle, so
+    wait states only stall the bridge when the response queue or the request data can't keep up. With the `cti` and
+    `bte` features, consecutive bus words are issued as incrementing bursts; the bus cycle is only held open between
+    bus words issued back to back, so a burst waiting for the link ends, and lets other masters have the bus.
+
+    Only classic bus cycles are supported, with registered feedback bursts through `cti`: there's a single bus word in
+    flight, and no pipelined mode or `stall`. A bus word per cycle therefore needs a slave that acks back to back
+    during a burst.
+
+    `idle` is high while the bridge waits for a command, with nothing left to do or send for the previous ones.
+    """
+
+    def __init__(self, bus: wishbone.Interface, *, burst_width = 8, stream_width = 8):
+        super().__init__({
+            'input': wiring.In(_stream.signature(stream_width)),
+            'output': wiring.Out(_stream.signature(stream_width)),
+            'idle': wiring.Out(1),
+        })
+
+        assert isinstance(wiring.flipped(bus), wishbone.Interface)
+        assert 0 <= burst_width < 0x80
+
+        self._bus = bus
+        self._burst_width = burst_width
+        self._stream_width = stream_width
+
+        data_width = bus.signature.data_width
+        assert data_width in (8, 16, 32, 64), f'Unsupported bus width: {data_width}'
+        assert bus.signature.granularity == 8, f'Unsupported bus granularity: {bus.signature.granularity}'
+
+        features = bus.signature.features
+        assert features <= {wishbone.Feature.CTI, wishbone.Feature.BTE}, f'Unsupported bus features: {features}'
+        self._bursts = wishbone.Feature.CTI in features
+
+        # Number of byte lanes per bus word, and address bits selecting one.
+        self._word_bytes = data_width // 8
+        self._lane_bits = self._word_bytes.bit_length() - 1
+
+        self._addr_width = bus.signature.addr_width + self._lane_bits
+        assert self._addr_width < 0x80
+
+    def _start_access(self, m, count, is_read):
+        with m.If(count == 0):
+            m.next = 'CMD'
+        with m.Elif(is_read):
+            m.next = 'READ'
+        with m.Else():
+            m.next = 'WRITE'
+
+    def _next_access(self, m, count, increment, addr, size, chunk, last_chunk, next):
+        with m.If(chunk == last_chunk):
+            m.d.sync += [
+                chunk.eq(0),
+                count.eq(count - 1),
+            ]
+            with m.If(increment):
+                m.d.sync += addr.eq(addr + (1 << size))
+            with m.If(count == 1):
+                m.next = 'CMD'
+            with m.Else():
+                m.next = next
+        with m.Else():
+            m.d.sync += chunk.eq(chunk + 1)
+            m.next = next
+
+    def elaborate(self, platform):
+        m = Module()
+
+        bus = self._bus
+
+        is_read = Signal()
+        increment = Signal()
+        no_addr = Signal()
+        size = Signal(2)
+
+        # Remaining number of accesses in the current command.
+        count = Signal(max(self._burst_width, 1))
+
+        # Byte address of the current access, kept between commands for no-address mode.
+        addr = Signal(self._addr_width)
+
+        # Bus word within the current access.
+        chunk = Signal(range(8))
+        last_chunk = Signal(range(8))
+
+        # Byte within the current bus word, and byte lanes used by the current access.
+        byte = Signal(range(self._word_bytes))
+        last_byte = Signal(range(self._word_bytes))
+        lane = Signal(range(self._word_bytes))
+        sel = Signal(self._word_bytes)
+
+        buf = Signal(8 * self._word_bytes)
+
+        with m.Switch(size):
+            for aa in range(4):
+                with m.Case(aa):
+                    if (1 << aa) < self._word_bytes:
+                        # Narrow accesses use the byte lanes of their aligned address.
+                        m.d.comb += [
+                            last_byte.eq((1 << aa) - 1),
+                            lane.eq(addr[aa:self._lane_bits] << aa),
+                            sel.eq(C((1 << (1 << aa)) - 1, self._word_bytes) << lane),
+                        ]
+                    else:
+                        m.d.comb += [
+                            last_chunk.eq((1 << aa) // self._word_bytes - 1),
+                            last_byte.eq(self._word_bytes - 1),
+                            sel.eq((1 << self._word_bytes) - 1),
+                        ]
+
+        # Bus word in flight, held until it's acked.
+        req_stb = Signal()
+        req_we = Signal()
+        req_adr = Signal(bus.signature.addr_width)
+        req_sel = Signal(self._word_bytes)
+        req_dat = Signal(8 * self._word_bytes)
+        req_lane = Signal(range(self._word_bytes))
+        req_last = Signal(range(self._word_bytes))
+
+        # Whether a burst is in progress, keeping the bus cycle open between bus words.
+        in_burst = Signal()
+
+        # Whether a bus word is issued in this cycle.
+        issuing = Signal()
+
+        m.d.comb += [
+            bus.cyc.eq(req_stb | in_burst),
+            bus.stb.eq(req_stb),
+            bus.we.eq(req_we),
+            bus.adr.eq(req_adr),
+            bus.sel.eq(req_sel),
+            bus.dat_w.eq(req_dat),
+        ]
+
+        with m.If(bus.ack):
+            m.d.sync += req_stb.eq(0)
+
+        # A new bus word can be issued in the cycle the previous one is acked.
+        req_free = Signal()
+        m.d.comb += req_free.eq(~req_stb | bus.ack)
+
+        # A burst that doesn't continue right away, while waiting for request data or room for responses, ends here.
+        with m.If(req_free & ~issuing):
+            m.d.sync += in_burst.eq(0)
+
+        # Read data is pushed as it's acked; until then, it holds back any other response.
+        r_busy = Signal()
+        r_ack = Signal()
+        m.d.comb += [
+            r_busy.eq(req_stb & ~req_we),
+            r_ack.eq(r_busy & bus.ack),
+        ]
+
+        if self._bursts:
+            cti = Signal(wishbone.CycleType)
+            m.d.comb += bus.cti.eq(cti)
+        if wishbone.Feature.BTE in bus.signature.features:
+            m.d.comb += bus.bte.eq(wishbone.BurstTypeExt.LINEAR)
+
+        def issue(we, data = 0):
+            m.d.comb += issuing.eq(1)
+            m.d.sync += [
+                req_stb.eq(1),
+                req_we.eq(we),
+                req_adr.eq(addr[self._lane_bits:] + chunk),
+                req_sel.eq(sel),
+                req_dat.eq(data),
+                req_lane.eq(lane),
+                req_last.eq(last_byte),
+            ]
+
+            if self._bursts:
+                # Bus words of an access, or of an incrementing burst of accesses at least a bus word wide, are consecutive.
+                more = Signal()
+                m.d.comb += more.eq((chunk != last_chunk) | (increment & (count != 1) & (sel == (1 << self._word_bytes) - 1)))
+                m.d.sync += in_burst.eq(more)
+                with m.If(more):
+                    m.d.sync += cti.eq(wishbone.CycleType.INCR_BURST)
+                with m.Elif(in_burst):
+                    m.d.sync += cti.eq(wishbone.CycleType.END_OF_BURST)
+                with m.Else():
+                    m.d.sync += cti.eq(wishbone.CycleType.CLASSIC)
+
+        # Request bytes, taken one per cycle, or a beat at a time by writes.
+        m.submodules.requests = requests = _stream.RequestWindow(self._stream_width)
+        wiring.connect(m, wiring.flipped(self.input), requests.input)
+
+        rx_valid = Signal()
+        rx_payload = Signal(8)
+        rx_ready = Signal()
+        m.d.comb += [
+            rx_valid.eq(requests.level != 0),
+            rx_payload.eq(requests.data[:8]),
+            requests.take.eq(rx_ready),
+        ]
+
+        m.submodules.responses = responses = ResponseQueue(self._word_bytes, stream_width = self._stream_width)
+        wiring.connect(m, responses.output, wiring.flipped(self.output))
+
+        # Status byte held back by a full queue, or by read data still in flight.
+        status = Signal(8)
+        status_valid = Signal()
+
+        # Other responses, pushed by the FSM when `push_ready`.
+        push = Signal()
+        push_data = Signal(8)
+        push_ready = Signal()
+
+        with m.If(r_ack):
+            m.d.comb += [
+                responses.w_en.eq(1),
+                responses.w_data.eq(bus.dat_r >> (req_lane * 8)),
+                responses.w_last.eq(req_last),
+            ]
+        with m.Elif(r_busy):
+            pass
+        with m.Elif(status_valid):
+            m.d.comb += [
+                responses.w_en.eq(1),
+                responses.w_data.eq(status),
+            ]
+            with m.If(responses.w_rdy):
+                m.d.sync += status_valid.eq(0)
+        with m.Else():
+            m.d.comb += [
+                responses.w_en.eq(push),
+                responses.w_data.eq(push_data),
+                push_ready.eq(responses.w_rdy),
+            ]
+
+        def send_status(next, value = 0x01):
+            with m.If(push_ready):
+                m.d.comb += [
+                    push.eq(1),
+                    push_data.eq(value),
+                ]
+            with m.Else():
+                m.d.sync += [
+                    status.eq(value),
+                    status_valid.eq(1),
+                ]
+            m.next = next
+
+        with m.FSM() as fsm:
+            with m.State('CMD'):
+                m.d.comb += rx_ready.eq(~status_valid)
+
+                cmd = rx_payload
+
+                with m.If(rx_valid & rx_ready):
+                    m.d.sync += [
+                        size.eq(cmd[0:2]),
+                        chunk.eq(0),
+                        byte.eq(0),
+                    ]
+
+                    with m.Switch(cmd):
+                        # No-op
+                        with m.Case(0):
+                            pass
+
+                        # Read
+                        with m.Case('010-00--'):
+                            m.d.sync += [
+                                is_read.eq(1),
+                                increment.eq(0),
+                                count.eq(1),
+                            ]
+                            with m.If(cmd[4]):
+                                send_status('READ')
+                            with m.Else():
+                                send_status('ADDR_0')
+
+                        # Write
+                        with m.Case('100-00--'):
+                            m.d.sync += [
+                                is_read.eq(0),
+                                increment.eq(0),
+                                count.eq(1),
+                            ]
+                            with m.If(cmd[4]):
+                                send_status('WRITE')
+                            with m.Else():
+                                send_status('ADDR_0')
+
+                        if self._burst_width:
+                            # Nonincrementing/incrementing burst read
+                            with m.Case('010-01--', '010-10--'):
+                                m.d.sync += [
+                                    is_read.eq(1),
+                                    increment.eq(cmd[3]),
+                                    no_addr.eq(cmd[4]),
+                                ]
+                                send_status('LEN_0')
+
+                            # Nonincrementing/incrementing burst write
+                            with m.Case('100-01--', '100-10--'):
+                                m.d.sync += [
+                                    is_read.eq(0),
+                                    increment.eq(cmd[3]),
+                                    no_addr.eq(cmd[4]),
+                                ]
+                                send_status('LEN_0')
+
+                        # Query capabilities
+                        with m.Case(0xc0):
+                            send_status('CAPABILITIES_0')
+
+                        # Reserved
+                        with m.Default():
+                            send_status('CMD', 0xff)
+
+            for i in range(0, self._burst_width, 8):
+                with m.State(f'LEN_{i}'):
+                    m.d.comb += rx_ready.eq(1)
+                    with m.If(rx_valid):
+                        m.d.sync += count[i:i+8].eq(rx_payload)
+                        if i < self._burst_width - 8:
+                            m.next = f'LEN_{i+8}'
+                        else:
+                            with m.If(no_addr):
+                                self._start_access(m, Cat(count[:i], rx_payload)[:len(count)], is_read)
+                            with m.Else():
+                                m.next = 'ADDR_0'
+
+            for i in range(0, self._addr_width, 8):
+                with m.State(f'ADDR_{i}'):
+                    m.d.comb += rx_ready.eq(1)
+                    with m.If(rx_valid):
+                        m.d.sync += addr[i:i+8].eq(rx_payload)
+                        if i < len(addr) - 8:
+                            m.next = f'ADDR_{i+8}'
+                        else:
+                            self._start_access(m, count, is_read)
+
+            next_access = lambda next: self._next_access(m, count, increment, addr, size, chunk, last_chunk, next)
+
+            with m.State('READ'):
+                # Issue a bus word as soon as the previous one is acked, as long as there's room for its data. A held back
+                # status goes first, as it's sent before the data.
+                with m.If(req_free & ~status_valid & (responses.level + r_busy < responses.depth)):
+                    issue(we = 0)
+                    next_access('READ')
+
+            with m.State('WRITE'):
+                # Collect the next bus word while the previous one is in flight.
+                taken, word, done = _stream.take_bytes(m, requests, buf, byte, last_byte, can_finish = req_free)
+                with m.If(done):
+                    issue(we = 1, data = word << (lane * 8))
+                    m.d.sync += byte.eq(0)
+                    next_access('WRITE')
+                with m.Elif(taken != 0):
+                    m.d.sync += [
+                        buf.eq(word),
+                        byte.eq(byte + taken),
+                    ]
+
+            capabilities = [
+                0x80 | 0x0f | 0x40 | (0x30 if self._burst_width else 0), # Access sizes, no-address mode, bursts
+                0x80 | self._burst_width,
+                0x80 | self._addr_width,
+                8,
+            ]
+
+            for i, b in enumerate(capabilities):
+                with m.State(f'CAPABILITIES_{i}'):
+                    m.d.comb += [
+                        push.eq(1),
+                        push_data.eq(b),
+                    ]
+
+                    with m.If(push_ready):
+                        m.next = f'CAPABILITIES_{i+1}' if i < len(capabilities) - 1 else 'CMD'
+
+        # Done with every command it was given, and waiting for the next one.
+        m.d.comb += self.idle.eq(fsm.ongoing('CMD') & (requests.level == 0) & ~status_valid & ~req_stb & (responses.level == 0))
+
+        return m
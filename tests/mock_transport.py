@@ -0,0 +1,161 @@
+import asyncio
+import time
+
+class MockTransport:
+    """Transport backed by a Python model of `csr.Bridge` on an 8-bit bus, with optional link latency.
+
+    Responses to a `send` become available `latency` seconds after it. As memory doesn't change on its own, a poll
+    command reads once and times out unless it matches.
+    """
+
+    def __init__(self, *, addr_width = 16, burst_width = 8, no_addr = True, access_sizes = (0, 1, 2, 3), poll_timeout_width = 0, rmw = False, latency = 0):
+        self.addr_width = addr_width
+        self.burst_width = burst_width
+        self.no_addr = no_addr
+        self.access_sizes = access_sizes
+        self.poll_timeout_width = poll_timeout_width
+        self.rmw = rmw
+        self.latency = latency
+
+        self.memory = bytearray(1 << addr_width)
+
+        # Statistics.
+        self.sends = 0
+        self.commands = 0
+
+        self._rx_buffer = bytearray()
+        self._ready_at = 0
+        self._parser = self._parse()
+        next(self._parser)
+
+    def _capabilities(self):
+        flags = sum(1 << aa for aa in self.access_sizes)
+        if self.burst_width:
+            flags |= 0x30
+        if self.no_addr:
+            flags |= 0x40
+        if self.poll_timeout_width or self.rmw:
+            extended_flags = (0x01 if self.poll_timeout_width else 0) | (0x02 if self.rmw else 0)
+            return bytes([0x80 | flags, 0x80 | self.burst_width, 0x80 | self.addr_width, 0x88, 0x80 | extended_flags, self.poll_timeout_width])
+        return bytes([0x80 | flags, 0x80 | self.burst_width, 0x80 | self.addr_width, 8])
+
+    def _parse(self):
+        addr = 0
+        mask = len(self.memory) - 1
+
+        while True:
+            cmd = yield
+
+            if cmd == 0x00:
+                continue
+
+            self.commands += 1
+
+            if cmd == 0xc0:
+                self._rx_buffer.append(0x01)
+                self._rx_buffer.extend(self._capabilities())
+                continue
+
+            kind, no_addr, burst, size = cmd >> 6, (cmd >> 4) & 1, (cmd >> 2) & 3, cmd & 3
+
+            if cmd & 0xec == 0x20 and self.poll_timeout_width and size in self.access_sizes and (self.no_addr or not no_addr):
+                if not no_addr:
+                    addr = 0
+                    for i in range((self.addr_width + 7) // 8):
+                        addr |= (yield) << (8 * i)
+                    addr &= mask
+
+                fields = bytearray()
+                for _ in range((2 << size) + (self.poll_timeout_width + 7) // 8):
+                    fields.append((yield))
+                poll_mask = int.from_bytes(fields[:1 << size], 'little')
+                poll_match = int.from_bytes(fields[1 << size:2 << size], 'little')
+
+                data = bytes(self.memory[(addr + i) & mask] for i in range(1 << size))
+                self._rx_buffer.append(0x01 if int.from_bytes(data, 'little') & poll_mask == poll_match else 0x02)
+                self._rx_buffer.extend(data)
+                continue
+
+            if cmd & 0xe0 == 0x60 and self.rmw and size in self.access_sizes and (self.no_addr or not no_addr):
+                self._rx_buffer.append(0x01)
+
+                if not no_addr:
+                    addr = 0
+                    for i in range((self.addr_width + 7) // 8):
+                        addr |= (yield) << (8 * i)
+                    addr &= mask
+
+                fields = bytearray()
+                for _ in range((2 << size) if burst == 0 else (1 << size)):
+                    fields.append((yield))
+                rmw_mask = int.from_bytes(fields[:1 << size], 'little')
+                rmw_data = int.from_bytes(fields[1 << size:], 'little')
+
+                value = int.from_bytes(bytes(self.memory[(addr + i) & mask] for i in range(1 << size)), 'little')
+                value = [
+                    (value & ~rmw_mask) | (rmw_data & rmw_mask),
+                    value | rmw_mask,
+                    value & ~rmw_mask,
+                    value ^ rmw_mask,
+                ][burst]
+                for i, b in enumerate(value.to_bytes(1 << size, 'little')):
+                    self.memory[(addr + i) & mask] = b
+                continue
+
+            if (kind not in (1, 2) or cmd & 0x20 or burst == 3 or size not in self.access_sizes
+                    or (burst and not self.burst_width) or (no_addr and not self.no_addr)):
+                self._rx_buffer.append(0xff)
+                continue
+
+            self._rx_buffer.append(0x01)
+
+            count = 1
+            if burst:
+                count = 0
+                for i in range((self.burst_width + 7) // 8):
+                    count |= (yield) << (8 * i)
+                count &= (1 << self.burst_width) - 1
+
+            if not no_addr:
+                addr = 0
+                for i in range((self.addr_width + 7) // 8):
+                    addr |= (yield) << (8 * i)
+                addr &= mask
+
+            for _ in range(count):
+                for i in range(1 << size):
+                    if kind == 1:
+                        self._rx_buffer.append(self.memory[(addr + i) & mask])
+                    else:
+                        self.memory[(addr + i) & mask] = yield
+                if burst == 2:
+                    addr = (addr + (1 << size)) & mask
+
+    async def send(self, data: bytes):
+        self.write(data)
+
+    def write(self, data: bytes):
+        self.sends += 1
+        for b in data:
+            self._parser.send(b)
+        self._ready_at = time.monotonic() + self.latency
+
+    def read(self, length = 1):
+        assert len(self._rx_buffer) >= length, 'Waiting for a response that will never arrive'
+
+        delay = self._ready_at - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+        res, self._rx_buffer = bytes(self._rx_buffer[:length]), self._rx_buffer[length:]
+        return res
+
+    async def recv(self, length = 1):
+        assert len(self._rx_buffer) >= length, 'Waiting for a response that will never arrive'
+
+        delay = self._ready_at - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        res, self._rx_buffer = bytes(self._rx_buffer[:length]), self._rx_buffer[length:]
+        return res
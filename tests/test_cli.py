@@ -0,0 +1,98 @@
+import csv
+import json
+
+from click.testing import CliRunner
+
+from katsuo.bridge.cli import main, options
+
+from mock_transport import MockTransport
+from test_csr_client import csr_annotations
+from test_metadata import write_metadata
+
+def gpio_metadata(path):
+    # Registers of a GPIO peripheral with 8 pins.
+    write_metadata(path, csr_annotations([
+        (('Mode',), 0x0, 0x2),
+        (('Input',), 0x2, 0x3),
+        (('Output',), 0x3, 0x4),
+        (('SetClr',), 0x4, 0x6),
+    ], addr_width = 8, data_width = 8, access = {
+        ('Mode',): 'rw',
+        ('Input',): 'r',
+        ('Output',): 'rw',
+        ('SetClr',): 'w',
+    }))
+
+def test_csr_dump_load(tmp_path, monkeypatch):
+    metadata = tmp_path / 'soc.json'
+    gpio_metadata(metadata)
+    args = ['-t', 'mock://', '-m', str(metadata), 'csr']
+
+    # Every invocation opens the same transport, so the register contents persist.
+    transport = MockTransport(addr_width = 8)
+    monkeypatch.setattr(options, 'open_url', lambda url: transport)
+
+    runner = CliRunner()
+
+    snapshot = [
+        {'path': 'Mode', 'offset': 0, 'width': 16, 'value': 0x5555},
+        {'path': 'Input', 'offset': 2, 'width': 8, 'value': 0x12},
+        {'path': 'Output', 'offset': 3, 'width': 8, 'value': 0xa5},
+    ]
+    (tmp_path / 'snapshot.json').write_text(json.dumps(snapshot))
+
+    # The read-only Input register is skipped.
+    result = runner.invoke(main, [*args, 'load', str(tmp_path / 'snapshot.json')])
+    assert result.exit_code == 0, result.output
+    assert '2 registers' in result.output and '1 round trips' in result.output
+    assert transport.memory[0:4] == bytes([0x55, 0x55, 0x00, 0xa5])
+
+    transport.memory[2] = 0x12
+
+    result = runner.invoke(main, [*args, 'dump', '-o', str(tmp_path / 'dump.json')])
+    assert result.exit_code == 0, result.output
+    assert '3 registers' in result.output and '1 round trips' in result.output
+    dump = json.loads((tmp_path / 'dump.json').read_text())
+    assert [row['path'] for row in dump] == ['Mode', 'Input', 'Output']
+    assert [row['value'] for row in dump] == [0x5555, 0x12, 0xa5]
+
+    # Adjacent registers are read in a single burst.
+    commands = transport.commands
+    result = runner.invoke(main, [*args, 'dump'])
+    assert transport.commands == commands + 2
+
+    # CSV, for some of the registers.
+    result = runner.invoke(main, [*args, 'dump', '-f', 'csv', '-o', str(tmp_path / 'dump.csv'), 'Output', 'Mode'])
+    assert result.exit_code == 0, result.output
+    rows = [*csv.DictReader((tmp_path / 'dump.csv').read_text().splitlines())]
+    assert rows == [
+        {'path': 'Mode', 'offset': '0x0', 'width': '16', 'value': '0x5555'},
+        {'path': 'Output', 'offset': '0x3', 'width': '8', 'value': '0xa5'},
+    ]
+
+    (tmp_path / 'dump.csv').write_text((tmp_path / 'dump.csv').read_text().replace('0x5555', '0x1111'))
+    result = runner.invoke(main, [*args, 'load', str(tmp_path / 'dump.csv')])
+    assert result.exit_code == 0, result.output
+    result = runner.invoke(main, [*args, 'read', 'Mode'])
+    assert 'Mode: 0x1111' in result.output
+
+    result = runner.invoke(main, [*args, 'dump', 'Nonexistent'])
+    assert result.exit_code != 0
+
+def test_transport_closed(monkeypatch):
+    class Transport(MockTransport):
+        entered = exited = 0
+
+        def __enter__(self):
+            self.entered += 1
+            return self
+
+        def __exit__(self, exc_type, exc_value, traceback):
+            self.exited += 1
+
+    transport = Transport()
+    monkeypatch.setattr(options, 'open_url', lambda url: transport)
+
+    result = CliRunner().invoke(main, ['-t', 'mock://', 'capabilities'])
+    assert result.exit_code == 0, result.output
+    assert (transport.entered, transport.exited) == (1, 1)
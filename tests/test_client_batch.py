@@ -0,0 +1,462 @@
+import asyncio
+import time
+import pytest
+
+from katsuo.bridge.client import bridge
+from katsuo.bridge.client.bridge import Client, SyncClient
+
+from mock_transport import MockTransport
+
+def test_batch():
+    async def main():
+        transport = MockTransport()
+        client = Client(transport)
+        await client.get_capabilities()
+
+        transport.memory[0x1000:0x1004] = bytes([0x11, 0x22, 0x33, 0x44])
+        sends = transport.sends
+
+        async with client.batch() as batch:
+            f1 = batch.read_8b(0x1000)
+            f2 = batch.write_8b(0x2000, [0xaa, 0xbb])
+            f3 = batch.read_16b(0x2000)
+            f4 = batch.read_32b(0x1000)
+            f5 = batch.write_8b(0x2002, [])
+
+            assert not f1.done()
+
+        assert transport.sends == sends + 1
+
+        assert f1.result() == [0x11]
+        assert await f2 is None
+        assert f3.result() == [0xbbaa]
+        assert await f4 == [0x44332211]
+        assert f5.done()
+
+        # Empty batches don't touch the transport.
+        async with client.batch():
+            pass
+        assert transport.sends == sends + 1
+
+    asyncio.run(main())
+
+def test_batch_latency():
+    latency = 2e-3
+    n = 32
+
+    async def main():
+        transport = MockTransport(latency = latency)
+        client = Client(transport)
+        await client.get_capabilities()
+
+        transport.memory[:n] = bytes(range(n))
+
+        round_trips = client.round_trips
+        start = time.monotonic()
+        for i in range(n):
+            assert await client.read_8b(i) == [i]
+        sequential = time.monotonic() - start
+        assert client.round_trips == round_trips + n
+
+        round_trips = client.round_trips
+        start = time.monotonic()
+        async with client.batch() as batch:
+            futures = [batch.read_8b(i) for i in range(n)]
+        batched = time.monotonic() - start
+        assert client.round_trips == round_trips + 1
+
+        assert [f.result() for f in futures] == [[i] for i in range(n)]
+
+        # Timing is only reported, as wall-clock time on a shared machine is too noisy to assert on.
+        print(f'{n} reads with {latency * 1e3:.1f} ms latency: sequential {sequential * 1e3:.1f} ms, batched {batched * 1e3:.1f} ms ({sequential / batched:.1f}x)')
+
+    asyncio.run(main())
+
+def test_burst_read_write():
+    async def main():
+        transport = MockTransport()
+        client = Client(transport)
+        await client.get_capabilities()
+
+        data = bytes(i * 7 & 0xff for i in range(4096))
+        transport.memory[0x4000:0x5000] = data
+
+        # A 4 KiB window is read in a single round trip.
+        sends, commands = transport.sends, transport.commands
+        assert await client.read_8b(0x4000, len(data)) == list(data)
+        assert transport.sends == sends + 1
+        assert transport.commands == commands + 17
+
+        # Writes accept bytes and memoryviews.
+        await client.write_8b(0x6000, memoryview(data)[:1000])
+        assert transport.memory[0x6000:0x6000 + 1000] == data[:1000]
+        await client.write_8b(0x7000, data[:300])
+        assert transport.memory[0x7000:0x7000 + 300] == data[:300]
+
+        # Wide accesses.
+        assert await client.read_32b(0x4000, 3) == [int.from_bytes(data[i:i + 4], 'little') for i in range(0, 12, 4)]
+        await client.write_16b(0x8000, [0x1234, 0x5678])
+        assert transport.memory[0x8000:0x8004] == bytes([0x34, 0x12, 0x78, 0x56])
+
+        # Nonincrementing accesses.
+        assert await client.read_8b(0x4001, 300, increment = False) == [data[1]] * 300
+        await client.write_8b(0x9000, [1, 2, 3], increment = False)
+        assert transport.memory[0x9000:0x9003] == bytes([3, 0, 0])
+
+        assert await client.read_8b(0x4000, 0) == []
+
+    asyncio.run(main())
+
+def test_burst_fallback():
+    async def main():
+        # Narrow burst length field and no burst support at all.
+        for burst_width, no_addr in [(4, True), (0, True), (0, False)]:
+            transport = MockTransport(burst_width = burst_width, no_addr = no_addr)
+            client = Client(transport)
+            await client.get_capabilities()
+
+            data = bytes(range(100))
+            sends = transport.sends
+            await client.write_8b(0x100, data)
+            assert await client.read_8b(0x100, 100) == list(data)
+            assert await client.read_8b(0x105, 3, increment = False) == [5] * 3
+            assert transport.sends == sends + 3
+
+    asyncio.run(main())
+
+def test_poll():
+    async def main():
+        transport = MockTransport(poll_timeout_width = 16)
+        client = Client(transport)
+        capabilities = await client.get_capabilities()
+        assert capabilities.poll
+        assert capabilities.poll_timeout_width == 16
+
+        transport.memory[0x100:0x104] = bytes([0x5a, 0x01, 0x00, 0x80])
+
+        sends = transport.sends
+        assert await client.poll_8b(0x100, 0x0f, 0x0a) == (0x5a, False)
+        assert await client.poll_8b(0x100, 0x0f, 0x05, timeout = 100) == (0x5a, True)
+        assert await client.poll_32b(0x100, 0x80000001, 0x80000001, timeout = 0) == (0x8000015a, True)
+        assert await client.poll_16b(0x100, 0x0100, 0x0100) == (0x015a, False)
+        assert transport.sends == sends + 4
+
+        # Polls can be batched with other commands.
+        async with client.batch() as batch:
+            read = batch.read_8b(0x101)
+            poll = batch.poll_8b(0x103, 0x80, 0x80)
+        assert read.result() == [0x01]
+        assert poll.result() == (0x80, False)
+
+        # Without bridge support, the host reads until the condition holds or `timeout` more reads are done.
+        transport = MockTransport()
+        client = Client(transport)
+        await client.get_capabilities()
+        assert not client.capabilities.poll
+
+        transport.memory[0x100] = 0x5a
+        commands = transport.commands
+        assert await client.poll_8b(0x100, 0x0f, 0x0a) == (0x5a, False)
+        assert await client.poll_8b(0x100, 0x0f, 0x05, timeout = 3) == (0x5a, True)
+        assert transport.commands == commands + 5
+
+    asyncio.run(main())
+
+def test_rmw():
+    async def main():
+        for rmw in [True, False]:
+            transport = MockTransport(rmw = rmw)
+            client = Client(transport)
+            capabilities = await client.get_capabilities()
+            assert capabilities.rmw == rmw
+
+            transport.memory[0x100:0x102] = bytes([0x0f, 0xf0])
+            commands = transport.commands
+
+            await client._rmw(bridge._RMW_SET, 1, 0x100, 0x0100)
+            await client._rmw(bridge._RMW_CLEAR, 0, 0x100, 0x01)
+            await client._rmw(bridge._RMW_TOGGLE, 0, 0x101, 0xff)
+            assert transport.memory[0x100:0x102] == bytes([0x0e, 0x0e])
+
+            # A masked write covering the whole access doesn't need the old value.
+            await client._rmw(bridge._RMW_WRITE, 0, 0x100, 0xff, 0x42)
+            assert transport.memory[0x100] == 0x42
+
+            assert transport.commands == commands + (4 if rmw else 7)
+
+    asyncio.run(main())
+
+def test_concurrent_callers():
+    async def main():
+        transport = MockTransport(latency = 1e-3)
+        client = Client(transport)
+        await client.get_capabilities()
+
+        transport.memory[:256] = bytes(range(256))
+
+        # Concurrent callers share round trips without mixing up their responses.
+        async def read_write(i):
+            assert await client.read_8b(i) == [i]
+            await client.write_16b(0x1000 + 2 * i, [i * 0x101])
+            assert await client.read_16b(0x1000 + 2 * i) == [i * 0x101]
+
+        round_trips = client.round_trips
+        await asyncio.gather(*(read_write(i) for i in range(200)))
+        assert client.round_trips - round_trips < 20
+
+        # Identical reads share one bus access.
+        commands = transport.commands
+        results = await asyncio.gather(*(client.read_32b(0x10) for _ in range(100)))
+        assert results == [[0x13121110]] * 100
+        assert transport.commands == commands + 1
+
+        # Batches of several commands are never coalesced, and are sent in order, so the second batch reads what the
+        # first one wrote.
+        async def batch(value):
+            async with client.batch() as batch:
+                first = batch.read_8b(0x20)
+                batch.write_8b(0x20, [value])
+            return first.result()
+        commands = transport.commands
+        assert await asyncio.gather(batch(0x55), batch(0xaa)) == [[0x20], [0x55]]
+        assert transport.commands == commands + 4
+        assert transport.memory[0x20] == 0xaa
+
+    asyncio.run(main())
+
+def test_concurrent_priority():
+    async def main():
+        transport = MockTransport(latency = 1e-3)
+        client = Client(transport, max_batches = 1)
+        await client.get_capabilities()
+
+        interactive = client.with_priority(1)
+        assert interactive.capabilities is client.capabilities
+
+        done = []
+        async def read(client, name, addr):
+            await client.read_8b(addr)
+            done.append(name)
+
+        # The first background read is already in flight when the interactive one comes in.
+        tasks = [asyncio.create_task(read(client, f'background {i}', i)) for i in range(8)]
+        await asyncio.sleep(0)
+        tasks.append(asyncio.create_task(read(interactive, 'interactive', 0x100)))
+        await asyncio.gather(*tasks)
+
+        assert done[:2] == ['background 0', 'interactive']
+        assert done[2:] == [f'background {i}' for i in range(1, 8)]
+
+    asyncio.run(main())
+
+def test_callback_error(monkeypatch):
+    async def main():
+        transport = MockTransport(latency = 1e-3)
+        client = Client(transport)
+        await client.get_capabilities()
+
+        transport.memory[:4] = bytes([0x11, 0x22, 0x33, 0x44])
+
+        # Decoding the response to 16-bit reads fails.
+        decode = bridge._decode
+        def broken_decode(size, data):
+            assert size != 1, 'Broken decode'
+            return decode(size, data)
+        monkeypatch.setattr(bridge, '_decode', broken_decode)
+
+        async def bad():
+            with pytest.raises(AssertionError, match = 'Broken decode'):
+                async with client.batch() as batch:
+                    before = batch.read_8b(0x00)
+                    failed = batch.read_16b(0x00)
+                    after = batch.read_8b(0x03)
+            assert before.result() == [0x11]
+            with pytest.raises(AssertionError, match = 'Broken decode'):
+                failed.result()
+            assert after.result() == [0x44]
+
+        # The rest of the round trip is still read, for the failing caller and the others sharing it. They're all
+        # queued while the first read is in flight.
+        round_trips = client.round_trips
+        results = await asyncio.gather(client.read_8b(0x00), bad(), client.read_8b(0x01), client.read_32b(0x00))
+        assert results[2:] == [[0x22], [0x44332211]]
+        assert client.round_trips == round_trips + 2
+
+        assert await client.read_8b(0x02) == [0x33]
+
+    asyncio.run(main())
+
+def test_cancelled_caller():
+    async def main():
+        transport = MockTransport(latency = 5e-3)
+        client = Client(transport)
+        await client.get_capabilities()
+
+        transport.memory[0x10:0x14] = bytes([0x01, 0x02, 0x03, 0x04])
+        transport.memory[0x20] = 0x55
+
+        # Both are queued while the first read is in flight, and sent together in the next round trip, which the
+        # cancelled caller drives.
+        first = asyncio.create_task(client.read_8b(0x00))
+        await asyncio.sleep(0)
+        round_trips = client.round_trips
+        cancelled = asyncio.create_task(client.read_8b(0x10, 4))
+        other = asyncio.create_task(client.read_8b(0x20))
+        await first
+        await asyncio.sleep(1e-3)
+        assert client.round_trips == round_trips + 1
+        cancelled.cancel()
+
+        # The caller sharing the round trip still gets its response, and the link stays in sync.
+        assert await other == [0x55]
+        with pytest.raises(asyncio.CancelledError):
+            await cancelled
+        assert await client.read_8b(0x11, 2) == [0x02, 0x03]
+        assert client.round_trips == round_trips + 2
+
+    asyncio.run(main())
+
+def test_concurrent_error():
+    async def main():
+        # 16-bit accesses aren't supported by the bridge, but the client is told otherwise.
+        transport = MockTransport(access_sizes = (0,), latency = 1e-3)
+        client = Client(transport)
+        await client.get_capabilities()
+        client.capabilities.access_16b = True
+
+        transport.memory[0x10] = 0x42
+
+        async def bad():
+            with pytest.raises(AssertionError, match = 'Command error'):
+                await client.read_16b(0x00)
+
+        await client.read_8b(0x00)
+        await asyncio.gather(bad(), bad())
+
+        # The responses are kept in sync for the callers that come after.
+        assert await client.read_8b(0x10) == [0x42]
+
+    asyncio.run(main())
+
+class AsyncOnlyTransport:
+    def __init__(self, transport):
+        self._transport = transport
+
+    async def send(self, data: bytes):
+        await self._transport.send(data)
+
+    async def recv(self, length = 1):
+        return await self._transport.recv(length)
+
+def test_sync_client():
+    for rmw in [True, False]:
+        transport = MockTransport(poll_timeout_width = 16, rmw = rmw)
+        client = SyncClient(transport)
+        assert client.get_capabilities().poll
+
+        transport.memory[0x1000:0x1004] = bytes([0x11, 0x22, 0x33, 0x44])
+        sends = transport.sends
+
+        with client.batch() as batch:
+            f1 = batch.read_8b(0x1000)
+            f2 = batch.write_8b(0x2000, [0xaa, 0xbb])
+            f3 = batch.read_16b(0x2000)
+            f4 = batch.poll_32b(0x1000, 0xff, 0x11)
+        assert transport.sends == sends + 1
+        assert f1.result() == [0x11]
+        assert f2.result() is None
+        assert f3.result() == [0xbbaa]
+        assert f4.result() == (0x44332211, False)
+
+        assert client.read_32b(0x1000) == [0x44332211]
+        client.write_16b(0x2000, [0x1234])
+        assert client.read_8b(0x2000, 2) == [0x34, 0x12]
+        assert client.poll_8b(0x2000, 0xff, 0x00, timeout = 10) == (0x34, True)
+        client._rmw(bridge._RMW_SET, 0, 0x2000, 0x80)
+        assert transport.memory[0x2000] == 0xb4
+
+        # Command errors are raised, and the responses kept in sync.
+        transport.access_sizes = (0,)
+        with pytest.raises(AssertionError, match = 'Command error'):
+            client.read_16b(0x2000)
+        assert client.read_8b(0x2001) == [0x12]
+
+    # Transports without blocking methods are run on a private event loop.
+    transport = MockTransport()
+    client = SyncClient(AsyncOnlyTransport(transport))
+    client.write_8b(0x10, b'\x01\x02')
+    assert client.read_16b(0x10) == [0x0201]
+
+class InterruptedTransport(MockTransport):
+    """`MockTransport` whose next read is interrupted, before taking any bytes, when `interrupt` is set."""
+
+    interrupt = False
+
+    def _check(self):
+        if self.interrupt:
+            self.interrupt = False
+            raise KeyboardInterrupt
+
+    def read(self, length = 1):
+        self._check()
+        return super().read(length)
+
+    async def recv(self, length = 1):
+        self._check()
+        return await super().recv(length)
+
+@pytest.mark.parametrize('blocking', [True, False])
+def test_sync_client_interrupted(blocking):
+    transport = InterruptedTransport()
+    transport.memory[0x10:0x14] = bytes([0x01, 0x02, 0x03, 0x04])
+    transport.memory[0x20] = 0x55
+
+    with SyncClient(transport if blocking else AsyncOnlyTransport(transport)) as client:
+        client.get_capabilities()
+
+        transport.interrupt = True
+        with pytest.raises(KeyboardInterrupt):
+            client.read_8b(0x10, 4)
+
+        # The rest of the interrupted round trip is read first, so the next one gets its own responses.
+        assert client.read_8b(0x20) == [0x55]
+        assert client.read_8b(0x11, 2) == [0x02, 0x03]
+
+    if not blocking:
+        assert client._link._io._loop.is_closed()
+
+def test_sync_client_benchmark():
+    n = 2000
+
+    def run_sync():
+        transport = MockTransport()
+        client = SyncClient(transport)
+        client.get_capabilities()
+
+        start = time.perf_counter()
+        for i in range(n):
+            client.write_8b(i, [i & 0xff])
+            assert client.read_8b(i) == [i & 0xff]
+        return 2 * n / (time.perf_counter() - start), client.round_trips, transport.commands
+
+    def run_async():
+        async def main():
+            transport = MockTransport()
+            client = Client(transport)
+            await client.get_capabilities()
+
+            start = time.perf_counter()
+            for i in range(n):
+                await client.write_8b(i, [i & 0xff])
+                assert await client.read_8b(i) == [i & 0xff]
+            return 2 * n / (time.perf_counter() - start), client.round_trips, transport.commands
+
+        return asyncio.run(main())
+
+    (sync_rate, *sync_counts), (async_rate, *async_counts) = run_sync(), run_async()
+
+    # Timing is only reported, as wall-clock time on a shared machine is too noisy to assert on.
+    print(f'Zero latency single accesses: sync {sync_rate:.0f} ops/s, async {async_rate:.0f} ops/s ({sync_rate / async_rate:.2f}x)')
+
+    # Both send the same commands, one round trip per access, plus the capability query.
+    assert sync_counts == async_counts == [2 * n + 1, 2 * n + 1]
@@ -2,38 +2,48 @@ import pytest
 
 from amaranth.sim import Simulator, SimulatorContext
 
-from amaranth import Module, Cat
+from amaranth import Module, Cat, Signal
 from amaranth_soc.gpio import Peripheral as GpioPeripheral
 
 from katsuo.bridge.sim import tb_with_bridge_client
 from katsuo.bridge.csr import Bridge
 
-@pytest.mark.parametrize(('addr_width', 'input_stream_fc', 'output_stream_fc'), [
+async def transact(client, command, response_length = 0):
+    await client.transport.send(bytes(command))
+    return list(await client.transport.recv(1 + response_length))
+
+@pytest.mark.parametrize(('addr_width', 'input_stream_fc', 'output_stream_fc', 'stream_width'), [
     # Test 8 bit addressing with different flow control gaps.
-    (8, 0, 0),
-    (8, 1, 0),
-    (8, 2, 0),
-    (8, 0, 1),
-    (8, 0, 2),
-    (8, 1, 1),
-    (8, 2, 2),
+    (8, 0, 0, 8),
+    (8, 1, 0, 8),
+    (8, 2, 0, 8),
+    (8, 0, 1, 8),
+    (8, 0, 2, 8),
+    (8, 1, 1, 8),
+    (8, 2, 2, 8),
     # Ditto for 16-bit addressing.
-    (16, 0, 0),
-    (16, 1, 0),
-    (16, 2, 0),
-    (16, 0, 1),
-    (16, 0, 2),
-    (16, 1, 1),
-    (16, 2, 2),
+    (16, 0, 0, 8),
+    (16, 1, 0, 8),
+    (16, 2, 0, 8),
+    (16, 0, 1, 8),
+    (16, 0, 2, 8),
+    (16, 1, 1, 8),
+    (16, 2, 2, 8),
     # 6-bit and 12-bit addressing should be rounded up to 8-bit and 16-bit respectively.
-    (6, 0, 0),
-    (12, 0, 0),
+    (6, 0, 0, 8),
+    (12, 0, 0, 8),
+    # Wide streams, with commands straddling beats.
+    (8, 0, 0, 16),
+    (8, 0, 0, 32),
+    (16, 0, 0, 16),
+    (16, 0, 0, 32),
+    (16, 1, 2, 32),
 ])
-def test_csr_bridge(addr_width, input_stream_fc, output_stream_fc):
+def test_csr_bridge(addr_width, input_stream_fc, output_stream_fc, stream_width):
     m = Module()
 
     m.submodules.gpio = gpio = GpioPeripheral(pin_count = 8, addr_width = addr_width, data_width = 8)
-    m.submodules.bridge = bridge = Bridge(gpio.bus)
+    m.submodules.bridge = bridge = Bridge(gpio.bus, stream_width = stream_width)
 
     gpio_i = Cat(pin.i for pin in gpio.pins)
     gpio_o = Cat(pin.o for pin in gpio.pins)
@@ -49,13 +59,13 @@ def test_csr_bridge(addr_width, input_stream_fc, output_stream_fc):
         # Read bridge capabilities.
         capabilities = await client.get_capabilities()
         assert capabilities.access_8b == True
-        assert capabilities.access_16b == False
-        assert capabilities.access_32b == False
-        assert capabilities.access_64b == False
-        assert capabilities.burst_nonincr == False
-        assert capabilities.burst_incr == False
-        assert capabilities.no_addr == False
-        assert capabilities.burst_width == 0
+        assert capabilities.access_16b == True
+        assert capabilities.access_32b == True
+        assert capabilities.access_64b == True
+        assert capabilities.burst_nonincr == True
+        assert capabilities.burst_incr == True
+        assert capabilities.no_addr == True
+        assert capabilities.burst_width == 8
         assert capabilities.addr_width == addr_width
         assert capabilities.data_width == 8
 
@@ -72,9 +82,303 @@ def test_csr_bridge(addr_width, input_stream_fc, output_stream_fc):
 
         # Set push-pull mode on GPIO pins 2..5
         await client.write_8b(0x00, [0x50, 0x05])
-        await ctx.tick().repeat(10)
+        await ctx.tick().repeat(20)
+        assert ctx.get(gpio_oe) == 0x3c
+
+        addr_bytes = (addr_width + 7) // 8
+
+        # Incrementing burst read of mode, input and output registers
+        assert await transact(client, [0x48, 4, *(0x00).to_bytes(addr_bytes, 'little')], 4) == [0x01, 0x50, 0x05, 0x55, 0xaa]
+
+        # Nonincrementing burst read of GPIO input register
+        assert await transact(client, [0x44, 3, *(0x02).to_bytes(addr_bytes, 'little')], 3) == [0x01, 0x55, 0x55, 0x55]
+
+        # Nonincrementing burst write to GPIO output register, last write wins
+        assert await transact(client, [0x84, 3, *(0x03).to_bytes(addr_bytes, 'little'), 0x01, 0x02, 0x0f]) == [0x01]
+        await ctx.tick().repeat(20)
+        assert ctx.get(gpio_o) == 0x0f
+
+        # Incrementing burst write to mode register, set open-drain mode on GPIO pins 0..3
+        assert await transact(client, [0x88, 2, *(0x00).to_bytes(addr_bytes, 'little'), 0xaa, 0x00]) == [0x01]
+        await ctx.tick().repeat(20)
+        assert ctx.get(gpio_oe) == 0x00
+
+        # Zero length burst performs no accesses
+        assert await transact(client, [0x48, 0, *(0x00).to_bytes(addr_bytes, 'little')]) == [0x01]
+
+        # Single accesses still work after bursts
+        assert await client.read_8b(0x03) == [0x0f]
+
+        # Read again without address phase
+        assert await transact(client, [0x50], 1) == [0x01, 0x0f]
+
+        # Incrementing burst write to mode register, continued without address phase through the input and output registers
+        assert await transact(client, [0x88, 1, *(0x00).to_bytes(addr_bytes, 'little'), 0x50]) == [0x01]
+        assert await transact(client, [0x98, 1, 0x05]) == [0x01]
+        assert await transact(client, [0x98, 0]) == [0x01]
+        assert await transact(client, [0x98, 2, 0x00, 0x00]) == [0x01]
+        await ctx.tick().repeat(20)
+        assert ctx.get(gpio_oe) == 0x3c
+
+        # Nonincrementing burst leaves the address in place
+        assert await transact(client, [0x44, 2, *(0x02).to_bytes(addr_bytes, 'little')], 2) == [0x01, 0x55, 0x55]
+        assert await transact(client, [0x50], 1) == [0x01, 0x55]
+        assert await transact(client, [0x58, 2], 2) == [0x01, 0x55, 0x00]
+
+        # Several commands in a single batch
+        async with client.batch() as batch:
+            f1 = batch.read_8b(0x02)
+            batch.write_8b(0x03, [0x5a])
+            f2 = batch.read_8b(0x03)
+            f3 = batch.read_16b(0x00)
+        assert f1.result() == [0x55]
+        assert f2.result() == [0x5a]
+        assert f3.result() == [0x0550]
+
+        # Burst reads through the client
+        assert await client.read_8b(0x00, 4) == [0x50, 0x05, 0x55, 0x5a]
+        assert await client.read_8b(0x02, 3, increment = False) == [0x55, 0x55, 0x55]
+
+    @sim.add_process
+    async def timeout(ctx: SimulatorContext):
+        await ctx.tick().repeat(10_000)
+        raise TimeoutError('Simulation timed out')
+
+    sim.run()
+
+@pytest.mark.parametrize('burst_width', [0, 4, 12])
+def test_csr_bridge_burst_width(burst_width):
+    m = Module()
+
+    m.submodules.gpio = gpio = GpioPeripheral(pin_count = 8, addr_width = 8, data_width = 8)
+    m.submodules.bridge = bridge = Bridge(gpio.bus, burst_width = burst_width)
+
+    gpio_i = Cat(pin.i for pin in gpio.pins)
+
+    sim = Simulator(m)
+    sim.add_clock(1e-6)
+
+    @tb_with_bridge_client(sim, bridge)
+    async def client_testbench(ctx: SimulatorContext, client):
+        await ctx.tick()
+
+        capabilities = await client.get_capabilities()
+        assert capabilities.burst_nonincr == bool(burst_width)
+        assert capabilities.burst_incr == bool(burst_width)
+        assert capabilities.burst_width == burst_width
+
+        ctx.set(gpio_i, 0x33)
+
+        if not burst_width:
+            # Burst commands are rejected when bursts are disabled.
+            assert await transact(client, [0x44]) == [0xff]
+            return
+
+        length = (1 << burst_width) - 1
+        len_bytes = (burst_width + 7) // 8
+        response = await transact(client, [0x44, *length.to_bytes(len_bytes, 'little'), 0x02], length)
+        assert response == [0x01] + [0x33] * length
+
+    @sim.add_process
+    async def timeout(ctx: SimulatorContext):
+        await ctx.tick().repeat(100_000)
+        raise TimeoutError('Simulation timed out')
+
+    sim.run()
+
+def test_csr_bridge_no_addr():
+    m = Module()
+
+    m.submodules.gpio = gpio = GpioPeripheral(pin_count = 8, addr_width = 16, data_width = 8)
+    m.submodules.bridge = bridge = Bridge(gpio.bus)
+
+    gpio_i = Cat(pin.i for pin in gpio.pins)
+
+    sim = Simulator(m)
+    sim.add_clock(1e-6)
+
+    @tb_with_bridge_client(sim, bridge)
+    async def client_testbench(ctx: SimulatorContext, client):
+        await ctx.tick()
+
+        await client.get_capabilities()
+
+        sent = 0
+        send = client.transport.send
+        async def counting_send(data):
+            nonlocal sent
+            sent += len(data)
+            await send(data)
+        client.transport.send = counting_send
+
+        # Poll the GPIO input register; only the first poll needs an address phase.
+        for i in range(10):
+            ctx.set(gpio_i, i)
+            await ctx.tick().repeat(4)
+            assert await client.read_8b(0x02) == [i]
+
+        assert sent == 3 + 9 * 1
+
+        # Switching to another address needs a new address phase.
+        sent = 0
+        assert await client.read_8b(0x03) == [0x00]
+        assert await client.read_8b(0x03) == [0x00]
+        await client.write_8b(0x03, [0x12])
+        assert await client.read_8b(0x03) == [0x12]
+        assert sent == 3 + 1 + 2 + 1
+
+    @sim.add_process
+    async def timeout(ctx: SimulatorContext):
+        await ctx.tick().repeat(10_000)
+        raise TimeoutError('Simulation timed out')
+
+    sim.run()
+
+@pytest.mark.parametrize(('data_width', 'poll_timeout_width'), [
+    (8, 24),
+    (8, 12),
+    (16, 24),
+    (8, 0),
+])
+@pytest.mark.parametrize('stream_width', [8, 16, 32])
+def test_csr_bridge_poll(data_width, poll_timeout_width, stream_width):
+    m = Module()
+
+    m.submodules.gpio = gpio = GpioPeripheral(pin_count = 8, addr_width = 8, data_width = data_width)
+    m.submodules.bridge = bridge = Bridge(gpio.bus, poll_timeout_width = poll_timeout_width, stream_width = stream_width)
+
+    gpio_i = Cat(pin.i for pin in gpio.pins)
+
+    # Changes the GPIO inputs some time after being toggled, while a poll is running.
+    release = Signal()
+
+    sim = Simulator(m)
+    sim.add_clock(1e-6)
+
+    @tb_with_bridge_client(sim, bridge)
+    async def client_testbench(ctx: SimulatorContext, client):
+        await ctx.tick()
+
+        capabilities = await client.get_capabilities()
+        assert capabilities.poll == bool(poll_timeout_width)
+        assert capabilities.poll_timeout_width == poll_timeout_width
+
+        poll = getattr(client, f'poll_{data_width}b')
+        input_addr = 0x02 if data_width == 8 else 0x01
+
+        if not poll_timeout_width:
+            # Poll commands are rejected, and the client polls from the host instead.
+            assert await transact(client, [0x20]) == [0xff]
+            assert await poll(input_addr, 0x0f, 0x00) == (0x00, False)
+            return
+
+        ctx.set(gpio_i, 0x5a)
+        await ctx.tick().repeat(4)
+
+        # Condition met on the first read.
+        assert await poll(input_addr, 0x0f, 0x0a) == (0x5a, False)
+
+        # Condition never met.
+        assert await poll(input_addr, 0x0f, 0x05, timeout = 100) == (0x5a, True)
+
+        # Condition met while polling.
+        ctx.set(release, 1)
+        assert await poll(input_addr, 0xff, 0xa5, timeout = 1000) == (0xa5, False)
+
+        # Registers spanning several bus words are read in full on every poll.
+        await client.write_16b(0x00, [0x0550])
+        assert await client.poll_16b(0x00, 0x0ff0, 0x0550, timeout = 0) == (0x0550, False)
+
+        # Normal commands still work afterwards.
+        assert await client.read_16b(0x00) == [0x0550]
+
+    @sim.add_process
+    async def change_input(ctx: SimulatorContext):
+        await ctx.changed(release)
+        await ctx.tick().repeat(200)
+        ctx.set(gpio_i, 0xa5)
+
+    @sim.add_process
+    async def timeout(ctx: SimulatorContext):
+        await ctx.tick().repeat(10_000)
+        raise TimeoutError('Simulation timed out')
+
+    sim.run()
+
+@pytest.mark.parametrize(('data_width', 'input_stream_fc', 'output_stream_fc'), [
+    (8, 0, 0),
+    (8, 1, 1),
+    (16, 0, 0),
+    (16, 1, 0),
+    (16, 0, 1),
+    (16, 2, 2),
+    (32, 0, 0),
+    (32, 1, 0),
+    (32, 0, 1),
+    (32, 2, 2),
+])
+def test_csr_bridge_wide(data_width, input_stream_fc, output_stream_fc):
+    m = Module()
+
+    m.submodules.gpio = gpio = GpioPeripheral(pin_count = 8, addr_width = 8, data_width = data_width)
+    m.submodules.bridge = bridge = Bridge(gpio.bus)
+
+    gpio_i = Cat(pin.i for pin in gpio.pins)
+    gpio_o = Cat(pin.o for pin in gpio.pins)
+    gpio_oe = Cat(pin.oe for pin in gpio.pins)
+
+    # Bus address of each GPIO register.
+    if data_width == 8:
+        mode, input, output = 0x00, 0x02, 0x03
+    else:
+        mode, input, output = 0x00, 0x01, 0x02
+
+    sim = Simulator(m)
+    sim.add_clock(1e-6)
+
+    @tb_with_bridge_client(sim, bridge, input_stream_fc = input_stream_fc, output_stream_fc = output_stream_fc)
+    async def client_testbench(ctx: SimulatorContext, client):
+        await ctx.tick()
+
+        capabilities = await client.get_capabilities()
+        assert capabilities.access_8b == (data_width <= 8)
+        assert capabilities.access_16b == (data_width <= 16)
+        assert capabilities.access_32b == True
+        assert capabilities.access_64b == True
+        assert capabilities.data_width == data_width
+
+        if data_width > 8:
+            # Accesses narrower than the bus are rejected.
+            assert await transact(client, [0x40]) == [0xff]
+
+        # Set push-pull mode on GPIO pins 2..5 with a single write.
+        if data_width <= 16:
+            await client.write_16b(mode, [0x0550])
+        else:
+            await client.write_32b(mode, [0x0550])
+        await ctx.tick().repeat(20)
         assert ctx.get(gpio_oe) == 0x3c
 
+        ctx.set(gpio_i, 0x55)
+        await client.write_32b(output, [0xa5])
+        await ctx.tick().repeat(20)
+        assert ctx.get(gpio_o) == 0xa5
+
+        # Bus contents as seen over the wire, starting at the mode register.
+        if data_width == 8:
+            words = [0x50, 0x05, 0x55, 0xa5]
+        else:
+            words = [0x0550, 0x55, 0xa5]
+        image = b''.join(word.to_bytes(data_width // 8, 'little') for word in words).ljust(16, b'\0')
+
+        if data_width <= 16:
+            assert await client.read_16b(mode) == [0x0550]
+        assert await client.read_32b(mode) == [int.from_bytes(image[0:4], 'little')]
+        assert await client.read_64b(mode) == [int.from_bytes(image[0:8], 'little')]
+
+        # Incrementing 32-bit burst advances the address by the access size.
+        assert await transact(client, [0x4a, 2, mode], 8) == [0x01, *image[0:8]]
+
     @sim.add_process
     async def timeout(ctx: SimulatorContext):
         await ctx.tick().repeat(10_000)
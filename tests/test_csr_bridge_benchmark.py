@@ -0,0 +1,207 @@
+"""Cycle counts of `csr.Bridge` commands.
+
+Each command is sent back to back `REPEAT` times with the stream handshakes driven directly, so counts are exact.
+Results are compared against `csr_bridge_baseline.json` and fail on any regression. Set `KATSUO_BENCHMARK_RESULTS` to
+a path to write the results as JSON, and `KATSUO_UPDATE_BASELINE=1` to update the baseline.
+"""
+
+import json
+import os
+import pathlib
+import pytest
+
+from amaranth import Module, Signal
+from amaranth.sim import Simulator, SimulatorContext
+from amaranth_soc.gpio import Peripheral as GpioPeripheral
+
+from katsuo.bridge.csr import Bridge
+from katsuo.bridge.sim import stream_put_bytes, stream_get_bytes
+
+BASELINE = pathlib.Path(__file__).with_name('csr_bridge_baseline.json')
+
+REPEAT = 8
+BURST = 16
+
+ADDR_WIDTHS = [8, 16, 24]
+GAPS = [(0, 0), (1, 0), (0, 1), (3, 3)]
+
+def commands(addr_width):
+    """(name, request, response length) for each command type."""
+    addr = (0x03).to_bytes((addr_width + 7) // 8, 'little')
+    return [
+        ('capabilities', bytes([0xc0]), 7),
+        ('read_8b', bytes([0x40]) + addr, 2),
+        ('write_8b', bytes([0x80]) + addr + bytes([0x5a]), 1),
+        ('read_8b_no_addr', bytes([0x50]), 2),
+        ('write_8b_no_addr', bytes([0x90, 0x5a]), 1),
+        ('read_8b_burst', bytes([0x44, BURST]) + addr, 1 + BURST),
+        ('write_8b_burst', bytes([0x84, BURST]) + addr + bytes(BURST), 1),
+    ]
+
+async def measure(ctx: SimulatorContext, dut, request, response_length, input_gap, output_gap):
+    """Cycles from the first input byte offered to the last byte transferred in either direction."""
+    pending = bytearray(request)
+    response = bytearray()
+    input_wait, output_wait = input_gap, output_gap
+
+    tick = ctx.tick().sample(dut.input.ready, dut.output.valid, dut.output.payload)
+    cycles = 0
+    while pending or len(response) < response_length:
+        input_valid = bool(pending) and not input_wait
+        output_ready = not output_wait
+        ctx.set(dut.input.valid, input_valid)
+        if input_valid:
+            ctx.set(dut.input.payload, pending[0])
+        ctx.set(dut.output.ready, output_ready)
+
+        _, _, input_ready, output_valid, output_payload = await tick
+        cycles += 1
+        assert cycles < 10_000, 'Bridge stalled'
+
+        if input_wait:
+            input_wait -= 1
+        elif input_valid and input_ready:
+            del pending[0]
+            input_wait = input_gap
+
+        if output_wait:
+            output_wait -= 1
+        elif output_valid:
+            response.append(output_payload)
+            output_wait = output_gap
+
+    ctx.set(dut.input.valid, 0)
+    ctx.set(dut.output.ready, 0)
+    return cycles, bytes(response)
+
+def run_benchmark(addr_width, input_gap, output_gap):
+    m = Module()
+    m.submodules.gpio = gpio = GpioPeripheral(pin_count = 8, addr_width = addr_width, data_width = 8)
+    m.submodules.bridge = bridge = Bridge(gpio.bus)
+
+    sim = Simulator(m)
+    sim.add_clock(1e-6)
+
+    results = {}
+
+    @sim.add_testbench
+    async def testbench(ctx: SimulatorContext):
+        for name, request, response_length in commands(addr_width):
+            cycles, response = await measure(ctx, bridge, request * REPEAT, response_length * REPEAT, input_gap, output_gap)
+            assert response[0] == 0x01
+            results[name] = {
+                'cycles_per_op': cycles / REPEAT,
+                'bytes_per_op': len(request) + response_length,
+            }
+
+            # Let the bridge settle between command types.
+            await ctx.tick().repeat(8)
+
+    sim.run()
+    return results
+
+def test_csr_bridge_benchmark():
+    results = {}
+    for addr_width in ADDR_WIDTHS:
+        for input_gap, output_gap in GAPS:
+            for name, result in run_benchmark(addr_width, input_gap, output_gap).items():
+                results[f'{name}/addr{addr_width}/gap{input_gap}-{output_gap}'] = result
+
+    for key, result in results.items():
+        if key.endswith('/gap0-0'):
+            print(f'{key}: {result["cycles_per_op"]:.2f} cycles, {result["bytes_per_op"]} bytes')
+
+    if path := os.environ.get('KATSUO_BENCHMARK_RESULTS'):
+        pathlib.Path(path).write_text(json.dumps(results, indent = 2) + '\n')
+
+    if os.environ.get('KATSUO_UPDATE_BASELINE'):
+        BASELINE.write_text(json.dumps({key: result['cycles_per_op'] for key, result in results.items()}, indent = 2) + '\n')
+
+    baseline = json.loads(BASELINE.read_text())
+    regressions = [
+        f'{key}: {result["cycles_per_op"]} cycles per op, baseline {baseline.get(key)}'
+        for key, result in results.items()
+        if key not in baseline or result['cycles_per_op'] > baseline[key]
+    ]
+    assert not regressions, 'Cycle count regressions:\n' + '\n'.join(regressions)
+
+@pytest.mark.parametrize('data_width', [8, 32])
+def test_csr_bridge_pipelined(data_width):
+    m = Module()
+    m.submodules.gpio = gpio = GpioPeripheral(pin_count = 8, addr_width = 8, data_width = data_width)
+    m.submodules.bridge = bridge = Bridge(gpio.bus)
+
+    sim = Simulator(m)
+    sim.add_clock(1e-6)
+
+    aa = (data_width // 8).bit_length() - 1
+    word = bytes(data_width // 8)
+
+    # Streams of back to back commands, each moving a byte per cycle in at least one direction.
+    writes = (bytes([0x80 | aa, 0x00]) + word + bytes([0x90 | aa]) + word + bytes([0x84 | aa, BURST, 0x00]) + word * BURST) * REPEAT
+    writes_response = 3 * REPEAT
+    reads = (bytes([0x50 | aa, 0x44 | aa, BURST, 0x00])) * REPEAT
+    reads_response = (2 + len(word) * (1 + BURST)) * REPEAT
+
+    @sim.add_testbench
+    async def testbench(ctx: SimulatorContext):
+        cycles, response = await measure(ctx, bridge, writes, writes_response, 0, 0)
+        assert response == bytes([0x01]) * writes_response
+        print(f'{len(writes)} request bytes in {cycles} cycles')
+        assert cycles <= len(writes) + 2
+
+        await ctx.tick().repeat(8)
+
+        cycles, response = await measure(ctx, bridge, reads, reads_response, 0, 0)
+        assert response[0] == 0x01
+        print(f'{len(reads)} request and {reads_response} response bytes in {cycles} cycles')
+        if data_width > 8:
+            assert cycles <= reads_response + 2
+        else:
+            # The command bytes and status bytes overlap, but the bridge takes a request byte or reads a bus word each
+            # cycle, and with an 8-bit bus each word is a single response byte. The output then idles for the burst
+            # length and address bytes of each burst, the only request bytes without a response byte to hide behind.
+            assert cycles <= max(len(reads), reads_response) + 2 * REPEAT + 2
+
+    sim.run()
+
+@pytest.mark.parametrize('stream_width', [16, 32])
+def test_csr_bridge_wide_stream(stream_width):
+    m = Module()
+    m.submodules.gpio = gpio = GpioPeripheral(pin_count = 8, addr_width = 8, data_width = 32)
+    m.submodules.bridge = bridge = Bridge(gpio.bus, stream_width = stream_width)
+
+    cycle = Signal(16)
+    m.d.sync += cycle.eq(cycle + 1)
+
+    sim = Simulator(m)
+    sim.add_clock(1e-6)
+
+    beat_bytes = stream_width // 8
+
+    # Bursts of 32-bit words, after a three byte command header.
+    writes = bytes([0x86, BURST, 0x00]) + bytes(4 * BURST)
+    reads = bytes([0x46, BURST, 0x00])
+
+    @sim.add_testbench
+    async def testbench(ctx: SimulatorContext):
+        start = ctx.get(cycle)
+        await stream_put_bytes(ctx, bridge.input, writes)
+        cycles = ctx.get(cycle) - start
+        assert await stream_get_bytes(ctx, bridge.output, 1) == bytes([0x01])
+        print(f'{len(writes)} request bytes in {cycles} cycles')
+        # The header is taken a byte per cycle, and the data a beat per cycle.
+        assert cycles <= 3 + 4 * BURST // beat_bytes + 2
+
+        await ctx.tick().repeat(8)
+
+        start = ctx.get(cycle)
+        await stream_put_bytes(ctx, bridge.input, reads)
+        response = await stream_get_bytes(ctx, bridge.output, 1 + 4 * BURST)
+        cycles = ctx.get(cycle) - start
+        assert response[0] == 0x01 and len(response) == 1 + 4 * BURST
+        print(f'{len(response)} response bytes in {cycles} cycles')
+        # The status is sent in a beat of its own, followed by the data a beat per cycle.
+        assert cycles <= 3 + 1 + 4 * BURST // beat_bytes + 4
+
+    sim.run()
@@ -0,0 +1,365 @@
+import asyncio
+import pytest
+
+from amaranth.sim import Simulator, SimulatorContext
+
+from amaranth import Module, Cat
+from amaranth_soc.gpio import Peripheral as GpioPeripheral
+
+from katsuo.bridge.sim import tb_with_bridge_client
+from katsuo.bridge.csr import Bridge
+from katsuo.bridge.client import bridge, csr
+
+from mock_transport import MockTransport
+from test_memory_map import element_annotations
+
+MEMORY_MAP_SCHEMA = 'https://amaranth-lang.org/schema/amaranth-soc/0.1/memory/memory-map.json'
+CSR_BUS_SCHEMA = 'https://amaranth-lang.org/schema/amaranth-soc/0.1/csr/bus.json'
+
+def csr_annotations(resources, *, addr_width, data_width, windows = [], access = {}):
+    return {
+        CSR_BUS_SCHEMA: {
+            'addr_width': addr_width,
+            'data_width': data_width,
+        },
+        MEMORY_MAP_SCHEMA: {
+            'addr_width': addr_width,
+            'data_width': data_width,
+            'alignment': 0,
+            'windows': windows,
+            'resources': [
+                {'name': list(name), 'start': start, 'end': end, 'annotations': element_annotations(access.get(name), end - start, data_width)}
+                for name, start, end in resources
+            ],
+        },
+    }
+
+def gpio_annotations(*, addr_width, data_width):
+    # Register sizes of a GPIO peripheral with 8 pins, in bits.
+    registers = [('Mode', 16), ('Input', 8), ('Output', 8), ('SetClr', 16)]
+
+    resources = []
+    start = 0
+    for name, width in registers:
+        end = start + (width + data_width - 1) // data_width
+        resources.append(((name,), start, end))
+        start = end
+
+    return csr_annotations(resources, addr_width = addr_width, data_width = data_width)
+
+def count_commands(client):
+    counter = {'sends': 0}
+    send = client.transport.send
+    async def counting_send(data):
+        counter['sends'] += 1
+        await send(data)
+    client.transport.send = counting_send
+    return counter
+
+@pytest.mark.parametrize('data_width', [8, 16, 32])
+def test_csr_client_register(data_width):
+    m = Module()
+
+    m.submodules.gpio = gpio = GpioPeripheral(pin_count = 8, addr_width = 8, data_width = data_width)
+    m.submodules.bridge = bridge = Bridge(gpio.bus)
+
+    gpio_i = Cat(pin.i for pin in gpio.pins)
+    gpio_oe = Cat(pin.oe for pin in gpio.pins)
+
+    sim = Simulator(m)
+    sim.add_clock(1e-6)
+
+    @tb_with_bridge_client(sim, bridge)
+    async def client_testbench(ctx: SimulatorContext, bus_client):
+        await ctx.tick()
+
+        await bus_client.get_capabilities()
+
+        client = csr.Client(gpio_annotations(addr_width = 8, data_width = data_width), bus_client = bus_client)
+        counter = count_commands(bus_client)
+
+        assert client.Mode.width == max(16, data_width)
+        assert client.Input.width == data_width
+
+        # A multi-byte register is written and read back with one command each.
+        await client.Mode.write(0x0550)
+        await ctx.tick().repeat(20)
+        assert ctx.get(gpio_oe) == 0x3c
+        assert await client.Mode.read() == 0x0550
+        assert counter['sends'] == 2
+
+        ctx.set(gpio_i, 0x5a)
+        await ctx.tick().repeat(4)
+        assert await client.Input.read() == 0x5a
+
+    @sim.add_process
+    async def timeout(ctx: SimulatorContext):
+        await ctx.tick().repeat(10_000)
+        raise TimeoutError('Simulation timed out')
+
+    sim.run()
+
+@pytest.mark.parametrize(('data_width', 'rmw'), [
+    (8, True),
+    (16, True),
+    (32, True),
+    (8, False),
+])
+@pytest.mark.parametrize('stream_width', [8, 16, 32])
+def test_csr_client_modify(data_width, rmw, stream_width):
+    m = Module()
+
+    m.submodules.gpio = gpio = GpioPeripheral(pin_count = 8, addr_width = 8, data_width = data_width)
+    m.submodules.bridge = bridge = Bridge(gpio.bus, rmw = rmw, stream_width = stream_width)
+
+    gpio_o = Cat(pin.o for pin in gpio.pins)
+
+    sim = Simulator(m)
+    sim.add_clock(1e-6)
+
+    @tb_with_bridge_client(sim, bridge)
+    async def client_testbench(ctx: SimulatorContext, bus_client):
+        await ctx.tick()
+
+        capabilities = await bus_client.get_capabilities()
+        assert capabilities.rmw == rmw
+
+        client = csr.Client(gpio_annotations(addr_width = 8, data_width = data_width), bus_client = bus_client)
+        counter = count_commands(bus_client)
+
+        await client.Output.write(0x0f)
+        await client.Output.set_bits(0x30)
+        await client.Output.clear_bits(0x03)
+        await client.Output.toggle_bits(0x81)
+        await client.Output.modify(0xf0, 0x5a)
+        await ctx.tick().repeat(20)
+        assert ctx.get(gpio_o) == 0x5d
+        assert await client.Output.read() == 0x5d
+
+        # Registers spanning several bus words are read and written back in full.
+        await client.Mode.write(0x0550)
+        await client.Mode.set_bits(0x0a00)
+        await client.Mode.clear_bits(0x0050)
+        assert await client.Mode.read() == 0x0f00
+
+        # Each modification is a single command, or a read and a write without bridge support.
+        modifications = 6
+        assert counter['sends'] == 4 + modifications * (1 if rmw else 2)
+
+    @sim.add_process
+    async def timeout(ctx: SimulatorContext):
+        await ctx.tick().repeat(10_000)
+        raise TimeoutError('Simulation timed out')
+
+    sim.run()
+
+def test_csr_client_coalescing():
+    async def main():
+        # Only 8-bit accesses, so multi-byte registers have to go through bursts.
+        transport = MockTransport(access_sizes = (0,))
+        client = csr.Client(csr_annotations([
+            (('a',), 0x00, 0x01),
+            (('b',), 0x01, 0x04),
+            (('c',), 0x04, 0x0c),
+        ], addr_width = 16, data_width = 8), bus_client = bridge.Client(transport))
+
+        await client.c.write(0x0123456789abcdef)
+        assert transport.memory[0x04:0x0c] == bytes.fromhex('efcdab8967452301')
+
+        transport.memory[0x00:0x04] = bytes([0x11, 0x22, 0x33, 0x44])
+
+        commands = transport.commands
+        assert await client.b.read() == 0x443322
+        assert await client.c.read() == 0x0123456789abcdef
+        assert transport.commands == commands + 2
+
+        sends = transport.sends
+        assert await client.read_many([client.c, client.a, client.b]) == [0x0123456789abcdef, 0x11, 0x443322]
+        assert transport.sends == sends + 1
+
+        # Adjacent registers are read and written in a single burst, in address order.
+        commands = transport.commands
+        await client.write_many({client.c: 0x1122334455667788, client.a: 0x99})
+        assert transport.commands == commands + 2
+        await client.write_many([(client.b, 0xaabbcc)])
+        assert transport.memory[0x00:0x0c] == bytes.fromhex('99ccbbaa8877665544332211')
+        assert await client.read_many([client.c, client.b, client.a]) == [0x1122334455667788, 0xaabbcc, 0x99]
+        assert transport.commands == commands + 4
+
+    asyncio.run(main())
+
+def test_csr_client_wait_for():
+    async def main():
+        annotations = csr_annotations([
+            (('status',), 0x00, 0x01),
+            (('wide',), 0x04, 0x0c),
+        ], addr_width = 16, data_width = 8)
+
+        transport = MockTransport(poll_timeout_width = 16)
+        client = csr.Client(annotations, bus_client = bridge.Client(transport))
+
+        transport.memory[0x00] = 0x81
+        sends = transport.sends
+        assert await client.status.wait_for(0x01, mask = 0x01) == 0x81
+        assert await client.status.wait_for(0x81) == 0x81
+        assert transport.sends == sends + 3
+
+        with pytest.raises(TimeoutError, match = 'status'):
+            await client.status.wait_for(0x00, mask = 0x01, timeout = 100)
+
+        # Registers that can't be read in a single access are polled from the host.
+        transport = MockTransport(access_sizes = (0,), poll_timeout_width = 16)
+        client = csr.Client(annotations, bus_client = bridge.Client(transport))
+
+        transport.memory[0x04:0x0c] = bytes(range(8))
+        commands = transport.commands
+        assert await client.wide.wait_for(0x07 << 56, mask = 0xff << 56) == 0x0706050403020100
+        with pytest.raises(TimeoutError):
+            await client.wide.wait_for(0, timeout = 2)
+        assert transport.commands == commands + 1 + 1 + 3
+
+    asyncio.run(main())
+
+def test_csr_client_cache():
+    async def main():
+        annotations = csr_annotations([
+            (('status',), 0x00, 0x01),
+            (('control',), 0x01, 0x02),
+            (('command',), 0x02, 0x03),
+            (('divisor',), 0x04, 0x08),
+            (('unknown',), 0x08, 0x09),
+            (('enable',), 0x09, 0x0a),
+            (('irq', 'mask'), 0x10, 0x11),
+            (('irq', 'pending'), 0x11, 0x12),
+        ], addr_width = 16, data_width = 8, access = {
+            ('status',): 'r',
+            ('control',): 'rw',
+            ('command',): 'w',
+            ('divisor',): 'rw',
+            ('enable',): 'rw',
+            ('irq', 'mask'): 'rw',
+            ('irq', 'pending'): 'rw',
+        })
+        host_owned = ['control', 'divisor', 'irq']
+
+        transport = MockTransport(rmw = True)
+        client = csr.Client(annotations, bus_client = bridge.Client(transport), cache = True, host_owned = host_owned, volatile = [('irq', 'pending')])
+        assert client.status.access == 'r' and client.unknown.access is None
+
+        await client._bus_client.get_capabilities()
+        transport.memory[0x00:0x02] = bytes([0x12, 0x34])
+        sends = transport.sends
+
+        # Read-only, unannotated and read/write registers that aren't host-owned always go to the hardware.
+        assert await client.status.read() == 0x12
+        transport.memory[0x00] = 0x13
+        assert await client.status.read() == 0x13
+        assert await client.unknown.read() == 0x00
+        await client.enable.write(0x01)
+        transport.memory[0x09] = 0x00
+        assert await client.enable.read() == 0x00
+        assert transport.sends == sends + 5
+        assert (client.cache_hits, client.cache_misses) == (0, 0)
+
+        # Write-only registers can only be read back once written.
+        with pytest.raises(LookupError, match = 'command'):
+            await client.command.read()
+        with pytest.raises(LookupError, match = 'command'):
+            await client.read_many([client.control, client.command])
+        assert transport.sends == sends + 5
+
+        # Host-owned registers are read once.
+        assert await client.control.read() == 0x34
+        assert await client.control.read() == 0x34
+        assert transport.sends == sends + 6
+        assert (client.cache_hits, client.cache_misses) == (1, 1)
+
+        # Writes go through and update the shadow copy, including write-only registers.
+        await client.command.write(0x55)
+        await client.divisor.write(0x12345678)
+        sends = transport.sends
+        assert await client.command.read() == 0x55
+        assert await client.divisor.read() == 0x12345678
+        await client.control.set_bits(0x01)
+        assert transport.memory[0x01] == 0x35
+        assert await client.control.read() == 0x35
+        assert transport.sends == sends + 1
+
+        # Registers under a volatile prefix aren't cached, even when host-owned.
+        await client.irq.mask.write(0x0f)
+        assert await client.irq.pending.read() == 0
+        transport.memory[0x10:0x12] = bytes([0x00, 0x01])
+        assert await client.irq.pending.read() == 0x01
+        assert await client.irq.mask.read() == 0x0f
+
+        # Batched reads only fetch the misses.
+        sends = transport.sends
+        assert await client.read_many([client.status, client.control, client.divisor]) == [0x13, 0x35, 0x12345678]
+        assert transport.sends == sends + 1
+
+        # Changes behind the host's back need an explicit invalidate or sync.
+        transport.memory[0x01] = 0x99
+        transport.memory[0x04] = 0x00
+        assert await client.control.read() == 0x35
+        client.control.invalidate()
+        assert await client.control.read() == 0x99
+        sends = transport.sends
+        await client.sync()
+        assert transport.sends == sends + 1
+        assert await client.divisor.read() == 0x12345600
+        assert await client.command.read() == 0x55
+
+        client.invalidate()
+        sends = transport.sends
+        assert await client.divisor.read() == 0x12345600
+        assert transport.sends == sends + 1
+
+        # The shadow copies are bounded, evicting the least recently used.
+        client = csr.Client(annotations, bus_client = bridge.Client(transport), cache = True, cache_size = 2, host_owned = host_owned)
+        await client.read_many([client.control, client.divisor])
+        await client.control.read()
+        await client.irq.pending.read()
+        sends = transport.sends
+        assert await client.control.read() == 0x99
+        assert transport.sends == sends
+        assert await client.divisor.read() == 0x12345600
+        assert transport.sends == sends + 1
+
+        # Caching is off by default.
+        client = csr.Client(annotations, bus_client = bridge.Client(transport))
+        await client.control.read()
+        sends = transport.sends
+        await client.control.read()
+        assert transport.sends == sends + 1
+
+    asyncio.run(main())
+
+def test_csr_sync_client():
+    annotations = csr_annotations([
+        (('status',), 0x00, 0x01),
+        (('control',), 0x01, 0x02),
+        (('wide',), 0x04, 0x0c),
+    ], addr_width = 16, data_width = 8, access = {('control',): 'rw'})
+
+    transport = MockTransport(access_sizes = (0,), poll_timeout_width = 16, rmw = True)
+    client = csr.SyncClient(annotations, bus_client = bridge.SyncClient(transport), cache = True, host_owned = ['control'])
+
+    client.wide.write(0x0123456789abcdef)
+    assert transport.memory[0x04:0x0c] == bytes.fromhex('efcdab8967452301')
+    assert client.wide.read() == 0x0123456789abcdef
+
+    client.control.write(0x0f)
+    client.control.set_bits(0x30)
+    client.wide.clear_bits(0xff)
+    assert transport.memory[0x01] == 0x3f
+    assert transport.memory[0x04] == 0x00
+
+    transport.memory[0x00] = 0x81
+    sends = transport.sends
+    assert client.read_many([client.status, client.control]) == [0x81, 0x3f]
+    assert client.status.wait_for(0x01, mask = 0x01) == 0x81
+    assert transport.sends == sends + 2
+    assert client.cache_hits == 1
+
+    with pytest.raises(TimeoutError, match = 'wide'):
+        client.wide.wait_for(0, timeout = 2)
@@ -0,0 +1,199 @@
+import asyncio
+import pytest
+import random
+import time
+
+from katsuo.bridge.client.transport import _framing
+from katsuo.bridge.client.transport._framing import encode_frames, FrameDecoder
+
+_framing_unpack = _framing._unpack
+
+from mock_transport import MockTransport
+
+def reference_frames(data, gaps):
+    # Bit at a time, in shift order.
+    bits = []
+    for b, gap in zip(data, gaps):
+        bits += [0] * gap
+        bits += [1] + [(b >> i) & 1 for i in range(8)]
+    bits += [0] * (-len(bits) % 8)
+    return bytes(sum(bit << i for i, bit in enumerate(bits[n:n + 8])) for n in range(0, len(bits), 8))
+
+def test_framing():
+    rng = random.Random(0)
+
+    for length in [0, 1, 7, 8, 9, 511, 512, 513, 2000]:
+        data = bytes(rng.randrange(256) for _ in range(length))
+        assert encode_frames(data) == reference_frames(data, [0] * length)
+
+        # Idle bits between frames, fed in arbitrarily sized pieces.
+        gaps = [rng.choice([0, 0, 0, 1, 5, 20, 700]) for _ in range(length)]
+        captured = reference_frames(data, gaps) + bytes(3)
+
+        decoder = FrameDecoder()
+        res = bytearray()
+        offset = 0
+        while offset < len(captured):
+            n = rng.randrange(1, 100)
+            decoder.feed(captured[offset:offset + n])
+            offset += n
+            res += decoder.decode(rng.randrange(1, 600))
+        res += decoder.decode(length)
+
+        assert res == data
+        assert decoder.decode(1) == b''
+
+    # A partial frame stays buffered.
+    decoder = FrameDecoder()
+    frame = encode_frames(b'\xa5')
+    decoder.feed(frame[:1])
+    assert decoder.decode(1) == b''
+    decoder.feed(frame[1:])
+    assert decoder.decode(1) == b'\xa5'
+
+def test_framing_window_edge():
+    # Frames starting in the last few bits of a decode window are decoded without waiting for more data.
+    window_bits = FrameDecoder._WINDOW * 8
+    for gap in range(window_bits - 12, window_bits + 1):
+        data = bytes([0xa5, 0x3c, 0xff])
+        decoder = FrameDecoder()
+        decoder.feed(reference_frames(data, [gap, 0, 3]))
+        assert decoder.decode(len(data)) == data
+
+def test_framing_benchmark(monkeypatch):
+    unpacked = []
+    def unpack(x, count):
+        unpacked.append(count)
+        return _framing_unpack(x, count)
+    monkeypatch.setattr(_framing, '_unpack', unpack)
+
+    rng = random.Random(0)
+    data = rng.randbytes(2 << 20)
+
+    # Captured shift data: bursts of back-to-back frames, separated by idle bits.
+    captured = bytearray()
+    for offset in range(0, len(data), 4096):
+        captured += encode_frames(data[offset:offset + 4096]) + bytes(3)
+
+    start = time.perf_counter()
+    decoder = FrameDecoder()
+    decoder.feed(captured)
+    res = decoder.decode(len(data))
+    decode = time.perf_counter() - start
+
+    start = time.perf_counter()
+    encode_frames(data)
+    encode = time.perf_counter() - start
+
+    assert res == data
+
+    print(f'2 MiB of frames: decode {len(data) / decode / 1e6:.1f} MB/s, encode {len(data) / encode / 1e6:.1f} MB/s')
+
+    # Work done, counted, as wall-clock time on a shared machine is too noisy to assert on. Every frame is unpacked
+    # exactly once, a whole block at a time except where a burst of frames ends.
+    assert sum(unpacked) == len(data)
+    assert len(unpacked) <= len(data) // _framing._BLOCK + len(data) // 4096
+
+class FakeFtdi:
+    """Lattice ER1 data register with a `csr.Bridge` model behind it, on the MPSSE byte shift commands."""
+
+    fifo_sizes = (4096, 4096)
+
+    def __init__(self, bridge):
+        self.bridge = bridge
+        self.decoder = FrameDecoder()
+        self.responses = bytearray()
+        self.rx = bytearray()
+
+    def write_data(self, data):
+        assert data[0] == 0x39 and data[-1] == 0x87
+        length = data[1] + (data[2] << 8) + 1
+        tdi = data[3:-1]
+        assert len(tdi) == length
+
+        self.decoder.feed(tdi)
+        for b in self.decoder.decode(len(tdi)):
+            self.bridge._parser.send(b)
+        self.responses += self.bridge._rx_buffer
+        self.bridge._rx_buffer.clear()
+
+        # Responses are shifted out in whole frames once the commands have been shifted in.
+        idle = len(tdi.rstrip(b'\0'))
+        count = min((length - idle) * 8 // 9, len(self.responses))
+        tdo = bytes(idle) + encode_frames(self.responses[:count])
+        del self.responses[:count]
+        self.rx += tdo + bytes(length - len(tdo))
+
+    def read_data_bytes(self, size, attempt):
+        res, self.rx = bytes(self.rx[:size]), self.rx[size:]
+        return res
+
+class FakeJtagEngine:
+    def __init__(self, frequency):
+        self.frequency = frequency
+        self.controller = self
+
+    def configure(self, url):
+        pass
+
+    def reset(self):
+        pass
+
+    def read_dr(self, length):
+        return 0x41111043
+
+    def write_ir(self, ir):
+        pass
+
+    def change_state(self, state):
+        pass
+
+    def go_idle(self):
+        pass
+
+    def sync(self):
+        pass
+
+def test_jtag_coalescing(monkeypatch):
+    pytest.importorskip('pyftdi')
+    from katsuo.bridge.client.transport import jtag, open_url
+    from katsuo.bridge.client.bridge import Client
+
+    bridge = MockTransport()
+    engine = FakeJtagEngine.__new__(FakeJtagEngine)
+
+    def make_engine(frequency):
+        engine.__init__(frequency)
+        engine.ftdi = FakeFtdi(bridge)
+        return engine
+    monkeypatch.setattr(jtag, 'JtagEngine', make_engine)
+
+    async def main():
+        with open_url('jtag+ftdi://ftdi:2232h/1?freq=15e6&readahead=256') as transport:
+            assert engine.frequency == 15e6
+
+            client = Client(transport)
+            await client.get_capabilities()
+
+            bridge.memory[:256] = bytes(range(256))
+
+            # Sends are buffered until a response is needed.
+            shifts = transport.shifts
+            async with client.batch() as batch:
+                futures = [batch.read_8b(i) for i in range(32)] + [batch.write_8b(0x100, [0x55])]
+                data = batch.read_8b(0x80, 128)
+            assert transport.shifts == shifts + 1
+
+            assert [f.result() for f in futures[:32]] == [[i] for i in range(32)]
+            assert data.result() == list(range(0x80, 0x100))
+            assert bridge.memory[0x100] == 0x55
+
+            # Without read-ahead, the responses are shifted out a few at a time.
+            transport._readahead = 0
+            shifts = transport.shifts
+            async with client.batch() as batch:
+                futures = [batch.read_8b(i) for i in range(32)]
+            assert [f.result() for f in futures] == [[i] for i in range(32)]
+            assert 1 < transport.shifts - shifts < 32
+
+    asyncio.run(main())
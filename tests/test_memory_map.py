@@ -0,0 +1,137 @@
+import collections
+import time
+
+from katsuo.bridge.client import csr
+from katsuo.bridge.client.csr import MemoryMap, Register
+
+MEMORY_MAP_SCHEMA = 'https://amaranth-lang.org/schema/amaranth-soc/0.1/memory/memory-map.json'
+CSR_ELEMENT_SCHEMA = 'https://amaranth-lang.org/schema/amaranth-soc/0.1/csr/element.json'
+
+def element_annotations(access, size, data_width):
+    if access is None:
+        return {}
+    return {CSR_ELEMENT_SCHEMA: {'width': size * data_width, 'access': access}}
+
+def memory_map(resources = [], windows = [], *, data_width = 8, access = {}):
+    return {
+        MEMORY_MAP_SCHEMA: {
+            'addr_width': 16,
+            'data_width': data_width,
+            'alignment': 0,
+            'windows': [
+                {'name': list(name) if name is not None else None, 'start': start, 'end': end, 'ratio': 1, 'annotations': annotations}
+                for name, start, end, annotations in windows
+            ],
+            'resources': [
+                {'name': list(name), 'start': start, 'end': end, 'annotations': element_annotations(access.get(name), end - start, data_width)}
+                for name, start, end in resources
+            ],
+        },
+    }
+
+def test_memory_map():
+    uart = memory_map([
+        (('rx', 'data'), 0x0, 0x1),
+        (('rx', 'ready'), 0x1, 0x2),
+        (('tx', 'data'), 0x2, 0x3),
+        (('divisor',), 0x4, 0x6),
+    ])
+    timer = memory_map([
+        (('counter',), 0x0, 0x4),
+    ])
+    root = MemoryMap(memory_map([
+        (('id',), 0x0, 0x4),
+        (('leds', '0'), 0x4, 0x5),
+        (('leds', '1'), 0x5, 0x6),
+    ], [
+        (('uart',), 0x100, 0x108, uart),
+        (('timers', '0'), 0x200, 0x204, timer),
+        (None, 0x300, 0x304, memory_map([(('scratch',), 0x0, 0x4)])),
+    ]))
+
+    # Windows are listed before resources.
+    assert [element.path for element in root] == [('uart',), ('timers',), ('scratch',), ('id',), ('leds',)]
+
+    reg = root.uart.rx.data
+    assert isinstance(reg, Register)
+    assert reg.path == ('uart', 'rx', 'data')
+    assert reg.offset == 0x100
+
+    assert root['uart', 'divisor']._offset == 0x104
+    assert root['uart', 'divisor'].width == 16
+    assert root.timers[0].counter._offset == 0x200
+    assert root.leds[1]._offset == 0x5
+    assert root.scratch._offset == 0x300
+    assert [element.path for element in root.uart.rx] == [('uart', 'rx', 'data'), ('uart', 'rx', 'ready')]
+    assert [element.path for element in root.leds] == [('leds', '0'), ('leds', '1')]
+
+    assert root['nonexistent'] is None
+    assert root['uart', 'rx', 'nonexistent'] is None
+
+    # Flat register table, in address order.
+    assert [(r.path, r._offset) for r in root.registers()] == [
+        (('id',), 0x0),
+        (('leds', '0'), 0x4),
+        (('leds', '1'), 0x5),
+        (('uart', 'rx', 'data'), 0x100),
+        (('uart', 'rx', 'ready'), 0x101),
+        (('uart', 'tx', 'data'), 0x102),
+        (('uart', 'divisor'), 0x104),
+        (('timers', '0', 'counter'), 0x200),
+        (('scratch',), 0x300),
+    ]
+    assert [(r.path, r._offset) for r in root.uart.rx.registers()] == [
+        (('uart', 'rx', 'data'), 0x100),
+        (('uart', 'rx', 'ready'), 0x101),
+    ]
+    assert [(r.path, r._offset) for r in root.timers.registers()] == [
+        (('timers', '0', 'counter'), 0x200),
+    ]
+
+def walk(element):
+    count = 0
+    for child in element:
+        if isinstance(child, Register):
+            count += 1
+        else:
+            count += walk(child)
+    return count
+
+def test_memory_map_benchmark(monkeypatch):
+    # Work done, counted, as wall-clock time on a shared machine is too noisy to assert on.
+    counts = collections.Counter()
+    def count(name, func):
+        def wrapper(*args, **kwargs):
+            counts[name] += 1
+            return func(*args, **kwargs)
+        return wrapper
+    monkeypatch.setattr(csr._Index, '__init__', count('indexes', csr._Index.__init__))
+    monkeypatch.setattr(csr._Node, '__init__', count('nodes', csr._Node.__init__))
+    monkeypatch.setattr(MemoryMap, '_wrap', count('wraps', MemoryMap._wrap))
+
+    # 100 peripherals with 100 registers each.
+    windows = []
+    for i in range(100):
+        peripheral = memory_map([((f'reg{j}',), j, j + 1) for j in range(100)])
+        windows.append(((f'periph{i}',), i * 0x100, i * 0x100 + 100, peripheral))
+    annotations = memory_map([], windows)
+
+    start = time.perf_counter()
+    root = MemoryMap(annotations)
+    build = time.perf_counter() - start
+
+    start = time.perf_counter()
+    assert walk(root) == 10_000
+    full_walk = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for i in range(100):
+        for j in range(100):
+            assert root[f'periph{i}', f'reg{j}'].offset == i * 0x100 + j
+    lookups = time.perf_counter() - start
+
+    print(f'10k registers: build {build * 1e3:.1f} ms, walk {full_walk * 1e3:.1f} ms, 10k lookups {lookups * 1e3:.1f} ms')
+
+    # The index is built once, with a node per window and register, and shared by every view into it. Walking wraps
+    # each node once, and a lookup only wraps the nodes on its path.
+    assert counts == {'indexes': 1, 'nodes': 1 + 100 + 10_000, 'wraps': 10_100 + 2 * 10_000}
@@ -0,0 +1,112 @@
+import json
+import os
+import subprocess
+import sys
+
+from katsuo.bridge.client import csr
+from katsuo.bridge.client.metadata import load, CACHE_SUFFIX, _CompiledIndex
+
+from test_memory_map import memory_map
+
+def write_metadata(path, annotations):
+    path.write_text(json.dumps({'interface': {'members': {'bus': {'annotations': annotations}}}}))
+
+def design():
+    uart = memory_map([
+        (('rx', 'data'), 0x0, 0x1),
+        (('rx', 'ready'), 0x1, 0x2),
+        (('divisor',), 0x4, 0x6),
+    ], access = {('rx', 'data'): 'r', ('divisor',): 'rw'})
+    return memory_map([
+        (('id',), 0x0, 0x4),
+        (('leds', '0'), 0x4, 0x5),
+        (('leds', '1'), 0x5, 0x6),
+    ], [
+        (('uart',), 0x100, 0x108, uart),
+        (None, 0x300, 0x304, memory_map([(('scratch',), 0x0, 0x4)])),
+    ])
+
+def summary(element):
+    return [
+        (child.path, getattr(child, '_offset', None), getattr(child, 'width', None), summary(child) if not isinstance(child, csr.Register) else None)
+        for child in element
+    ]
+
+def test_metadata_cache(tmp_path):
+    path = tmp_path / 'soc.json'
+    write_metadata(path, design())
+    cache_path = tmp_path / ('soc.json' + CACHE_SUFFIX)
+
+    reference = csr.MemoryMap(design())
+
+    # First load compiles the cache.
+    index = load(path)
+    assert cache_path.exists()
+
+    # Second load maps the cache.
+    index = load(path)
+    assert isinstance(index, _CompiledIndex)
+    assert (index.addr_width, index.data_width) == (16, 8)
+
+    memory_map_ = csr.MemoryMap.from_index(index)
+    assert summary(memory_map_) == summary(reference)
+    assert memory_map_.uart.rx.ready._offset == 0x101
+    assert memory_map_['uart', 'divisor'].width == 16
+    assert memory_map_['uart', 'divisor'].access == 'rw'
+    assert memory_map_.uart.rx.data.access == 'r'
+    assert memory_map_.id.access is None
+    assert memory_map_.scratch._offset == 0x300
+    assert memory_map_['nonexistent'] is None
+    assert [(r.path, r._offset, r.access) for r in memory_map_.registers()] == [(r.path, r._offset, r.access) for r in reference.registers()]
+    assert [(r.path, r._offset) for r in memory_map_.uart.registers()] == [(r.path, r._offset) for r in reference.uart.registers()]
+
+    # Touching the metadata file keeps the cache when the contents are unchanged.
+    os.utime(path, ns = (0, 0))
+    compiled = cache_path.read_bytes()
+    assert isinstance(load(path), _CompiledIndex)
+    assert cache_path.read_bytes()[64:] == compiled[64:]
+    assert isinstance(load(path), _CompiledIndex)
+
+    # Changed contents are recompiled.
+    annotations = design()
+    annotations['https://amaranth-lang.org/schema/amaranth-soc/0.1/memory/memory-map.json']['resources'].append(
+        {'name': ['extra'], 'start': 0x10, 'end': 0x11, 'annotations': {}})
+    write_metadata(path, annotations)
+    memory_map_ = csr.MemoryMap.from_index(load(path))
+    assert memory_map_.extra._offset == 0x10
+    assert csr.MemoryMap.from_index(load(path)).extra._offset == 0x10
+
+    # Loading without cache.
+    assert csr.MemoryMap.from_index(load(path, cache = False)).extra._offset == 0x10
+
+def test_cli_imports():
+    # The CLI and client shouldn't pull in Amaranth.
+    code = 'import sys, katsuo.bridge.cli, katsuo.bridge.client.csr; assert "amaranth" not in sys.modules, "amaranth imported"'
+    subprocess.run([sys.executable, '-c', code], check = True)
+
+def test_annotations_import_order():
+    # Annotations come from `katsuo.bridge.annotations` alone, including for a bus built before it is imported.
+    code = '''if True:
+        import sys
+        from amaranth.lib import wiring
+        from amaranth_soc import csr
+        from amaranth_soc.memory import MemoryMap
+        import katsuo.bridge
+
+        class Register(wiring.Component):
+            def __init__(self):
+                super().__init__({'element': wiring.Out(csr.Element.Signature(8, 'rw'))})
+
+        memory_map = MemoryMap(addr_width = 4, data_width = 8)
+        memory_map.add_resource(Register(), name = ('ctrl',), size = 1)
+        bus = csr.Interface(addr_width = 4, data_width = 8)
+        bus.memory_map = memory_map
+        assert not list(bus.signature.annotations(bus))
+
+        import katsuo.bridge.annotations
+        from katsuo.bridge.client.csr import MemoryMap
+        assert 'katsuo.bridge.csr' not in sys.modules and 'katsuo.bridge.wishbone' not in sys.modules
+        annotations = {annotation.schema['$id']: annotation.as_json() for annotation in bus.signature.annotations(bus)}
+        assert MemoryMap(annotations).ctrl.access == 'rw'
+    '''
+    subprocess.run([sys.executable, '-c', code], check = True)
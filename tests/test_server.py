@@ -0,0 +1,86 @@
+import asyncio
+import time
+
+from katsuo.bridge.client.bridge import Client, _RMW_TOGGLE, _RMW_WRITE
+from katsuo.bridge.client.server import Server
+from katsuo.bridge.client.transport import open_url
+
+from mock_transport import MockTransport
+
+def test_server(tmp_path):
+    url = f'unix://{tmp_path}/bridge.sock'
+
+    async def main():
+        bridge = MockTransport(latency = 1e-3, poll_timeout_width = 16, rmw = True)
+        bridge.memory[:0x100] = bytes(range(0x100))
+
+        server = Server(bridge, quantum = 16)
+        serve = asyncio.create_task(server.serve(url))
+        while server.capabilities is None:
+            await asyncio.sleep(0)
+        await asyncio.sleep(0.01)
+
+        # Capabilities are answered by the daemon, without the shared address register.
+        client = Client(open_url(url))
+        capabilities = await client.get_capabilities()
+        assert not capabilities.no_addr
+        assert capabilities.burst_width == 8
+
+        assert await client.read_8b(0x10, 4) == [0x10, 0x11, 0x12, 0x13]
+        await client.write_16b(0x200, [0x1234])
+        assert bridge.memory[0x200:0x202] == bytes([0x34, 0x12])
+
+        # Polls are forwarded, including timeouts.
+        assert await client.poll_8b(0x10, 0xff, 0x10) == (0x10, False)
+        assert await client.poll_16b(0x200, 0xffff, 0x1235) == (0x1234, True)
+
+        # As are read-modify-writes.
+        await client._rmw(_RMW_TOGGLE, 1, 0x200, 0x0101)
+        await client._rmw(_RMW_WRITE, 0, 0x201, 0xf0, 0xa0)
+        assert bridge.memory[0x200:0x202] == bytes([0x35, 0xa3])
+
+        # Commands without an address phase continue from the client's own address; no-ops and reserved commands are
+        # handled by the daemon.
+        raw = open_url(url)
+        await raw.send(bytes([0x48, 2, 0x20, 0x00, 0x00, 0x58, 2, 0xff, 0x50]))
+        assert await raw.recv(9) == bytes([0x01, 0x20, 0x21, 0x01, 0x22, 0x23, 0xff, 0x01, 0x24])
+
+        # A long batch from one client doesn't hold up another.
+        flood = Client(open_url(url))
+        await flood.get_capabilities()
+        async def long_batch():
+            async with flood.batch() as batch:
+                futures = [batch.read_8b(i) for i in range(256)]
+            return futures
+        task = asyncio.create_task(long_batch())
+        await asyncio.sleep(5e-3)
+        assert await client.read_8b(0x42) == [0x42]
+        assert not task.done()
+        futures = await task
+        assert [f.result() for f in futures] == [[i] for i in range(256)]
+
+        # Per invocation latency, with a fresh connection each time.
+        n = 20
+        start = time.perf_counter()
+        for _ in range(n):
+            invocation = Client(open_url(url))
+            await invocation.get_capabilities()
+            await invocation.read_8b(0x10)
+            invocation.transport.writer.close()
+        via_daemon = (time.perf_counter() - start) / n
+
+        start = time.perf_counter()
+        for _ in range(n):
+            invocation = Client(bridge)
+            await invocation.get_capabilities()
+            await invocation.read_8b(0x10)
+        direct = (time.perf_counter() - start) / n
+
+        print(f'Per invocation latency with {bridge.latency * 1e3:.0f} ms link latency: direct {direct * 1e3:.2f} ms, via daemon {via_daemon * 1e3:.2f} ms')
+
+        for transport in [client.transport, raw, flood.transport]:
+            transport.writer.close()
+        await asyncio.sleep(0.01)
+        serve.cancel()
+
+    asyncio.run(main())
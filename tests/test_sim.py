@@ -0,0 +1,139 @@
+import pytest
+import time
+
+from amaranth import Module, Signal, Cat
+from amaranth.sim import Simulator, SimulatorContext
+from amaranth_soc.gpio import Peripheral as GpioPeripheral
+
+from katsuo.bridge.sim import tb_with_bridge_client, SimBusClient
+from katsuo.bridge.csr import Bridge
+from katsuo.bridge.client import csr
+
+from test_csr_client import gpio_annotations
+
+def test_sim_throughput():
+    m = Module()
+    m.submodules.gpio = gpio = GpioPeripheral(pin_count = 8, addr_width = 8, data_width = 8)
+    m.submodules.bridge = bridge = Bridge(gpio.bus)
+
+    # Simulated cycles and stream transfers, as wall-clock time is too noisy to assert on.
+    cycle = Signal(32)
+    transfers = Signal(32)
+    m.d.sync += [
+        cycle.eq(cycle + 1),
+        transfers.eq(transfers + (bridge.input.valid & bridge.input.ready) + (bridge.output.valid & bridge.output.ready)),
+    ]
+
+    sim = Simulator(m)
+    sim.add_clock(1e-6)
+
+    length = 4096
+    results = {}
+
+    @tb_with_bridge_client(sim, bridge)
+    async def client_testbench(ctx: SimulatorContext, bus_client):
+        await bus_client.get_capabilities()
+
+        await bus_client.write_8b(0x03, [0x5a])
+
+        start = time.perf_counter(), ctx.get(cycle), ctx.get(transfers)
+        assert await bus_client.read_8b(0x03, length, increment = False) == [0x5a] * length
+        await bus_client.write_8b(0x03, bytes(length), increment = False)
+        end = time.perf_counter(), ctx.get(cycle), ctx.get(transfers)
+        results['elapsed'], results['cycles'], results['transfers'] = (b - a for a, b in zip(start, end))
+
+    sim.run()
+
+    elapsed, cycles, transfers = results['elapsed'], results['cycles'], results['transfers']
+    print(f'Simulated {transfers} stream bytes in {cycles} cycles, at {transfers / elapsed:.0f} bytes/s')
+
+    # The data goes through the streams with a few command and status bytes per burst, and the streams are never left
+    # waiting on the testbench: the bursts of the read are pipelined, so the cycles don't even add up to the bytes.
+    assert 2 * length < transfers < 2 * length + 128
+    assert cycles <= transfers
+
+@pytest.mark.parametrize('data_width', [8, 16, 32])
+def test_sim_bus_client(data_width):
+    m = Module()
+    m.submodules.gpio = gpio = GpioPeripheral(pin_count = 8, addr_width = 8, data_width = data_width)
+
+    gpio_oe = Cat(pin.oe for pin in gpio.pins)
+    gpio_o = Cat(pin.o for pin in gpio.pins)
+
+    sim = Simulator(m)
+    sim.add_clock(1e-6)
+
+    @sim.add_testbench
+    async def testbench(ctx: SimulatorContext):
+        bus_client = SimBusClient(ctx, gpio.bus)
+        capabilities = await bus_client.get_capabilities()
+        assert capabilities.data_width == data_width
+        assert not capabilities.access_8b or data_width == 8
+
+        client = csr.Client(gpio_annotations(addr_width = 8, data_width = data_width), bus_client = bus_client)
+
+        await client.Mode.write(0x0550)
+        assert ctx.get(gpio_oe) == 0x3c
+        assert await client.Mode.read() == 0x0550
+
+        await client.Output.write(0xa5)
+        assert ctx.get(gpio_o) & 0x3c == 0x24
+
+        assert await client.read_many([client.Output, client.Mode]) == [0xa5, 0x0550]
+
+        # Bursts.
+        read = getattr(bus_client, f'read_{data_width}b')
+        write = getattr(bus_client, f'write_{data_width}b')
+        output = client.Output.offset
+        assert await read(output, 3, increment = False) == [0xa5] * 3
+        await write(output, [0x01, 0x02, 0x03], increment = False)
+        assert await read(output) == [0x03]
+        assert await read(output, 0) == []
+
+        async with bus_client.batch() as batch:
+            first = batch._read(client._word_size, 0)
+            batch._write(client._word_size, output, [0x42])
+            second = batch._read(client._word_size, output)
+        assert await first == [0x0550 & ((1 << data_width) - 1)]
+        assert await second == [0x42]
+
+    sim.run()
+
+def test_sim_bus_client_benchmark():
+    length = 1024
+    cycles = {}
+
+    for direct in [False, True]:
+        m = Module()
+        m.submodules.gpio = gpio = GpioPeripheral(pin_count = 8, addr_width = 8, data_width = 8)
+        if not direct:
+            m.submodules.bridge = bridge = Bridge(gpio.bus)
+
+        # Simulated cycles, as wall-clock time is too noisy to compare.
+        cycle = Signal(32)
+        m.d.sync += cycle.eq(cycle + 1)
+
+        sim = Simulator(m)
+        sim.add_clock(1e-6)
+
+        async def run(ctx, bus_client):
+            await bus_client.get_capabilities()
+            start = ctx.get(cycle)
+            await bus_client.write_8b(0x03, bytes(range(256)) * (length // 256), increment = False)
+            assert await bus_client.read_8b(0x03, length, increment = False) == [0xff] * length
+            cycles[direct] = ctx.get(cycle) - start
+
+        if direct:
+            @sim.add_testbench
+            async def testbench(ctx: SimulatorContext):
+                await run(ctx, SimBusClient(ctx, gpio.bus))
+        else:
+            tb_with_bridge_client(sim, bridge)(run)
+
+        sim.run()
+
+    print(f'{length} byte write and read: bridge {cycles[False]} cycles, direct {cycles[True]} cycles')
+
+    # The direct path strobes a byte per cycle, without the command and status bytes going through the streams.
+    assert cycles[True] == 2 * length
+    assert cycles[True] < cycles[False]
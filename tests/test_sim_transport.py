@@ -0,0 +1,101 @@
+import asyncio
+import functools
+import pytest
+
+from amaranth import Module
+from amaranth_soc.gpio import Peripheral as GpioPeripheral
+from amaranth_soc.wishbone.sram import WishboneSRAM
+
+from katsuo.bridge.csr import Bridge
+from katsuo.bridge.wishbone import Bridge as WishboneBridge
+from katsuo.bridge.client.bridge import Client, _RMW_TOGGLE
+from katsuo.bridge.client.transport import open_url
+
+def gpio_bridge():
+    m = Module()
+    m.submodules.gpio = gpio = GpioPeripheral(pin_count = 8, addr_width = 8, data_width = 8)
+    m.submodules.bridge = bridge = Bridge(gpio.bus)
+    return m, bridge
+
+def test_sim_transport():
+    async def main():
+        with open_url(f'sim://{__name__}:gpio_bridge') as transport:
+            client = Client(transport)
+            capabilities = await client.get_capabilities()
+            assert capabilities.addr_width == 8
+
+            await client.write_16b(0x00, [0x0550])
+            assert await client.read_16b(0x00) == [0x0550]
+
+            async with client.batch() as batch:
+                futures = [batch.read_8b(i) for i in range(6)]
+            assert [f.result() for f in futures] == [[0x50], [0x05], [0x00], [0x00], [0x00], [0x00]]
+
+            # Cycle counts for each exchange, and for each command in it.
+            assert len(transport.cycles) == 4
+            assert all(cycles > 0 for cycles in transport.cycles)
+            assert [len(commands) for commands in transport.command_cycles] == [1, 1, 1, 6]
+            for cycles, commands in zip(transport.cycles, transport.command_cycles):
+                assert all(0 < command <= cycles for command in commands)
+            # The 16-bit write takes one cycle per request byte, and the batched reads overlap.
+            assert transport.command_cycles[1] == [4]
+            assert sum(transport.command_cycles[3]) > transport.cycles[3]
+            print(f'Cycles per exchange: {transport.cycles}, per command: {transport.command_cycles}')
+
+    asyncio.run(main())
+
+def wide_gpio_bridge(stream_width = 32):
+    m = Module()
+    m.submodules.gpio = gpio = GpioPeripheral(pin_count = 8, addr_width = 8, data_width = 8)
+    m.submodules.bridge = bridge = Bridge(gpio.bus, stream_width = stream_width)
+    return m, bridge
+
+wide_gpio_bridge_16 = functools.partial(wide_gpio_bridge, stream_width = 16)
+
+@pytest.mark.parametrize('factory', ['wide_gpio_bridge_16', 'wide_gpio_bridge'])
+def test_sim_transport_wide_stream(factory):
+    async def main():
+        with open_url(f'sim://{__name__}:{factory}') as transport:
+            client = Client(transport)
+            await client.get_capabilities()
+
+            await client.write_16b(0x00, [0x0550])
+            assert await client.read_16b(0x00) == [0x0550]
+            assert await client.read_8b(0x00, 2) == [0x50, 0x05]
+
+            # The bridge is busy for longer than the idle time while polling and modifying, without taking input.
+            assert await client.poll_8b(0x00, 0xff, 0x00, timeout = 200) == (0x50, True)
+            await client._rmw(_RMW_TOGGLE, 1, 0x00, 0xffff)
+            assert await client.read_16b(0x00) == [0xfaaf]
+
+    asyncio.run(main())
+
+def wishbone_sram_bridge():
+    m = Module()
+    m.submodules.sram = sram = WishboneSRAM(size = 1024, data_width = 32, granularity = 8)
+    m.submodules.bridge = bridge = WishboneBridge(sram.wb_bus)
+    return m, bridge
+
+def test_sim_transport_concurrent():
+    async def main():
+        with open_url(f'sim://{__name__}:wishbone_sram_bridge') as transport:
+            client = Client(transport)
+            await client.get_capabilities()
+            poller = client.with_priority(-1)
+
+            async def worker(i):
+                await client.write_32b(4 * i, [i * 0x01010101])
+                assert await client.read_32b(4 * i) == [i * 0x01010101]
+                assert await client.read_8b(4 * i + 1) == [i]
+
+            async def poll(i):
+                # Background polling of a word nobody writes, coalesced between pollers.
+                for _ in range(4):
+                    assert await poller.read_32b(0x3fc) == [0]
+
+            await asyncio.gather(*(worker(i) for i in range(255)), *(poll(i) for i in range(100)))
+
+            assert client.round_trips < 100
+            print(f'{255 * 3 + 100 * 4} requests in {client.round_trips} round trips')
+
+    asyncio.run(main())
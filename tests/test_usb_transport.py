@@ -0,0 +1,140 @@
+import asyncio
+import types
+import pytest
+
+nusb = pytest.importorskip('nusb')
+
+from katsuo.bridge.client.transport import usb
+from katsuo.bridge.client.bridge import Client, SyncClient
+
+from mock_transport import MockTransport
+
+def interface_descriptor(number, alternate, endpoints):
+    return bytes([9, 0x04, number, alternate, len(endpoints), 0xff, 0, 0, 0]) + b''.join(
+        bytes([7, 0x05, address, attributes, max_packet_size & 0xff, max_packet_size >> 8, 0])
+        for address, attributes, max_packet_size in endpoints
+    )
+
+def test_bulk_endpoints():
+    descriptors = b''.join([
+        bytes([9, 0x02, 0, 0, 3, 1, 0, 0x80, 50]),
+        interface_descriptor(0, 0, [(0x83, 0x03, 8)]),
+        interface_descriptor(1, 0, [(0x82, 0x02, 512), (0x03, 0x02, 512)]),
+        interface_descriptor(1, 1, [(0x84, 0x02, 64), (0x05, 0x02, 64)]),
+        interface_descriptor(2, 0, [(0x81, 0x02, 64), (0x01, 0x02, 64)]),
+    ])
+
+    assert usb._bulk_endpoints(descriptors, 1) == (0x82, 0x03, 512)
+    assert usb._bulk_endpoints(descriptors, 2) == (0x81, 0x01, 64)
+    with pytest.raises(AssertionError):
+        usb._bulk_endpoints(descriptors, 0)
+
+def test_receive_buffer():
+    buf = usb._ReceiveBuffer()
+    buf.append(b'abc')
+    buf.append(b'')
+    buf.append(b'defgh')
+    assert len(buf) == 8
+
+    assert buf.read(2) == b'ab'
+    assert buf.read(3) == b'cde'
+    assert buf.read(0) == b''
+    assert buf.read(3) == b'fgh'
+    assert len(buf) == 0
+
+class FakeInterface:
+    """Bulk endpoints of a device streaming `data`, or of a `csr.Bridge` model if `bridge` is given."""
+
+    def __init__(self, data = b'', bridge = None):
+        self.data = bytearray(data)
+        self.bridge = bridge
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def bulk_out(self, endpoint, data):
+        assert endpoint == 0x01
+        self.bridge.write(data)
+        self.data += self.bridge.read(len(self.bridge._rx_buffer))
+
+    async def bulk_in(self, endpoint, length):
+        assert endpoint == 0x81
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            # Like a device, complete the transfer once there's data.
+            await asyncio.sleep(0)
+            while not self.data:
+                await asyncio.sleep(0)
+        finally:
+            self.in_flight -= 1
+        res, self.data = bytes(self.data[:length]), self.data[length:]
+        return res
+
+class FakeDevice:
+    def __init__(self, interface):
+        self.interface = interface
+
+    def control_in_blocking(self, control_type, recipient, request, value, index, length, timeout):
+        assert (request, value) == (0x06, 0x0200)
+        return bytes([9, 0x02, 0, 0, 2, 1, 0, 0x80, 50]) + b''.join([
+            interface_descriptor(0, 0, [(0x82, 0x03, 8)]),
+            interface_descriptor(1, 0, [(0x81, 0x02, 512), (0x01, 0x02, 512)]),
+        ])
+
+    def claim_interface(self, number):
+        assert number == 1
+        return self.interface
+
+class FakeDeviceInfo:
+    vendor_id = 0x1209
+    product_id = 0x3443
+
+    def __init__(self, interface):
+        self.interfaces = [
+            types.SimpleNamespace(interface_string = 'Debug', interface_number = 0),
+            types.SimpleNamespace(interface_string = 'katsuo.bridge', interface_number = 1),
+        ]
+        self.device = FakeDevice(interface)
+
+    def open(self):
+        return self.device
+
+@pytest.fixture
+def fake_device(monkeypatch):
+    def attach(interface):
+        monkeypatch.setattr(usb.nusb, 'list_devices', lambda: [FakeDeviceInfo(interface)])
+        return interface
+    return attach
+
+def test_usb_transport_queue(fake_device):
+    interface = fake_device(FakeInterface(bytes(range(256)) * 64))
+    transport = usb.UsbTransport(transfer_size = 500, queue_depth = 4)
+
+    async def main():
+        res = bytearray()
+        for length in [1, 1000, 5000, 10000]:
+            res += await transport.recv(length)
+        return res
+
+    assert asyncio.run(main()) == (bytes(range(256)) * 64)[:16001]
+    assert interface.max_in_flight == 4
+
+def test_usb_transport_loops(fake_device):
+    fake_device(FakeInterface(bridge = MockTransport()))
+    transport = usb.UsbTransport(transfer_size = 64)
+
+    async def main():
+        client = Client(transport)
+        await client.get_capabilities()
+        await client.write_8b(0x100, list(range(64)))
+        return client.capabilities
+
+    # Transfers queued on the loop of the async client are replaced once it's gone.
+    capabilities = asyncio.run(main())
+    with SyncClient(transport) as client:
+        client.capabilities = capabilities
+        assert client.read_8b(0x100, 64) == list(range(64))
+
+    async def main():
+        return await Client(transport).read_8b(0x100, 16, increment = False)
+    assert asyncio.run(main()) == [0] * 16
@@ -0,0 +1,138 @@
+import asyncio
+import random
+import pytest
+
+from amaranth import Module, Signal
+from amaranth.lib import wiring
+from amaranth.sim import Simulator, SimulatorContext
+from amaranth_soc import wishbone
+from amaranth_soc.wishbone.sram import WishboneSRAM
+
+from katsuo.bridge.sim import tb_with_bridge_client
+from katsuo.bridge.wishbone import Bridge
+from katsuo.bridge.client import wishbone as wishbone_client
+from katsuo.bridge.client.bridge import Client
+
+from mock_transport import MockTransport
+
+@pytest.mark.parametrize(('data_width', 'wait_states', 'bursts', 'stream_width', 'input_gap'), [
+    (32, 0, False, 8, 0),
+    (32, 0, True, 8, 0),
+    (32, 3, True, 8, 0),
+    (8, 1, False, 8, 0),
+    (16, 0, True, 8, 0),
+    (64, 2, True, 8, 0),
+    (32, 0, True, 32, 0),
+    (32, 1, False, 16, 0),
+    (64, 0, True, 32, 0),
+    (8, 0, False, 16, 0),
+    (32, 0, True, 8, 3),
+    (64, 1, True, 32, 2),
+])
+def test_wishbone_bridge(data_width, wait_states, bursts, stream_width, input_gap):
+    m = Module()
+
+    m.submodules.sram = sram = WishboneSRAM(size = 1024, data_width = data_width, granularity = 8)
+
+    features = {wishbone.Feature.CTI, wishbone.Feature.BTE} if bursts else set()
+    bus = wishbone.Interface(addr_width = sram.wb_bus.signature.addr_width, data_width = data_width, granularity = 8, features = features)
+    m.submodules.bridge = bridge = Bridge(wiring.flipped(bus), stream_width = stream_width)
+
+    # Stall each bus word for `wait_states` cycles before the SRAM sees it.
+    wait = Signal(range(wait_states + 1))
+    with m.If(sram.wb_bus.ack):
+        m.d.sync += wait.eq(0)
+    with m.Elif(bus.cyc & bus.stb & (wait != wait_states)):
+        m.d.sync += wait.eq(wait + 1)
+
+    m.d.comb += [
+        sram.wb_bus.cyc.eq(bus.cyc),
+        sram.wb_bus.stb.eq(bus.stb & (wait == wait_states)),
+        sram.wb_bus.we.eq(bus.we),
+        sram.wb_bus.adr.eq(bus.adr),
+        sram.wb_bus.sel.eq(bus.sel),
+        sram.wb_bus.dat_w.eq(bus.dat_w),
+        bus.dat_r.eq(sram.wb_bus.dat_r),
+        bus.ack.eq(sram.wb_bus.ack),
+    ]
+
+    sim = Simulator(m)
+    sim.add_clock(1e-6)
+
+    # Bus words acked as part of an incrementing burst, and cycles the bus is held without a bus word.
+    burst_acks = 0
+    held = 0
+
+    @sim.add_process
+    async def monitor(ctx: SimulatorContext):
+        nonlocal burst_acks, held
+        async for _, _, cyc, stb, ack, *cti in ctx.tick().sample(bus.cyc, bus.stb, bus.ack, *([bus.cti] if bursts else [])):
+            if ack and cti == [wishbone.CycleType.INCR_BURST.value]:
+                burst_acks += 1
+            if cyc and not stb:
+                held += 1
+
+    @tb_with_bridge_client(sim, bridge, input_stream_fc = input_gap)
+    async def client_testbench(ctx: SimulatorContext, client):
+        capabilities = await client.get_capabilities()
+        assert capabilities.access_8b and capabilities.access_16b and capabilities.access_32b and capabilities.access_64b
+        assert capabilities.burst_incr and capabilities.no_addr
+        assert capabilities.addr_width == 10
+        assert capabilities.data_width == 8
+
+        memory = wishbone_client.Client(bus_client = client)
+        model = bytearray(1024)
+        rng = random.Random(data_width)
+
+        # Bulk write from an unaligned address, covering every access size.
+        data = bytes(rng.randrange(256) for _ in range(301))
+        await memory.write(0x23, data)
+        model[0x23:0x23 + len(data)] = data
+        assert await memory.read(0x20, 320) == model[0x20:0x20 + 320]
+
+        # Narrow writes only change their own byte lanes.
+        await memory.write(0x41, b'\xaa')
+        await memory.write(0x46, b'\x55\x66')
+        model[0x41] = 0xaa
+        model[0x46:0x48] = b'\x55\x66'
+        assert await memory.read(0x40, 16) == model[0x40:0x50]
+
+        # Single accesses of each size.
+        assert await client.read_8b(0x43) == [model[0x43]]
+        assert await client.read_16b(0x46) == [int.from_bytes(model[0x46:0x48], 'little')]
+        assert await client.read_32b(0x44) == [int.from_bytes(model[0x44:0x48], 'little')]
+        assert await client.read_64b(0x40) == [int.from_bytes(model[0x40:0x48], 'little')]
+
+        # Nonincrementing burst of one word.
+        assert await client.read_32b(0x100, 3, increment = False) == [int.from_bytes(model[0x100:0x104], 'little')] * 3
+
+        if bursts:
+            assert burst_acks > 0
+
+        # Even with a slow link, the bus is released between bus words that aren't issued back to back.
+        assert held == 0
+
+    sim.run()
+
+@pytest.mark.parametrize('access_sizes', [(0, 1, 2, 3), (0, 1, 2), (0, 2)])
+def test_wishbone_client_runs(access_sizes):
+    async def main():
+        transport = MockTransport(access_sizes = access_sizes)
+        client = Client(transport)
+        await client.get_capabilities()
+        memory = wishbone_client.Client(bus_client = client)
+
+        # The aligned middle is a single burst of the widest access, with narrower ones for the head and tail only.
+        widest = max(access_sizes)
+        start, end = (0x23 >> widest) + 1 << widest, 0x151 >> widest << widest
+        runs = list(memory._runs(0x23, 302))
+        assert [run for run in runs if run[0] == widest] == [(widest, start, (end - start) >> widest)]
+        assert all(count == 1 for size, addr, count in runs if size != widest)
+        assert sum(count << size for size, addr, count in runs) == 302
+
+        data = bytes(random.Random(0).randrange(256) for _ in range(302))
+        await memory.write(0x23, data)
+        assert transport.memory[0x23:0x23 + 302] == data
+        assert await memory.read(0x23, 302) == data
+
+    asyncio.run(main())